@@ -1,20 +1,60 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, send_file, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import sqlite3
 import os
-from datetime import datetime, timezone, timedelta
+from datetime import datetime
 import pandas as pd
 from io import BytesIO
+from urllib.parse import quote
 from dotenv import load_dotenv
-try:
-    import psycopg2
-    from urllib.parse import urlparse
-    PSYCOPG2_AVAILABLE = True
-except ImportError:
-    PSYCOPG2_AVAILABLE = False
-    print("⚠️ psycopg2 not available - PostgreSQL support disabled")
 
+import database_manager
+import migrations
+from branch_import import import_branches, read_branch_rows, summarize_report
+from catalog_cache import CATALOG, bump_cache_version, get_catalog
+from catalog_io import build_catalog_xlsx, export_catalog_rows, import_catalog, read_catalog_file
+from entry_materials import (
+    branches_missing_material,
+    material_compliance,
+    save_entry_materials,
+    with_entry_materials
+)
+from entry_filters import (
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    PLAN_FULL_SCAN,
+    PLAN_INDEX_SCAN,
+    PLAN_SEARCH,
+    build_entries_count_query,
+    build_entries_page_query,
+    encode_cursor,
+    explain_entry_filters,
+    facet_entry_count,
+    get_entry_filters,
+    load_entry_facets
+)
+from image_store import (
+    UPLOAD_FOLDER,
+    backfill_entry_images,
+    entry_image_files,
+    remove_unreferenced_files,
+    save_entry_images,
+    save_upload,
+    with_entry_images
+)
+from export_cache import ENTRIES, claim_export
+from export_changes import CHANGE_COLUMNS, CHANGE_FORMATS, change_watermark, iter_change_batches, write_changes_xlsx
+from export_delivery import send_export_file
+from export_stream import STREAM_FORMATS, stream_body, stream_export
+from export_rows import export_column_lengths, export_image_count, iter_export_entries
+from export_jobs import (
+    EXPORT_KINDS,
+    create_export_job,
+    get_export_job,
+    job_status,
+    start_export_job
+)
 from excel_export_enhanced import (
     create_enhanced_excel_with_images,
     create_simple_excel_with_formatting
@@ -48,10 +88,10 @@ def save_image_locally(file, subfolder=""):
         print(f"خطأ في حفظ الصورة: {e}")
         return None
 
-def create_temp_excel_file(data, filename):
+def create_temp_excel_file(data):
     """إنشاء ملف Excel مؤقت"""
     try:
-        temp_path = create_simple_excel_with_formatting(data, filename)
+        temp_path = create_simple_excel_with_formatting(data)
         return temp_path
     except Exception as e:
         print(f"خطأ في إنشاء ملف Excel: {e}")
@@ -73,18 +113,7 @@ load_dotenv()
 
 # إعداد المنطقة الزمنية المحلية - مصر (القاهرة)
 # يتعامل تلقائياً مع التوقيت الشتوي والصيفي
-try:
-    from zoneinfo import ZoneInfo
-    LOCAL_TIMEZONE = ZoneInfo("Africa/Cairo")
-except ImportError:
-    # Fallback for older Python versions
-    try:
-        import pytz
-        LOCAL_TIMEZONE = pytz.timezone("Africa/Cairo")
-    except ImportError:
-        # Final fallback - Egypt winter time (UTC+2)
-        LOCAL_TIMEZONE = timezone(timedelta(hours=2))
-        print("⚠️ Warning: Using fixed UTC+2. Install zoneinfo or pytz for automatic DST handling.")
+from timezone_config import LOCAL_TIMEZONE
 
 def get_local_time():
     """الحصول على الوقت المحلي الحالي (القاهرة) مع التعامل التلقائي مع التوقيت الشتوي/الصيفي"""
@@ -108,7 +137,7 @@ def get_display_name(user_record):
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Ensure upload directory exists
@@ -118,26 +147,16 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 DATABASE_URL = os.getenv('DATABASE_URL')
 IS_PRODUCTION = DATABASE_URL is not None
 
+# Release request-scoped connections when each request finishes
+database_manager.init_app(app)
+
 def get_db_connection():
-    """Get database connection based on environment"""
-    if IS_PRODUCTION and DATABASE_URL and PSYCOPG2_AVAILABLE:
-        # Production: PostgreSQL
-        url = urlparse(DATABASE_URL)
-        conn = psycopg2.connect(
-            host=url.hostname,
-            port=url.port,
-            database=url.path[1:],
-            user=url.username,
-            password=url.password,
-            sslmode='require'
-        )
-        return conn, 'postgresql'
-    else:
-        # Development: SQLite
-        # إنشاء مجلد data إذا لم يكن موجود
-        os.makedirs('/app/data', exist_ok=True)
-        conn = sqlite3.connect('/app/data/database.db')
-        return conn, 'sqlite'
+    """Get database connection based on environment
+
+    Production uses pooled PostgreSQL connections, development a single
+    WAL-mode SQLite connection per request; both are released at teardown.
+    """
+    return database_manager.get_connection()
 
 def execute_query(query, params=None, fetch_one=False, fetch_all=False):
     """Execute query with proper database handling"""
@@ -177,291 +196,54 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False):
     finally:
         conn.close()
 
+def with_entry_details(cursor, db_type, rows):
+    """EXPORT_COLUMNS rows with material lists at 7-8 and image metadata at 9"""
+    return with_entry_images(cursor, db_type, with_entry_materials(cursor, db_type, rows))
+
 def init_db():
-    """Initialize database with persistent data preservation"""
-    conn, db_type = get_db_connection()
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        company_code TEXT NOT NULL,
-        password TEXT NOT NULL,
-        is_admin BOOLEAN DEFAULT FALSE,
-        created_date TEXT DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Add created_date column if it doesn't exist (for existing databases)
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN created_date TEXT')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    # Add full_name column if it doesn't exist (for existing databases)
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN full_name TEXT')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    # Data entries table
-    c.execute('''CREATE TABLE IF NOT EXISTS data_entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_name TEXT NOT NULL,
-        employee_code TEXT NOT NULL,
-        branch TEXT NOT NULL,
-        shop_code TEXT,
-        model TEXT NOT NULL,
-        display_type TEXT NOT NULL,
-        selected_materials TEXT,
-        unselected_materials TEXT,
-        images TEXT,
-        comment TEXT,
-        date TEXT NOT NULL
-    )''')
-    
-    # Add comment column if it doesn't exist (for existing databases)
-    try:
-        c.execute('ALTER TABLE data_entries ADD COLUMN comment TEXT')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    # Branches table for autocomplete
-    c.execute('''CREATE TABLE IF NOT EXISTS branches (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        branch_name TEXT NOT NULL,
-        shop_code TEXT NOT NULL,
-        employee_code TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        UNIQUE(branch_name, employee_code),
-        UNIQUE(shop_code, employee_code)
-    )''')
-    
-    # Categories management table
-    c.execute('''CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category_name TEXT NOT NULL UNIQUE,
-        created_date TEXT NOT NULL
-    )''')
-    
-    # Models management table
-    c.execute('''CREATE TABLE IF NOT EXISTS models (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        model_name TEXT NOT NULL,
-        category_name TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        UNIQUE(model_name, category_name)
-    )''')
-    
-    # Display types management table
-    c.execute('''CREATE TABLE IF NOT EXISTS display_types (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        display_type_name TEXT NOT NULL,
-        category_name TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        UNIQUE(display_type_name, category_name)
-    )''')
-    
-    # POP materials management table
-    c.execute('''CREATE TABLE IF NOT EXISTS pop_materials_db (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        material_name TEXT NOT NULL,
-        model_name TEXT NOT NULL,
-        category_name TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        UNIQUE(material_name, model_name)
-    )''')
-    
-    # User branches management table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_branches (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        branch_name TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
-        UNIQUE(user_id, branch_name)
-    )''')
-    
-    # Model images table for guide images
-    c.execute('''CREATE TABLE IF NOT EXISTS model_images (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        model_name TEXT NOT NULL,
-        category_name TEXT NOT NULL,
-        image_url TEXT NOT NULL,
-        created_date TEXT NOT NULL,
-        UNIQUE(model_name, category_name)
-    )''')
-    
-    # Database initialization status table
-    c.execute('''CREATE TABLE IF NOT EXISTS db_init_status (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        component TEXT NOT NULL UNIQUE,
-        initialized BOOLEAN DEFAULT FALSE,
-        last_update TEXT NOT NULL
-    )''')
-    
-    # Check if this is the first run or if we need to initialize data
-    initialize_system_data(c)
-    
-    conn.commit()
-    conn.close()
+    """Bring the database schema up to date
 
-def initialize_system_data(cursor):
-    """Initialize system data only if not already done"""
-    current_time = get_local_time_string()
-    
-    # Check if admin user exists
-    cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = TRUE')
-    admin_count = cursor.fetchone()[0]
-    
-    if admin_count == 0:
-        print("🔧 Creating admin user...")
-        admin_password = generate_password_hash('admin123')
-        cursor.execute('INSERT INTO users (name, company_code, password, is_admin) VALUES (?, ?, ?, ?)',
-                     ('Admin', 'ADMIN', admin_password, True))
-        
-        # Mark admin as initialized
-        cursor.execute('INSERT OR REPLACE INTO db_init_status (component, initialized, last_update) VALUES (?, ?, ?)',
-                     ('admin_user', True, current_time))
-        print("✅ Admin user created")
-    
-    # Check if default categories are initialized
-    cursor.execute('SELECT initialized FROM db_init_status WHERE component = ?', ('default_categories',))
-    categories_init = cursor.fetchone()
-    
-    if not categories_init or not categories_init[0]:
-        print("🔧 Initializing default categories...")
-        initialize_default_categories(cursor)
-        cursor.execute('INSERT OR REPLACE INTO db_init_status (component, initialized, last_update) VALUES (?, ?, ?)',
-                     ('default_categories', True, current_time))
-        print("✅ Default categories initialized")
-    
-    # Check if default models are initialized
-    cursor.execute('SELECT initialized FROM db_init_status WHERE component = ?', ('default_models',))
-    models_init = cursor.fetchone()
-    
-    if not models_init or not models_init[0]:
-        print("🔧 Initializing default models...")
-        initialize_default_models(cursor)
-        cursor.execute('INSERT OR REPLACE INTO db_init_status (component, initialized, last_update) VALUES (?, ?, ?)',
-                     ('default_models', True, current_time))
-        print("✅ Default models initialized")
-    
-    # Check if default display types are initialized
-    cursor.execute('SELECT initialized FROM db_init_status WHERE component = ?', ('default_display_types',))
-    display_types_init = cursor.fetchone()
-    
-    if not display_types_init or not display_types_init[0]:
-        print("🔧 Initializing default display types...")
-        initialize_default_display_types(cursor)
-        cursor.execute('INSERT OR REPLACE INTO db_init_status (component, initialized, last_update) VALUES (?, ?, ?)',
-                     ('default_display_types', True, current_time))
-        print("✅ Default display types initialized")
-    
-    # Check if default POP materials are initialized
-    cursor.execute('SELECT initialized FROM db_init_status WHERE component = ?', ('default_pop_materials',))
-    pop_materials_init = cursor.fetchone()
-    
-    if not pop_materials_init or not pop_materials_init[0]:
-        print("🔧 Initializing default POP materials...")
-        initialize_default_pop_materials(cursor)
-        cursor.execute('INSERT OR REPLACE INTO db_init_status (component, initialized, last_update) VALUES (?, ?, ?)',
-                     ('default_pop_materials', True, current_time))
-        print("✅ Default POP materials initialized")
-
-def initialize_default_categories(cursor):
-    """Initialize default categories"""
-    current_time = get_local_time_string()
-    
-    categories = ['OLED', 'Neo QLED', 'QLED', 'UHD', 'LTV', 'BESPOKE COMBO', 
-                 'BESPOKE Front', 'Front', 'TL', 'SBS', 'TMF', 'BMF', 'Local TMF']
-    
-    for category in categories:
-        cursor.execute('INSERT OR IGNORE INTO categories (category_name, created_date) VALUES (?, ?)',
-                      (category, current_time))
+    Runs the versioned migrations in ``migrations/``; when the schema is
+    already current this is a single version lookup.
+    """
+    migrations.ensure_schema()
 
-def initialize_default_models(cursor):
-    """Initialize default models"""
-    current_time = get_local_time_string()
-    
-    models_data = {
-        'OLED': ['S95F', 'S90F', 'S85F'],
-        'Neo QLED': ['QN90', 'QN85F', 'QN80F', 'QN70F'],
-        'QLED': ['Q8F', 'Q7F'],
-        'UHD': ['U8000', '100"/98"'],
-        'LTV': ['The Frame'],
-        'BESPOKE COMBO': ['WD25DB8995', 'WD21D6400'],
-        'BESPOKE Front': ['WW11B1944DGB'],
-        'Front': ['WW11B1534D', 'WW90CGC', 'WW4040', 'WW4020'],
-        'TL': ['WA19CG6886', 'Local TL'],
-        'SBS': ['RS70F'],
-        'TMF': ['Bespoke', 'TMF Non-Bespoke', 'TMF'],
-        'BMF': ['(Bespoke, BMF)', '(Non-Bespoke, BMF)'],
-        'Local TMF': ['Local TMF']
-    }
-    
-    for category, models in models_data.items():
-        for model in models:
-            cursor.execute('INSERT OR IGNORE INTO models (model_name, category_name, created_date) VALUES (?, ?, ?)',
-                          (model, category, current_time))
-
-def initialize_default_display_types(cursor):
-    """Initialize default display types"""
-    current_time = get_local_time_string()
-    
-    display_types_data = {
-        'OLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
-        'Neo QLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
-        'QLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
-        'UHD': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
-        'LTV': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
-        'BESPOKE COMBO': ['POP Out', 'POP Inner', 'POP'],
-        'BESPOKE Front': ['POP Out', 'POP Inner', 'POP'],
-        'Front': ['POP Out', 'POP Inner', 'POP'],
-        'TL': ['POP Out', 'POP Inner', 'POP'],
-        'SBS': ['POP Out', 'POP Inner', 'POP'],
-        'TMF': ['POP Out', 'POP Inner', 'POP'],
-        'BMF': ['POP Out', 'POP Inner', 'POP'],
-        'Local TMF': ['POP Out', 'POP Inner', 'POP']
-    }
-    
-    for category, display_types in display_types_data.items():
-        for display_type in display_types:
-            cursor.execute('INSERT OR IGNORE INTO display_types (display_type_name, category_name, created_date) VALUES (?, ?, ?)',
-                          (display_type, category, current_time))
-
-def initialize_default_pop_materials(cursor):
-    """Initialize default POP materials by model"""
-    current_time = get_local_time_string()
-    
-    # Get existing models
-    cursor.execute('SELECT model_name, category_name FROM models')
-    models = cursor.fetchall()
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Verify with EXPLAIN that every dashboard/export filter uses an index"""
+    conn, db_type = get_db_connection()
+    results = explain_entry_filters(conn, db_type)
+    conn.close()
     
-    # Default materials by model
-    model_materials = {
-        # OLED Models
-        'S95F': ['S95F Premium Topper', 'S95F Gaming Features', 'S95F Design POP', 'Anti-Glare Technology', 'AI topper'],
-        'S90F': ['S90F Smart Features', 'S90F Connectivity POP', 'S90F Performance Card', 'AI topper'],
-        'S85F': ['S85F Essential Features', 'S85F Value POP', 'S85F Specs Display', 'AI topper'],
-        
-        # Neo QLED Models
-        'QN90': ['QN90 Neo Quantum', 'QN90 Gaming Hub', 'QN90 Premium Features', 'Neo Quantum Processor 4K', 'AI topper'],
-        'QN85F': ['QN85F Neo Features', 'QN85F Smart Hub', 'QN85F Performance POP', 'AI topper'],
-        'QN80F': ['QN80F Neo Display', 'QN80F Features Card', 'QN80F Value POP', 'AI topper'],
-        'QN70F': ['QN70F Essential Neo', 'QN70F Basic Features', 'QN70F Entry POP', 'AI topper'],
-        
-        # Add more models as needed...
-    }
+    counts = {PLAN_SEARCH: 0, PLAN_INDEX_SCAN: 0, PLAN_FULL_SCAN: 0}
+    for keys, result, plan in results:
+        counts[result] += 1
+        label = ', '.join(keys) if keys else '(no filters)'
+        if result == PLAN_SEARCH:
+            print(f"✅ {label}")
+        elif result == PLAN_INDEX_SCAN:
+            # بدون LIMIT يقرأ كل الصفوف، لكن بترتيب الفهرس
+            print(f"⚠️ {label} (full index scan)")
+        else:
+            print(f"❌ {label}")
+            print('   ' + plan.replace('\n', '\n   '))
     
-    for model_name, category_name in models:
-        # Get materials for this model or use default
-        materials = model_materials.get(model_name, [f'{model_name} Standard POP', f'{model_name} Features', 'AI topper'])
-        
-        for material in materials:
-            cursor.execute('INSERT OR IGNORE INTO pop_materials_db (material_name, model_name, category_name, created_date) VALUES (?, ?, ?, ?)',
-                          (material, model_name, category_name, current_time))
+    print(f"📊 {counts[PLAN_SEARCH]}/{len(results)} filter combinations search an index, "
+          f"{counts[PLAN_INDEX_SCAN]} scan a whole index, {counts[PLAN_FULL_SCAN]} scan a table")
+    if counts[PLAN_FULL_SCAN]:
+        raise SystemExit(1)
 
+@app.cli.command('backfill-images')
+def backfill_images_command():
+    """Describe and thumbnail the entry images copied by migration 0010 without metadata"""
+    conn, db_type = get_db_connection()
+    try:
+        described = 0
+        for described in backfill_entry_images(conn, db_type):
+            print(f"🖼️ {described} images described")
+    finally:
+        conn.close()
+    print(f"✅ Backfill complete ({described} images); data_entries.images is no longer needed")
 
 
 @app.route('/')
@@ -527,45 +309,75 @@ def data_entry():
 
 @app.route('/get_dynamic_data/<data_type>')
 def get_dynamic_data(data_type):
-    """Get dynamic data from database for frontend"""
+    """Get dynamic data from the catalog cache for frontend"""
     try:
         conn, db_type = get_db_connection()
-        c = conn.cursor()
+        catalog = get_catalog(conn.cursor(), db_type)
+        conn.close()
         
         if data_type == 'categories':
-            c.execute('SELECT category_name FROM categories ORDER BY category_name')
-            data = [row[0] for row in c.fetchall()]
+            data = [row[1] for row in catalog['categories']]
         
         elif data_type == 'models':
             category = request.args.get('category', '')
             if category:
-                c.execute('SELECT model_name FROM models WHERE category_name = ? ORDER BY model_name', (category,))
+                data = [row[1] for row in catalog['models'] if row[2] == category]
             else:
-                c.execute('SELECT model_name, category_name FROM models ORDER BY category_name, model_name')
-            data = c.fetchall()
+                data = [(row[1], row[2]) for row in catalog['models']]
         
         elif data_type == 'display_types':
             category = request.args.get('category', '')
             if category:
-                c.execute('SELECT display_type_name FROM display_types WHERE category_name = ? ORDER BY display_type_name', (category,))
-                data = [row[0] for row in c.fetchall()]
+                data = [row[1] for row in catalog['display_types'] if row[2] == category]
             else:
                 data = []
         
         elif data_type == 'pop_materials':
             model = request.args.get('model', '')
-            if model:
-                c.execute('SELECT material_name FROM pop_materials_db WHERE model_name = ? ORDER BY material_name', (model,))
-                data = [row[0] for row in c.fetchall()]
-            else:
-                data = []
+            category = request.args.get('category', '')
+            model_id = catalog['model_ids'].get((category, model))
+            data = catalog['materials_by_model'].get(model_id, [])
+        
+        else:
+            data = []
+        
+        return catalog_response({'success': True, 'data': data}, catalog)
         
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/catalog')
+def api_catalog():
+    """Whole catalog tree for the data entry form in one cacheable payload"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    try:
+        conn, db_type = get_db_connection()
+        catalog = get_catalog(conn.cursor(), db_type)
         conn.close()
-        return jsonify({'success': True, 'data': data})
+        
+        response = app.response_class(mimetype='application/json')
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.set_data(catalog['bundle_gzip'])
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(catalog['bundle'])
+        response.vary.add('Accept-Encoding')
+        response.set_etag(catalog['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def catalog_response(payload, catalog):
+    """JSON response validated by the catalog version (304 when unchanged)"""
+    response = jsonify(payload)
+    response.set_etag(catalog['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/get_branches', methods=['GET'])
 def get_branches():
     if 'user_id' not in session or session.get('is_admin'):
@@ -654,186 +466,148 @@ def submit_data():
         for key, value in request.form.items():
             print(f"   {key}: {value}")
         
-        # Process multiple model entries
-        entries_saved = 0
+        # Collect every valid model entry before touching the database
+        model_entries = []
         model_index = 0
         
         while f'branch_{model_index}' in request.form:
-            try:
-                branch = request.form.get(f'branch_{model_index}')
-                shop_code = request.form.get(f'shop_code_{model_index}')
-                category = request.form.get(f'category_{model_index}')
-                model = request.form.get(f'model_{model_index}')
-                display_type = request.form.get(f'display_type_{model_index}')
-                comment = request.form.get(f'comment_{model_index}', '')
-                
-                print(f"🔍 Processing model {model_index}:")
-                print(f"   Branch: '{branch}'")
-                print(f"   Shop Code: '{shop_code}'")
-                print(f"   Category: '{category}'")
-                print(f"   Model: '{model}'")
-                print(f"   Display Type: '{display_type}'")
-                print(f"   Comment: '{comment}'")
-                
-                # Validate required fields
-                missing_fields = []
-                if not branch: missing_fields.append('branch')
-                if not shop_code: missing_fields.append('shop_code')
-                if not category: missing_fields.append('category')
-                if not model: missing_fields.append('model')
-                if not display_type: missing_fields.append('display_type')
-                
-                if missing_fields:
-                    print(f"❌ Missing required fields for model {model_index}: {missing_fields}")
-                    model_index += 1
-                    continue
-                
-                # Save branch if it's new
-                if branch and shop_code:
-                    conn, db_type = get_db_connection()
-                    c = conn.cursor()
-                    try:
-                        c.execute('''INSERT OR IGNORE INTO branches 
-                                    (branch_name, shop_code, employee_code, created_date) 
-                                    VALUES (?, ?, ?, ?)''',
-                                 (branch, shop_code, employee_code, get_local_time_string()))
-                        conn.commit()
-                    except:
-                        pass  # Branch already exists, ignore
-                    conn.close()
-                
-                # Get selected POP materials
-                selected_materials = request.form.getlist(f'pop_materials_{model_index}')
+            branch = request.form.get(f'branch_{model_index}')
+            shop_code = request.form.get(f'shop_code_{model_index}')
+            category = request.form.get(f'category_{model_index}')
+            model = request.form.get(f'model_{model_index}')
+            display_type = request.form.get(f'display_type_{model_index}')
+            comment = request.form.get(f'comment_{model_index}', '')
             
-                # Define all possible materials by category
-                pop_materials_by_category = {
-                'OLED': [
-                    'AI topper', 'Oled Topper', 'Glare Free', 'New Topper', '165 HZ Side POP',
-                    'Category POP', 'Samsung OLED Topper', '165 HZ & joy stick indicator',
-                    'AI Topper Gaming', 'Side POP', 'Specs Card', 'OLED Topper', 'Why Oled side POP'
-                ],
-                'Neo QLED': [
-                    'AI topper', 'Lockup Topper', 'Screen POP', 'New Topper', 'Glare Free', 'Specs Card'
-                ],
-                'QLED': [
-                    'AI topper', 'Samsung QLED Topper', 'Screen POP', 'New Topper', 'Specs Card', 'QLED Topper'
-                ],
-                'UHD': [
-                    'UHD topper', 'Samsung UHD topper', 'Screen POP', 'New Topper', 'Specs Card',
-                    'AI topper', 'Samsung Lockup Topper', 'Inch Logo side POP'
-                ],
-                'LTV': [
-                    'Side POP', 'Matte Display', 'Category POP', 'Frame Bezel'
-                ],
-                'BESPOKE COMBO': [
-                    'PODs (Door)', 'POD (Top)', 'POD (Front)', '3 PODs (Top)', 'AI Home POP',
-                    'AI Home', 'AI control panel', 'Capacity (Kg)', 'Capacity Dryer', 'Filter',
-                    'Ecobuble POP', 'Ecco Buble', 'AI Ecco Buble', '20 Years Warranty',
-                    'New Arrival', 'Samsung Brand/Tech Topper'
-                ],
-                'BESPOKE Front': [
-                    'PODs (Door)', 'POD (Top)', 'POD (Front)', '3 PODs (Top)', 'AI Home POP',
-                    'AI Home', 'AI control panel', 'Capacity (Kg)', 'Capacity Dryer', 'Filter',
-                    'Ecobuble POP', 'Ecco Buble', 'AI Ecco Buble', '20 Years Warranty',
-                    'New Arrival', 'Samsung Brand/Tech Topper'
-                ],
-                'Front': [
-                    'PODs (Door)', 'POD (Top)', 'POD (Front)', '3 PODs (Top)', 'AI Home POP',
-                    'AI Home', 'AI control panel', 'Capacity (Kg)', 'Capacity Dryer', 'Filter',
-                    'Ecobuble POP', 'Ecco Buble', 'AI Ecco Buble', '20 Years Warranty',
-                    'New Arrival', 'Samsung Brand/Tech Topper'
-                ],
-                'TL': [
-                    'PODs (Door)', 'POD (Top)', 'POD (Front)', '3 PODs (Top)', 'AI Home POP',
-                    'AI Home', 'AI control panel', 'Capacity (Kg)', 'Capacity Dryer', 'Filter',
-                    'Ecobuble POP', 'Ecco Buble', 'AI Ecco Buble', '20 Years Warranty',
-                    'New Arrival', 'Samsung Brand/Tech Topper'
-                ],
-                'SBS': [
-                    'Samsung Brand/Tech Topper', 'Main POD', '20 Years Warranty', 'Twin Cooling Plus™',
-                    'Smart Conversion™', 'Digital Inverter™', 'SpaceMax™', 'Tempered Glass',
-                    'Power Freeze', 'Big Vegetable Box', 'Organize Big Bin'
-                ],
-                'TMF': [
-                    'Samsung Brand/Tech Topper', '20 Years Warranty', 'Key features POP', 'Side POP',
-                    'Global No.1', 'Freshness POP', 'Bacteria Safe Ionizer POP', 'Gallon Guard POP',
-                    'Big Vegetables Box POP', 'Adjustable Pin & Organize POP', 'Optimal Fresh',
-                    'Tempered Glass', 'Gallon Guard', 'Veg Box', 'Internal Display', 'Multi Tray',
-                    'Foldable Shelf', 'Active Fresh Filter'
-                ],
-                'BMF': [
-                    'Samsung Brand/Tech Topper', '20 Years Warranty', 'Key features POP', 'Side POP',
-                    'Global No.1', 'Led Lighting POP', 'Full Open Box POP', 'Big Guard POP',
-                    'Adjustable Pin', 'Saves Energy POP', 'Gentle Lighting', 'Multi Tray',
-                    'All-Around Cooling', '2 Step Foldable Shelf', 'Big Fresh Box'
-                ],
-                'Local TMF': [
-                    'Samsung Brand/Tech Topper', 'Key features POP', 'Side POP', 'Big Vegetables Box POP'
-                ]
-                }
-                
-                # Get all materials for the selected model from database
-                conn_materials, db_type_materials = get_db_connection()
-                c_materials = conn_materials.cursor()
-                c_materials.execute('SELECT material_name FROM pop_materials_db WHERE model_name = ?', (model,))
-                model_materials = [row[0] for row in c_materials.fetchall()]
-                conn_materials.close()
-                
-                # Calculate unselected materials based on model-specific materials
-                unselected_materials = [mat for mat in model_materials if mat not in selected_materials]
+            print(f"🔍 Processing model {model_index}:")
+            print(f"   Branch: '{branch}'")
+            print(f"   Shop Code: '{shop_code}'")
+            print(f"   Category: '{category}'")
+            print(f"   Model: '{model}'")
+            print(f"   Display Type: '{display_type}'")
+            print(f"   Comment: '{comment}'")
             
-                # Handle image uploads
-                uploaded_images = []
-                if f'images_{model_index}' in request.files:
-                    files = request.files.getlist(f'images_{model_index}')
-                    for file in files:
-                        if file and file.filename:
-                            # حفظ محلي فقط
-                            filename = secure_filename(file.filename)
-                            timestamp = get_local_time().strftime('%Y%m%d_%H%M%S_')
-                            filename = timestamp + filename
-                            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                            try:
-                                file.save(file_path)
-                                uploaded_images.append(filename)
-                            except Exception as e:
-                                flash(f'خطأ في حفظ الصورة: {str(e)}', 'error')
-                
-                # Save to database
-                conn, db_type = get_db_connection()
-                c = conn.cursor()
-                c.execute('''INSERT INTO data_entries 
-                            (employee_name, employee_code, branch, shop_code, model, display_type, 
-                             selected_materials, unselected_materials, images, comment, date)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                         (employee_name, employee_code, branch, shop_code, f"{category} - {model}", 
-                          display_type, ','.join(selected_materials), 
-                          ','.join(unselected_materials), ','.join(uploaded_images), comment,
-                          get_local_time_string()))
-                
-                conn.commit()
-                conn.close()
-                
-                print(f"✅ Successfully saved model {model_index}: {category} - {model}")
-                entries_saved += 1
-                
-            except Exception as model_error:
-                print(f"❌ Error saving model {model_index}: {str(model_error)}")
-                # Continue with next model instead of failing completely
-                
+            # Validate required fields
+            missing_fields = []
+            if not branch: missing_fields.append('branch')
+            if not shop_code: missing_fields.append('shop_code')
+            if not category: missing_fields.append('category')
+            if not model: missing_fields.append('model')
+            if not display_type: missing_fields.append('display_type')
+            
+            if missing_fields:
+                print(f"❌ Missing required fields for model {model_index}: {missing_fields}")
+                model_index += 1
+                continue
+            
+            # Handle image uploads
+            uploaded_images = []
+            if f'images_{model_index}' in request.files:
+                files = request.files.getlist(f'images_{model_index}')
+                for file in files:
+                    if file and file.filename:
+                        # حفظ محلي فقط
+                        filename = secure_filename(file.filename)
+                        timestamp = get_local_time().strftime('%Y%m%d_%H%M%S_')
+                        filename = timestamp + filename
+                        try:
+                            # الأبعاد والبصمة والصورة المصغرة تحسب مرة واحدة عند الرفع
+                            uploaded_images.append(save_upload(file, filename, app.config['UPLOAD_FOLDER']))
+                        except Exception as e:
+                            flash(f'خطأ في حفظ الصورة: {str(e)}', 'error')
+            
+            model_entries.append({
+                'branch': branch,
+                'shop_code': shop_code,
+                'category': category,
+                'model': model,
+                'display_type': display_type,
+                'comment': comment,
+                'selected_materials': request.form.getlist(f'pop_materials_{model_index}'),
+                'images': uploaded_images
+            })
             model_index += 1
         
-        if entries_saved > 0:
-            return jsonify({
-                'success': True, 
-                'message': f'{entries_saved} model entries saved successfully!'
-            })
-        else:
+        if not model_entries:
             return jsonify({
                 'success': False, 
                 'message': 'No valid model entries found to save. Please check your form data.'
             }), 400
         
+        # Save the whole submission as one unit of work
+        conn, db_type = get_db_connection()
+        c = conn.cursor()
+        try:
+            submitted_at = get_local_time()
+            current_time = submitted_at.strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Save new branches
+            branch_rows = list(dict.fromkeys(
+                (entry['branch'], entry['shop_code'], employee_code, current_time)
+                for entry in model_entries
+            ))
+            insert_branch = database_manager.insert_or_ignore(
+                db_type, 'branches', ('branch_name', 'shop_code', 'employee_code', 'created_date'))
+            c.executemany(database_manager.adapt_query(insert_branch, db_type), branch_rows)
+            
+            # Catalog ids and materials of every model come from the catalog cache
+            catalog = get_catalog(c, db_type)
+            materials_by_model = catalog['materials_by_model']
+            
+            entry_ts = int(submitted_at.timestamp())
+            entry_columns = '''(employee_name, employee_code, branch, shop_code, model, display_type, 
+                               model_id, display_type_id, comment, date, entry_ts)'''
+            entry_rows = [(
+                employee_name, employee_code, entry['branch'], entry['shop_code'],
+                f"{entry['category']} - {entry['model']}", entry['display_type'],
+                catalog['model_ids'].get((entry['category'], entry['model'])),
+                catalog['display_type_ids'].get((entry['category'], entry['display_type'])),
+                entry['comment'], current_time, entry_ts
+            ) for entry in model_entries]
+            
+            # كل الإدخالات في جملة واحدة
+            if db_type == 'postgresql':
+                row_placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'] * len(entry_rows))
+                c.execute(database_manager.adapt_query(
+                              f'INSERT INTO data_entries {entry_columns} VALUES {row_placeholders} RETURNING id', db_type),
+                          [value for row in entry_rows for value in row])
+                entry_ids = [row[0] for row in c.fetchall()]
+            else:
+                # كاتب واحد داخل المعاملة: الأرقام متتالية وتنتهي عند last_insert_rowid()
+                c.executemany(database_manager.adapt_query(
+                                  f'INSERT INTO data_entries {entry_columns} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', db_type),
+                              entry_rows)
+                c.execute('SELECT last_insert_rowid()')
+                last_id = c.fetchone()[0]
+                entry_ids = list(range(last_id - len(entry_rows) + 1, last_id + 1))
+            
+            checklists = []
+            for entry, entry_id in zip(model_entries, entry_ids):
+                save_entry_images(c, db_type, entry_id, entry['images'])
+                
+                selected_materials = entry['selected_materials']
+                # Calculate unselected materials based on model-specific materials
+                model_materials = materials_by_model.get(
+                    catalog['model_ids'].get((entry['category'], entry['model'])), [])
+                unselected_materials = [mat for mat in model_materials if mat not in selected_materials]
+                checklists.append((entry_id, selected_materials, unselected_materials))
+            
+            # قائمة المواد لكل إدخال في entry_materials
+            save_entry_materials(c, db_type, checklists)
+            bump_cache_version(c, db_type, ENTRIES)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        entries_saved = len(checklists)
+        print(f"✅ Successfully saved {entries_saved} model entries in one transaction")
+        return jsonify({
+            'success': True, 
+            'message': f'{entries_saved} model entries saved successfully!'
+        })
+        
     except Exception as e:
         print(f"❌ Critical error in submit_data: {str(e)}")
         return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
@@ -843,148 +617,160 @@ def admin_dashboard():
     if 'user_id' not in session or not session.get('is_admin'):
         return redirect(url_for('index'))
     
-    # Get filter parameters
-    employee_filter = request.args.get('employee', '')
-    branch_filter = request.args.get('branch', '')
-    model_filter = request.args.get('model', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-    
-    # Build query
-    query = 'SELECT * FROM data_entries WHERE 1=1'
-    params = []
-    
-    if employee_filter:
-        query += ' AND employee_name LIKE ?'
-        params.append(f'%{employee_filter}%')
-    
-    if branch_filter:
-        query += ' AND branch LIKE ?'
-        params.append(f'%{branch_filter}%')
+    # الجدول يحمل الإدخالات صفحة بصفحة من /api/entries
+    filters = get_entry_filters(request.args)
     
-    if model_filter:
-        query += ' AND model LIKE ?'
-        params.append(f'%{model_filter}%')
-    
-    if date_from:
-        query += ' AND date >= ?'
-        params.append(date_from)
-    
-    if date_to:
-        query += ' AND date <= ?'
-        params.append(date_to + ' 23:59:59')
-    
-    query += ' ORDER BY date DESC'
-    
-    # Execute query
     conn, db_type = get_db_connection()
     c = conn.cursor()
-    c.execute(query, params)
-    data_entries = c.fetchall()
-    
-    # Get unique values for filters
-    c.execute('SELECT DISTINCT employee_name FROM data_entries ORDER BY employee_name')
-    employees = [row[0] for row in c.fetchall()]
-    
-    c.execute('SELECT DISTINCT branch FROM data_entries ORDER BY branch')
-    branches = [row[0] for row in c.fetchall()]
     
-    c.execute('SELECT DISTINCT model FROM data_entries ORDER BY model')
-    models = [row[0] for row in c.fetchall()]
+    # Filter options with entry counts
+    facets = load_entry_facets(c)
+    employees = facets['employee']
+    branches = facets['branch']
+    models = facets['model']
     
     conn.close()
     
     return render_template('admin_dashboard.html', 
-                         data_entries=data_entries,
                          employees=employees,
                          branches=branches,
                          models=models,
-                         filters={
-                             'employee': employee_filter,
-                             'branch': branch_filter,
-                             'model': model_filter,
-                             'date_from': date_from,
-                             'date_to': date_to
-                         })
+                         filters=filters,
+                         page_size=PAGE_SIZE)
 
-@app.route('/export_excel')
-def export_excel():
-    """تصدير Excel محسن مع الصور والتنسيق"""
+@app.route('/api/entries')
+def api_entries():
+    """One keyset page of data entries for the admin dashboard table"""
     if 'user_id' not in session or not session.get('is_admin'):
-        return redirect(url_for('index'))
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
+    filters = get_entry_filters(request.args)
+    cursor = request.args.get('cursor', '').strip()
     try:
-        # الحصول على معاملات الفلترة من الطلب
-        employee_filter = request.args.get('employee', '')
-        branch_filter = request.args.get('branch', '')
-        model_filter = request.args.get('model', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
-        # بناء الاستعلام مع الفلاتر (نفس منطق admin_dashboard)
-        query = '''SELECT id, employee_name, employee_code, branch, shop_code, model, 
-                          display_type, selected_materials, unselected_materials, images, date, comment 
-                   FROM data_entries WHERE 1=1'''
-        params = []
-        
-        if employee_filter:
-            query += ' AND employee_name LIKE ?'
-            params.append(f'%{employee_filter}%')
-        
-        if branch_filter:
-            query += ' AND branch LIKE ?'
-            params.append(f'%{branch_filter}%')
-        
-        if model_filter:
-            query += ' AND model LIKE ?'
-            params.append(f'%{model_filter}%')
-        
-        if date_from:
-            query += ' AND date >= ?'
-            params.append(date_from)
-        
-        if date_to:
-            query += ' AND date <= ?'
-            params.append(date_to + ' 23:59:59')
-        
-        query += ' ORDER BY date DESC'
+        limit = min(max(int(request.args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid limit'}), 400
+    
+    conn, db_type = get_db_connection()
+    try:
+        # صف إضافي لمعرفة وجود صفحة تالية دون COUNT
+        query, params = build_entries_page_query(filters, db_type, cursor=cursor, limit=limit + 1)
+    except ValueError:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    
+    try:
+        c = conn.cursor()
+        c.execute(database_manager.adapt_query(query, db_type), params)
+        rows = c.fetchall()
+        
+        # العدد الكلي مع الصفحة الأولى فقط، ومن entry_facets فقط (بدون COUNT)؛
+        # للفلاتر الأخرى يطلبه المتصفح من /api/entries/count بعد عرض الصفحة
+        total = None
+        if not cursor:
+            total = facet_entry_count(c, db_type, filters)
+        
+        has_more = len(rows) > limit
+        rows = with_entry_details(c, db_type, rows[:limit])
+        entries = [{
+            'id': row[0],
+            'employee_name': row[1],
+            'employee_code': row[2],
+            'branch': row[3],
+            'shop_code': row[4],
+            'model': row[5],
+            'display_type': row[6],
+            'selected_materials': row[7],
+            'unselected_materials': row[8],
+            'images': [{key: image[key] for key in ('filename', 'thumbnail', 'width', 'height', 'is_valid')}
+                       for image in row[9]],
+            'date': row[10],
+            'comment': row[11] or ''
+        } for row in rows]
+        
+        next_cursor = encode_cursor(rows[-1][12], rows[-1][0]) if has_more else None
+        return jsonify({'success': True, 'entries': entries, 'next_cursor': next_cursor, 'total': total})
+    
+    except Exception as e:
+        print(f"❌ Error loading entries page: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/entries/count')
+def api_entries_count():
+    """Exact number of filtered entries (COUNT over the matching rows, requested separately)"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    filters = get_entry_filters(request.args)
+    conn, db_type = get_db_connection()
+    try:
+        c = conn.cursor()
+        total = facet_entry_count(c, db_type, filters)
+        if total is None:
+            count_query, count_params = build_entries_count_query(filters, db_type)
+            c.execute(database_manager.adapt_query(count_query, db_type), count_params)
+            total = c.fetchone()[0]
+        return jsonify({'success': True, 'total': total})
+    except Exception as e:
+        print(f"❌ Error counting entries: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/material_compliance')
+def api_material_compliance():
+    """Present/missing counts per material, or branches missing one material"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    try:
+        filters = get_entry_filters(request.args)
+        material = request.args.get('material', '').strip()
         
-        # تنفيذ الاستعلام
         conn, db_type = get_db_connection()
         c = conn.cursor()
-        c.execute(query, params)
-        entries = c.fetchall()
+        if material:
+            data = branches_missing_material(c, db_type, material, filters)
+        else:
+            data = material_compliance(c, db_type, filters)
         conn.close()
         
-        if not entries:
-            flash('لا توجد بيانات للتصدير مع الفلاتر المحددة')
-            return redirect(url_for('admin_dashboard'))
+        return jsonify({'success': True, 'data': data})
         
-        # إضافة رسالة توضيحية عن عدد السجلات
-        flash(f'جاري تصدير {len(entries)} سجل مع الفلاتر المطبقة')
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/export_excel')
+def export_excel():
+    """تصدير Excel محسن مع الصور والتنسيق"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for('index'))
+    
+    try:
+        # بناء الاستعلام مع الفلاتر (نفس منطق admin_dashboard)
+        filters = get_entry_filters(request.args)
         
         # تصدير محسن مع الصور (محلي فقط)
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f'pop_materials_report_enhanced_{timestamp}.xlsx'
             
-            temp_path = create_enhanced_excel_with_images(entries, filename)
+            # يبنى مرة واحدة لكل فلاتر وإصدار بيانات (كاش التصدير)
+            conn, db_type = get_db_connection()
+            try:
+                path = cached_export_file(conn.cursor(), db_type, 'enhanced', filters,
+                                          image_url_for=image_link_builder())
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for('admin_dashboard'))
+            finally:
+                conn.close()
             
-            if temp_path and os.path.exists(temp_path):
-                # قراءة الملف وإرساله
-                with open(temp_path, 'rb') as f:
-                    file_data = f.read()
-                
-                # حذف الملف المؤقت
-                cleanup_temp_file(temp_path)
-                
+            if path:
                 flash('تم إنشاء التقرير المحسن بنجاح!')
-                return send_file(
-                    BytesIO(file_data),
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name=filename
-                )
+                return send_export_file(path, filename)
             else:
                 flash('خطأ في إنشاء التقرير المحسن')
                 return redirect(url_for('export_excel_simple'))
@@ -1004,79 +790,30 @@ def export_excel_simple():
         return redirect(url_for('index'))
     
     try:
-        # الحصول على معاملات الفلترة من الطلب
-        employee_filter = request.args.get('employee', '')
-        branch_filter = request.args.get('branch', '')
-        model_filter = request.args.get('model', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
         # بناء الاستعلام مع الفلاتر (نفس منطق admin_dashboard)
-        query = '''SELECT id, employee_name, employee_code, branch, shop_code, model, 
-                          display_type, selected_materials, unselected_materials, images, date, comment 
-                   FROM data_entries WHERE 1=1'''
-        params = []
-        
-        if employee_filter:
-            query += ' AND employee_name LIKE ?'
-            params.append(f'%{employee_filter}%')
-        
-        if branch_filter:
-            query += ' AND branch LIKE ?'
-            params.append(f'%{branch_filter}%')
-        
-        if model_filter:
-            query += ' AND model LIKE ?'
-            params.append(f'%{model_filter}%')
-        
-        if date_from:
-            query += ' AND date >= ?'
-            params.append(date_from)
-        
-        if date_to:
-            query += ' AND date <= ?'
-            params.append(date_to + ' 23:59:59')
-        
-        query += ' ORDER BY date DESC'
-        
-        # تنفيذ الاستعلام
-        conn, db_type = get_db_connection()
-        c = conn.cursor()
-        c.execute(query, params)
-        entries = c.fetchall()
-        conn.close()
-        
-        if not entries:
-            flash('لا توجد بيانات للتصدير مع الفلاتر المحددة')
-            return redirect(url_for('admin_dashboard'))
-        
-        # إضافة رسالة توضيحية عن عدد السجلات
-        flash(f'جاري تصدير {len(entries)} سجل (بسيط) مع الفلاتر المطبقة')
+        filters = get_entry_filters(request.args)
         
         # إنشاء اسم الملف
         timestamp = get_local_time().strftime('%Y%m%d_%H%M%S')
         filename = f'pop_materials_simple_{timestamp}.xlsx'
         
-        # إنشاء ملف Excel مع تنسيق
-        temp_path = create_simple_excel_with_formatting(entries, filename)
+        # يبنى مرة واحدة لكل فلاتر وإصدار بيانات (كاش التصدير)
+        conn, db_type = get_db_connection()
+        try:
+            path = cached_export_file(conn.cursor(), db_type, 'simple', filters)
+        except ValueError as e:
+            flash(str(e))
+            return redirect(url_for('admin_dashboard'))
+        finally:
+            conn.close()
         
-        if not temp_path:
+        if not path:
             flash('خطأ في إنشاء ملف Excel')
             return redirect(url_for('admin_dashboard'))
         
-        # إرسال الملف مباشرة (محلي فقط)
-        with open(temp_path, 'rb') as f:
-            file_data = f.read()
-        
-        cleanup_temp_file(temp_path)
-        
+        # إرسال الملف من القرص مباشرة
         flash('تم إنشاء التقرير بنجاح')
-        return send_file(
-            BytesIO(file_data),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return send_export_file(path, filename)
     
     except Exception as e:
         flash(f'خطأ في تصدير البيانات: {str(e)}')
@@ -1111,48 +848,115 @@ def get_management_data(data_type):
         conn, db_type = get_db_connection()
         c = conn.cursor()
         
+        catalog = get_catalog(c, db_type)
+        conn.close()
+        
         if data_type == 'categories':
-            c.execute('SELECT * FROM categories ORDER BY category_name')
-            data = [{'id': row[0], 'name': row[1], 'created_date': row[2]} for row in c.fetchall()]
+            data = [{'id': row[0], 'name': row[1], 'created_date': row[2]} for row in catalog['categories']]
         
         elif data_type == 'models':
             category = request.args.get('category', '')
-            if category:
-                c.execute('SELECT * FROM models WHERE category_name = ? ORDER BY model_name', (category,))
-            else:
-                c.execute('SELECT * FROM models ORDER BY category_name, model_name')
-            data = [{'id': row[0], 'name': row[1], 'category': row[2], 'created_date': row[3]} for row in c.fetchall()]
+            rows = [row for row in catalog['models'] if not category or row[2] == category]
+            data = [{'id': row[0], 'name': row[1], 'category': row[2], 'created_date': row[3]} for row in rows]
         
         elif data_type == 'display_types':
             category = request.args.get('category', '')
-            if category:
-                c.execute('SELECT * FROM display_types WHERE category_name = ? ORDER BY display_type_name', (category,))
-            else:
-                c.execute('SELECT * FROM display_types ORDER BY category_name, display_type_name')
-            data = [{'id': row[0], 'name': row[1], 'category': row[2], 'created_date': row[3]} for row in c.fetchall()]
+            rows = [row for row in catalog['display_types'] if not category or row[2] == category]
+            data = [{'id': row[0], 'name': row[1], 'category': row[2], 'created_date': row[3]} for row in rows]
         
         elif data_type == 'pop_materials':
             model = request.args.get('model', '')
             category = request.args.get('category', '')
+            rows = catalog['pop_materials']
             if model:
-                c.execute('SELECT * FROM pop_materials_db WHERE model_name = ? ORDER BY material_name', (model,))
-                data = [{'id': row[0], 'name': row[1], 'model': row[2], 'category': row[3], 'created_date': row[4]} for row in c.fetchall()]
+                rows = sorted((row for row in rows if row[2] == model), key=lambda row: row[1])
             elif category:
-                c.execute('SELECT * FROM pop_materials_db WHERE category_name = ? ORDER BY model_name, material_name', (category,))
-                data = [{'id': row[0], 'name': row[1], 'model': row[2], 'category': row[3], 'created_date': row[4]} for row in c.fetchall()]
-            else:
-                c.execute('SELECT * FROM pop_materials_db ORDER BY category_name, model_name, material_name')
-                data = [{'id': row[0], 'name': row[1], 'model': row[2], 'category': row[3], 'created_date': row[4]} for row in c.fetchall()]
+                rows = sorted((row for row in rows if row[3] == category), key=lambda row: (row[2], row[1]))
+            data = [{'id': row[0], 'name': row[1], 'model': row[2], 'category': row[3], 'created_date': row[4]} for row in rows]
         
         else:
             return jsonify({'success': False, 'message': 'Invalid data type'}), 400
         
+        return catalog_response({'success': True, 'data': data}, catalog)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/export_catalog')
+def export_catalog():
+    """Download the whole catalog as XLSX (default) or JSON, in the import format"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    try:
+        conn, db_type = get_db_connection()
+        catalog = get_catalog(conn.cursor(), db_type)
         conn.close()
-        return jsonify({'success': True, 'data': data})
+        
+        timestamp = get_local_time().strftime('%Y%m%d_%H%M%S')
+        filename = f'pop_catalog_{timestamp}'
+        if request.args.get('format') == 'json':
+            response = jsonify(export_catalog_rows(catalog))
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}.json'
+            return response
+        
+        return send_file(
+            BytesIO(build_catalog_xlsx(catalog)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'{filename}.xlsx'
+        )
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/import_catalog', methods=['POST'])
+def import_catalog_file():
+    """Apply a catalog XLSX/JSON file: adds, renames and (optionally) deletes"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'message': 'No file provided'}), 400
+    
+    dry_run = request.form.get('dry_run') == 'true'
+    delete_missing = request.form.get('delete_missing') == 'true'
+    
+    try:
+        data = read_catalog_file(file)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Could not read file: {str(e)}'}), 400
+    
+    conn, db_type = get_db_connection()
+    c = conn.cursor()
+    try:
+        # الملف كله في معاملة واحدة؛ المعاينة (dry run) تلغى في النهاية
+        report = import_catalog(c, db_type, data, get_local_time_string(), delete_missing)
+        if dry_run:
+            conn.rollback()
+        else:
+            bump_cache_version(c, db_type, CATALOG)
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error importing catalog: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        conn.close()
+    
+    summary = {entity: result['summary'] for entity, result in report.items()}
+    print(f"✅ Catalog import{' (dry run)' if dry_run else ''}: {summary}")
+    return jsonify({
+        'success': True,
+        'message': 'Catalog import checked (no changes saved)' if dry_run else 'Catalog imported',
+        'dry_run': dry_run,
+        'summary': summary,
+        'report': report
+    })
+
 @app.route('/manage_data', methods=['POST'])
 def manage_data():
     if 'user_id' not in session or not session.get('is_admin'):
@@ -1167,18 +971,18 @@ def manage_data():
         c = conn.cursor()
         
         if action == 'add':
-            return handle_add_data(c, conn, data_type, data)
+            return handle_add_data(c, conn, db_type, data_type, data)
         elif action == 'edit':
-            return handle_edit_data(c, conn, data_type, data)
+            return handle_edit_data(c, conn, db_type, data_type, data)
         elif action == 'delete':
-            return handle_delete_data(c, conn, data_type, data)
+            return handle_delete_data(c, conn, db_type, data_type, data)
         else:
             return jsonify({'success': False, 'message': 'Invalid action'}), 400
             
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-def handle_add_data(cursor, conn, data_type, data):
+def handle_add_data(cursor, conn, db_type, data_type, data):
     current_time = get_local_time_string()
     
     if data_type == 'categories':
@@ -1186,111 +990,89 @@ def handle_add_data(cursor, conn, data_type, data):
                       (data['name'], current_time))
     
     elif data_type == 'models':
-        cursor.execute('INSERT INTO models (model_name, category_name, created_date) VALUES (?, ?, ?)',
-                      (data['name'], data['category'], current_time))
+        cursor.execute('''INSERT INTO models (model_name, category_id, created_date)
+                         SELECT ?, id, ? FROM categories WHERE category_name = ?''',
+                      (data['name'], current_time, data['category']))
     
     elif data_type == 'display_types':
-        cursor.execute('INSERT INTO display_types (display_type_name, category_name, created_date) VALUES (?, ?, ?)',
-                      (data['name'], data['category'], current_time))
+        cursor.execute('''INSERT INTO display_types (display_type_name, category_id, created_date)
+                         SELECT ?, id, ? FROM categories WHERE category_name = ?''',
+                      (data['name'], current_time, data['category']))
     
     elif data_type == 'pop_materials':
-        cursor.execute('INSERT OR IGNORE INTO pop_materials_db (material_name, model_name, category_name, created_date) VALUES (?, ?, ?, ?)',
-                      (data['name'], data['model'], data['category'], current_time))
+        cursor.execute('''INSERT OR IGNORE INTO pop_materials_db (material_name, model_id, created_date)
+                         SELECT ?, m.id, ? FROM models m JOIN categories c ON c.id = m.category_id
+                         WHERE m.model_name = ? AND c.category_name = ?''',
+                      (data['name'], current_time, data['model'], data['category']))
+        if cursor.rowcount == 0:
+            # لا شيء أضيف: المادة موجودة بالفعل، أو الموديل غير موجود
+            cursor.execute('''SELECT 1 FROM models m JOIN categories c ON c.id = m.category_id
+                             WHERE m.model_name = ? AND c.category_name = ?''',
+                          (data['model'], data['category']))
+            if cursor.fetchone() is None:
+                conn.rollback()
+                conn.close()
+                return jsonify({'success': False, 'message': 'Model not found in this category'}), 400
+    
+    # INSERT ... SELECT لا يضيف شيئاً إذا لم توجد الفئة
+    if data_type in ('models', 'display_types') and cursor.rowcount == 0:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'message': 'Category not found'}), 400
     
+    bump_cache_version(cursor, db_type, CATALOG)
     conn.commit()
     conn.close()
     return jsonify({'success': True, 'message': f'{data_type.title()} added successfully'})
 
-def handle_edit_data(cursor, conn, data_type, data):
+def handle_edit_data(cursor, conn, db_type, data_type, data):
+    # Entries and catalog rows reference ids, so a rename is a single-row update
     if data_type == 'categories':
-        # Get old category name for cascading updates
-        cursor.execute('SELECT category_name FROM categories WHERE id = ?', (data['id'],))
-        old_category = cursor.fetchone()
-        old_category_name = old_category[0] if old_category else None
-        
-        # Update category
         cursor.execute('UPDATE categories SET category_name = ? WHERE id = ?',
                       (data['name'], data['id']))
-        
-        # Cascading update: Update all related tables
-        if old_category_name and old_category_name != data['name']:
-            cursor.execute('UPDATE models SET category_name = ? WHERE category_name = ?',
-                          (data['name'], old_category_name))
-            cursor.execute('UPDATE display_types SET category_name = ? WHERE category_name = ?',
-                          (data['name'], old_category_name))
-            cursor.execute('UPDATE pop_materials_db SET category_name = ? WHERE category_name = ?',
-                          (data['name'], old_category_name))
-            cursor.execute('UPDATE data_entries SET model = REPLACE(model, ?, ?) WHERE model LIKE ?',
-                          (old_category_name, data['name'], f"{old_category_name} - %"))
     
-    elif data_type == 'models':
-        # Get old model name for cascading updates
-        cursor.execute('SELECT model_name FROM models WHERE id = ?', (data['id'],))
-        old_model = cursor.fetchone()
-        old_model_name = old_model[0] if old_model else None
-        
-        # Update model
-        cursor.execute('UPDATE models SET model_name = ?, category_name = ? WHERE id = ?',
-                      (data['name'], data['category'], data['id']))
-        
-        # Cascading update: Update all POP materials and data entries with this model
-        if old_model_name and old_model_name != data['name']:
-            cursor.execute('UPDATE pop_materials_db SET model_name = ?, category_name = ? WHERE model_name = ?',
-                          (data['name'], data['category'], old_model_name))
-            cursor.execute('UPDATE data_entries SET model = ? WHERE model = ?',
-                          (f"{data['category']} - {data['name']}", f"{data['category']} - {old_model_name}"))
-    
-    elif data_type == 'display_types':
-        # Get old display type name for cascading updates
-        cursor.execute('SELECT display_type_name FROM display_types WHERE id = ?', (data['id'],))
-        old_display_type = cursor.fetchone()
-        old_display_type_name = old_display_type[0] if old_display_type else None
-        
-        # Update display type
-        cursor.execute('UPDATE display_types SET display_type_name = ?, category_name = ? WHERE id = ?',
-                      (data['name'], data['category'], data['id']))
+    elif data_type in ('models', 'display_types'):
+        # الفئة أولاً: اسم غير موجود (أو أعيدت تسميته للتو) يعطي 400 بدلاً من خطأ NOT NULL
+        cursor.execute('SELECT id FROM categories WHERE category_name = ?', (data['category'],))
+        category = cursor.fetchone()
+        if category is None:
+            conn.rollback()
+            conn.close()
+            return jsonify({'success': False, 'message': 'Category not found'}), 400
         
-        # Cascading update: Update all data entries with this display type
-        if old_display_type_name and old_display_type_name != data['name']:
-            cursor.execute('UPDATE data_entries SET display_type = ? WHERE display_type = ?',
-                          (data['name'], old_display_type_name))
+        if data_type == 'models':
+            cursor.execute('UPDATE models SET model_name = ?, category_id = ? WHERE id = ?',
+                          (data['name'], category[0], data['id']))
+        else:
+            cursor.execute('UPDATE display_types SET display_type_name = ?, category_id = ? WHERE id = ?',
+                          (data['name'], category[0], data['id']))
     
     elif data_type == 'pop_materials':
-        cursor.execute('UPDATE pop_materials_db SET material_name = ?, model_name = ?, category_name = ? WHERE id = ?',
-                      (data['name'], data['model'], data['category'], data['id']))
+        cursor.execute('''SELECT m.id FROM models m JOIN categories c ON c.id = m.category_id
+                         WHERE m.model_name = ? AND c.category_name = ?''',
+                      (data['model'], data['category']))
+        model = cursor.fetchone()
+        if model is None:
+            conn.rollback()
+            conn.close()
+            return jsonify({'success': False, 'message': 'Model not found in this category'}), 400
+        
+        cursor.execute('UPDATE pop_materials_db SET material_name = ?, model_id = ? WHERE id = ?',
+                      (data['name'], model[0], data['id']))
     
+    bump_cache_version(cursor, db_type, CATALOG)
     conn.commit()
     conn.close()
-    return jsonify({'success': True, 'message': f'{data_type.title()} updated successfully with cascading changes'})
+    return jsonify({'success': True, 'message': f'{data_type.title()} updated successfully'})
 
-def handle_delete_data(cursor, conn, data_type, data):
+def handle_delete_data(cursor, conn, db_type, data_type, data):
+    # Related catalog rows go through the foreign key cascades; data entries
+    # keep the names they were submitted with
     if data_type == 'categories':
-        # Get category name before deletion for cascading deletes
-        cursor.execute('SELECT category_name FROM categories WHERE id = ?', (data['id'],))
-        category_result = cursor.fetchone()
-        category_name = category_result[0] if category_result else None
-        
-        # Delete category
         cursor.execute('DELETE FROM categories WHERE id = ?', (data['id'],))
-        
-        # Cascading delete: Remove all related data
-        if category_name:
-            cursor.execute('DELETE FROM models WHERE category_name = ?', (category_name,))
-            cursor.execute('DELETE FROM display_types WHERE category_name = ?', (category_name,))
-            cursor.execute('DELETE FROM pop_materials_db WHERE category_name = ?', (category_name,))
     
     elif data_type == 'models':
-        # Get model name before deletion for cascading deletes
-        cursor.execute('SELECT model_name FROM models WHERE id = ?', (data['id'],))
-        model_result = cursor.fetchone()
-        model_name = model_result[0] if model_result else None
-        
-        # Delete model
         cursor.execute('DELETE FROM models WHERE id = ?', (data['id'],))
-        
-        # Cascading delete: Remove all POP materials for this model
-        if model_name:
-            cursor.execute('DELETE FROM pop_materials_db WHERE model_name = ?', (model_name,))
     
     elif data_type == 'display_types':
         cursor.execute('DELETE FROM display_types WHERE id = ?', (data['id'],))
@@ -1298,6 +1080,7 @@ def handle_delete_data(cursor, conn, data_type, data):
     elif data_type == 'pop_materials':
         cursor.execute('DELETE FROM pop_materials_db WHERE id = ?', (data['id'],))
     
+    bump_cache_version(cursor, db_type, CATALOG)
     conn.commit()
     conn.close()
     return jsonify({'success': True, 'message': f'{data_type.title()} deleted successfully with related data'})
@@ -1311,21 +1094,16 @@ def delete_entry(entry_id):
         conn, db_type = get_db_connection()
         c = conn.cursor()
         
-        # Get entry details before deletion for cleanup
-        c.execute('SELECT images FROM data_entries WHERE id = ?', (entry_id,))
-        result = c.fetchone()
+        # Get entry images before deletion for cleanup
+        image_files = entry_image_files(c, db_type, 'id = ?', (entry_id,))
         
-        if result and result[0]:
-            # Delete associated images
-            images = result[0].split(',')
-            for image in images:
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], image)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-        
-        # Delete the entry
+        # Delete the entry (entry_images rows cascade)
         c.execute('DELETE FROM data_entries WHERE id = ?', (entry_id,))
+        bump_cache_version(c, db_type, ENTRIES)
         conn.commit()
+        
+        # Delete associated images no other entry still uses
+        remove_unreferenced_files(c, db_type, image_files, app.config['UPLOAD_FOLDER'])
         conn.close()
         
         return jsonify({'success': True, 'message': 'Entry deleted successfully'})
@@ -1374,6 +1152,7 @@ def manage_user():
         
         conn, db_type = get_db_connection()
         c = conn.cursor()
+        image_files = []
         
         if action == 'add':
             name = data.get('name')
@@ -1439,22 +1218,17 @@ def manage_user():
                 company_code = user_data[0]
                 c.execute('DELETE FROM branches WHERE employee_code = ?', (company_code,))
                 
-                # Get and delete images from data entries
-                c.execute('SELECT images FROM data_entries WHERE employee_code = ?', (company_code,))
-                entries = c.fetchall()
-                for entry in entries:
-                    if entry[0]:
-                        images = entry[0].split(',')
-                        for image in images:
-                            image_path = os.path.join(app.config['UPLOAD_FOLDER'], image)
-                            if os.path.exists(image_path):
-                                os.remove(image_path)
-                
+                # Get images of the user's data entries
+                image_files = entry_image_files(c, db_type, 'employee_code = ?', (company_code,))
                 c.execute('DELETE FROM data_entries WHERE employee_code = ?', (company_code,))
+                bump_cache_version(c, db_type, ENTRIES)
             
             c.execute('DELETE FROM users WHERE id = ?', (user_id,))
         
         conn.commit()
+        
+        # Delete image files once the entries are gone
+        remove_unreferenced_files(c, db_type, image_files, app.config['UPLOAD_FOLDER'])
         conn.close()
         
         return jsonify({'success': True, 'message': f'User {action}ed successfully'})
@@ -1529,7 +1303,9 @@ def register():
                              (user_id, branch_name.strip(), current_time))
                     
                     # Also add to branches table for this employee
-                    c.execute('INSERT OR IGNORE INTO branches (branch_name, shop_code, employee_code, created_date) VALUES (?, ?, ?, ?)',
+                    insert_branch = database_manager.insert_or_ignore(
+                        db_type, 'branches', ('branch_name', 'shop_code', 'employee_code', 'created_date'))
+                    c.execute(database_manager.adapt_query(insert_branch, db_type),
                              (branch_name.strip(), branch_code.strip(), company_code, current_time))
             
             conn.commit()
@@ -1679,40 +1455,22 @@ def manage_user_branches():
             if not branches:
                 return jsonify({'success': False, 'message': 'No branches provided'}), 400
             
-            added_count = 0
-            for branch in branches:
-                branch_name = branch.get('name', '').strip()
-                branch_code = branch.get('code', '').strip()
-                
-                if branch_name and branch_code:
-                    # Check if branch already exists for this user
-                    c.execute('SELECT id FROM user_branches WHERE user_id = ? AND LOWER(TRIM(branch_name)) = LOWER(TRIM(?))', 
-                             (user_id, branch_name))
-                    if not c.fetchone():
-                        # Check if shop_code already exists for this employee
-                        c.execute('SELECT id, branch_name FROM branches WHERE shop_code = ? AND employee_code = ?',
-                                 (branch_code, company_code))
-                        existing_code = c.fetchone()
-                        
-                        if not existing_code or existing_code[1] == branch_name:
-                            # Add to user_branches
-                            c.execute('INSERT INTO user_branches (user_id, branch_name, created_date) VALUES (?, ?, ?)',
-                                     (user_id, branch_name, current_time))
-                            
-                            # Update or insert into branches table - ensure consistency
-                            c.execute('DELETE FROM branches WHERE branch_name = ? AND employee_code = ?',
-                                     (branch_name, company_code))
-                            c.execute('INSERT INTO branches (branch_name, shop_code, employee_code, created_date) VALUES (?, ?, ?, ?)',
-                                     (branch_name, branch_code, company_code, current_time))
-                            added_count += 1
+            # Same set-based path as the file import
+            rows = [(company_code, branch.get('name', '').strip(), branch.get('code', '').strip())
+                    for branch in branches]
+            rows = [row for row in rows if row[1] and row[2]]
+            report = import_branches(c, db_type, rows, current_time)
+            added_count = summarize_report(report)['added']
             
             conn.commit()
             conn.close()
             
             if added_count == 0:
-                return jsonify({'success': False, 'message': 'No new branches were added (all already exist)'}), 400
+                return jsonify({'success': False, 'message': 'No new branches were added (all already exist)',
+                                'report': report}), 400
             else:
-                return jsonify({'success': True, 'message': f'{added_count} branches added successfully'})
+                return jsonify({'success': True, 'message': f'{added_count} branches added successfully',
+                                'report': report})
         
         else:
             print(f"DEBUG: Invalid action received: {action}")
@@ -1724,6 +1482,48 @@ def manage_user_branches():
         traceback.print_exc()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/import_branches', methods=['POST'])
+def import_branches_file():
+    """Assign branches to many users from a CSV/XLSX of employee_code, branch_name, shop_code"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'message': 'No file provided'}), 400
+    
+    try:
+        rows = read_branch_rows(file)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Could not read file: {str(e)}'}), 400
+    
+    if not rows:
+        return jsonify({'success': False, 'message': 'The file has no rows'}), 400
+    
+    conn, db_type = get_db_connection()
+    c = conn.cursor()
+    try:
+        # صفوف الملف كلها في معاملة واحدة
+        report = import_branches(c, db_type, rows, get_local_time_string())
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error importing branches: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        conn.close()
+    
+    summary = summarize_report(report)
+    print(f"✅ Branch import: {summary['added']} of {len(rows)} rows assigned")
+    return jsonify({
+        'success': True,
+        'message': f"{summary['added']} of {len(rows)} branches assigned",
+        'summary': summary,
+        'report': report
+    })
+
 # Model Images Management Routes
 @app.route('/upload_model_image', methods=['POST'])
 def upload_model_image():
@@ -1764,10 +1564,16 @@ def upload_model_image():
         c = conn.cursor()
         current_time = get_local_time_string()
         
+        model_id = get_catalog(c, db_type)['model_ids'].get((category_name, model_name))
+        if model_id is None:
+            conn.close()
+            return jsonify({'success': False, 'message': 'Model not found'}), 404
+        
         c.execute('''INSERT OR REPLACE INTO model_images 
-                    (model_name, category_name, image_url, created_date) 
-                    VALUES (?, ?, ?, ?)''',
-                 (model_name, category_name, image_url, current_time))
+                    (model_id, image_url, created_date) 
+                    VALUES (?, ?, ?)''',
+                 (model_id, image_url, current_time))
+        bump_cache_version(c, db_type, CATALOG)
         
         conn.commit()
         conn.close()
@@ -1791,13 +1597,11 @@ def get_model_image(category, model):
                 conn.close()
                 return jsonify({'success': False, 'message': 'Model images feature not available - database needs update'})
         
-        c.execute('SELECT image_url FROM model_images WHERE model_name = ? AND category_name = ?',
-                 (model, category))
-        result = c.fetchone()
+        image_url = get_catalog(c, db_type)['model_images'].get((category, model))
         conn.close()
         
-        if result:
-            return jsonify({'success': True, 'image_url': result[0]})
+        if image_url:
+            return jsonify({'success': True, 'image_url': image_url})
         else:
             return jsonify({'success': False, 'message': 'No image found for this model'})
             
@@ -1825,16 +1629,14 @@ def delete_model_image():
         c = conn.cursor()
         
         # Get image URL before deleting
-        c.execute('SELECT image_url FROM model_images WHERE model_name = ? AND category_name = ?',
-                 (model_name, category_name))
-        result = c.fetchone()
+        catalog = get_catalog(c, db_type)
+        image_url = catalog['model_images'].get((category_name, model_name))
         
-        if result:
-            image_url = result[0]
-            
+        if image_url:
             # Delete from database
-            c.execute('DELETE FROM model_images WHERE model_name = ? AND category_name = ?',
-                     (model_name, category_name))
+            c.execute('DELETE FROM model_images WHERE model_id = ?',
+                     (catalog['model_ids'][(category_name, model_name)],))
+            bump_cache_version(c, db_type, CATALOG)
             conn.commit()
             
             # Delete local file
@@ -1876,10 +1678,11 @@ def model_images_management():
         categories = [row[0] for row in c.fetchall()]
         
         # Get all models with their images
-        c.execute('''SELECT m.category_name, m.model_name, mi.image_url, mi.created_date
+        c.execute('''SELECT c.category_name, m.model_name, mi.image_url, mi.created_date
                     FROM models m
-                    LEFT JOIN model_images mi ON m.model_name = mi.model_name AND m.category_name = mi.category_name
-                    ORDER BY m.category_name, m.model_name''')
+                    JOIN categories c ON c.id = m.category_id
+                    LEFT JOIN model_images mi ON mi.model_id = m.id
+                    ORDER BY c.category_name, m.model_name''')
         
         models_data = []
         for row in c.fetchall():
@@ -1913,75 +1716,26 @@ def api_export_excel():
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
     try:
-        # Get filter parameters from request
-        employee_filter = request.args.get('employee', '')
-        branch_filter = request.args.get('branch', '')
-        model_filter = request.args.get('model', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
         # Build query with filters (same logic as admin_dashboard)
-        query = '''SELECT id, employee_name, employee_code, branch, shop_code, model, 
-                          display_type, selected_materials, unselected_materials, images, date, comment 
-                   FROM data_entries WHERE 1=1'''
-        params = []
-        
-        if employee_filter:
-            query += ' AND employee_name LIKE ?'
-            params.append(f'%{employee_filter}%')
-        
-        if branch_filter:
-            query += ' AND branch LIKE ?'
-            params.append(f'%{branch_filter}%')
-        
-        if model_filter:
-            query += ' AND model LIKE ?'
-            params.append(f'%{model_filter}%')
-        
-        if date_from:
-            query += ' AND date >= ?'
-            params.append(date_from)
-        
-        if date_to:
-            query += ' AND date <= ?'
-            params.append(date_to + ' 23:59:59')
-        
-        query += ' ORDER BY date DESC'
-        
-        # Execute query
-        conn, db_type = get_db_connection()
-        c = conn.cursor()
-        c.execute(query, params)
-        entries = c.fetchall()
-        conn.close()
-        
-        if not entries:
-            return jsonify({
-                'success': False, 
-                'message': 'لا توجد بيانات للتصدير مع الفلاتر المحددة'
-            }), 400
+        filters = get_entry_filters(request.args)
         
         # Enhanced export with images (local only)
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f'pop_materials_report_enhanced_{timestamp}.xlsx'
             
-            temp_path = create_enhanced_excel_with_images(entries, filename)
+            # Built once per filter set and data version (export cache)
+            conn, db_type = get_db_connection()
+            try:
+                path = cached_export_file(conn.cursor(), db_type, 'enhanced', filters,
+                                          image_url_for=image_link_builder())
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            finally:
+                conn.close()
             
-            if temp_path and os.path.exists(temp_path):
-                # Read file and send it
-                with open(temp_path, 'rb') as f:
-                    file_data = f.read()
-                
-                # Clean up temp file
-                cleanup_temp_file(temp_path)
-                
-                return send_file(
-                    BytesIO(file_data),
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name=filename
-                )
+            if path:
+                return send_export_file(path, filename)
             else:
                 return jsonify({
                     'success': False,
@@ -2007,79 +1761,30 @@ def api_export_excel_simple():
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
     try:
-        # Get filter parameters from request
-        employee_filter = request.args.get('employee', '')
-        branch_filter = request.args.get('branch', '')
-        model_filter = request.args.get('model', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
         # Build query with filters (same logic as admin_dashboard)
-        query = '''SELECT id, employee_name, employee_code, branch, shop_code, model, 
-                          display_type, selected_materials, unselected_materials, images, date, comment 
-                   FROM data_entries WHERE 1=1'''
-        params = []
-        
-        if employee_filter:
-            query += ' AND employee_name LIKE ?'
-            params.append(f'%{employee_filter}%')
-        
-        if branch_filter:
-            query += ' AND branch LIKE ?'
-            params.append(f'%{branch_filter}%')
-        
-        if model_filter:
-            query += ' AND model LIKE ?'
-            params.append(f'%{model_filter}%')
-        
-        if date_from:
-            query += ' AND date >= ?'
-            params.append(date_from)
-        
-        if date_to:
-            query += ' AND date <= ?'
-            params.append(date_to + ' 23:59:59')
-        
-        query += ' ORDER BY date DESC'
-        
-        # Execute query
-        conn, db_type = get_db_connection()
-        c = conn.cursor()
-        c.execute(query, params)
-        entries = c.fetchall()
-        conn.close()
-        
-        if not entries:
-            return jsonify({
-                'success': False,
-                'message': 'لا توجد بيانات للتصدير مع الفلاتر المحددة'
-            }), 400
+        filters = get_entry_filters(request.args)
         
         # Create filename
         timestamp = get_local_time().strftime('%Y%m%d_%H%M%S')
         filename = f'pop_materials_simple_{timestamp}.xlsx'
         
-        # Create Excel file with formatting
-        temp_path = create_simple_excel_with_formatting(entries, filename)
+        # Built once per filter set and data version (export cache)
+        conn, db_type = get_db_connection()
+        try:
+            path = cached_export_file(conn.cursor(), db_type, 'simple', filters)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        finally:
+            conn.close()
         
-        if not temp_path:
+        if not path:
             return jsonify({
                 'success': False,
                 'message': 'خطأ في إنشاء ملف Excel'
             }), 500
         
-        # Send file directly (local only)
-        with open(temp_path, 'rb') as f:
-            file_data = f.read()
-        
-        cleanup_temp_file(temp_path)
-        
-        return send_file(
-            BytesIO(file_data),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        # Sent from disk
+        return send_export_file(path, filename)
     
     except Exception as e:
         return jsonify({
@@ -2087,7 +1792,207 @@ def api_export_excel_simple():
             'message': f'خطأ في تصدير البيانات: {str(e)}'
         }), 500
 
+@app.route('/api/export.<fmt>')
+def api_export_stream(fmt):
+    """Stream the filtered entries as CSV or NDJSON (same filters as the dashboard)"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    if fmt not in STREAM_FORMATS:
+        return jsonify({'success': False, 'message': 'Unsupported export format'}), 404
+    
+    filters = get_entry_filters(request.args)
+    gzip = 'gzip' in request.accept_encodings
+    conn, db_type = get_db_connection()
+    
+    timestamp = get_local_time().strftime('%Y%m%d_%H%M%S')
+    return stream_response(stream_export(conn, db_type, filters, fmt, gzip), fmt, f'pop_entries_{timestamp}.{fmt}', gzip)
+
+@app.route('/api/export_changes.<fmt>')
+def api_export_changes(fmt):
+    """Entries inserted, updated or deleted since the ?since= watermark (CSV, NDJSON or XLSX)"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    if fmt not in CHANGE_FORMATS:
+        return jsonify({'success': False, 'message': 'Unsupported export format'}), 404
+    
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({'success': False, 'message': 'since must be a change watermark (a non-negative integer)'}), 400
+    since = int(since)
+    
+    conn, db_type = get_db_connection()
+    try:
+        until = change_watermark(conn.cursor(), db_type)
+    except Exception:
+        conn.close()
+        raise
+    if since > until:
+        # قاعدة بيانات أخرى أو مستعادة: على العميل المزامنة من البداية
+        conn.close()
+        return jsonify({'success': False, 'message': 'Watermark is ahead of the change log; sync again from since=0',
+                        'watermark': until}), 409
+    
+    filename = f'pop_changes_{since}_{until}.{fmt}'
+    batches = iter_change_batches(conn, db_type, since, until)
+    if fmt == 'xlsx':
+        try:
+            path = write_changes_xlsx(batches)
+        finally:
+            conn.close()
+        response = send_export_file(path, filename, remove=True)
+    else:
+        gzip = 'gzip' in request.accept_encodings
+        response = stream_response(stream_body(conn, batches, fmt, gzip, CHANGE_COLUMNS), fmt, filename, gzip)
+    
+    # يرسله العميل كـ since في المزامنة التالية
+    response.headers['X-Next-Watermark'] = str(until)
+    return response
+
+def stream_response(body, fmt, filename, gzip):
+    """Streaming attachment response for a CSV / NDJSON body generator"""
+    # الصفوف ترسل دفعة دفعة أثناء قراءتها (الطلب يبقى مفتوحاً حتى نهاية البث)
+    response = app.response_class(stream_with_context(body), content_type=STREAM_FORMATS[fmt])
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    response.headers['Cache-Control'] = 'no-store'
+    # nginx يمرر البيانات فوراً بدلاً من تجميعها (proxy_buffering)
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.vary.add('Accept-Encoding')
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def image_link_builder():
+    """Links to original images that work outside the request (export job threads)"""
+    prefix = url_for('download_image', filename='_', _external=True)[:-1]
+    return lambda name: prefix + quote(name)
+
+def write_export_file(c, db_type, kind, filters, image_url_for=None, progress=None):
+    """Write an export to a temp file and return its path (None if writing failed)
+
+    Rows are read in batches and written as they arrive. Raises ValueError
+    when no entry matches the filters.
+    """
+    column_lengths = export_column_lengths(c, db_type, filters)
+    if not column_lengths['rows']:
+        raise ValueError('لا توجد بيانات للتصدير مع الفلاتر المحددة')
+    
+    entries = iter_export_entries(c, db_type, filters)
+    if kind == 'simple':
+        if progress:
+            progress.start(column_lengths['rows'], 0)
+        return create_simple_excel_with_formatting(entries, progress=progress,
+                                                   column_lengths=column_lengths)
+    
+    if progress:
+        progress.start(column_lengths['rows'], export_image_count(c, db_type, filters))
+    return create_enhanced_excel_with_images(entries, image_url_for=image_url_for, progress=progress)
+
+def cached_export_file(c, db_type, kind, filters, image_url_for=None):
+    """Path of the export in the export cache, written first if this data version has none
+
+    Identical concurrent requests wait for the first one's build. The file
+    belongs to the cache: send it without removing it.
+    """
+    # روابط الصور في التقرير المحسن تعتمد على عنوان الموقع
+    variant = image_url_for('') if image_url_for else ''
+    with claim_export(c, db_type, kind, filters, variant) as cached:
+        if cached.path:
+            return cached.path
+        temp_path = write_export_file(c, db_type, kind, filters, image_url_for=image_url_for)
+        if not temp_path or not os.path.exists(temp_path):
+            return None
+        return cached.store(temp_path)
+
+def export_job_builder(kind, filters, image_url_for):
+    """build(progress) for start_export_job: query the entries and write the workbook"""
+    def build(progress):
+        timestamp = get_local_time().strftime('%Y%m%d_%H%M%S')
+        if kind == 'simple':
+            filename = f'pop_materials_simple_{timestamp}.xlsx'
+        else:
+            filename = f'pop_materials_report_enhanced_{timestamp}.xlsx'
+        
+        conn, db_type = get_db_connection()
+        try:
+            return write_export_file(conn.cursor(), db_type, kind, filters,
+                                     image_url_for=image_url_for, progress=progress), filename
+        finally:
+            conn.close()
+    return build
+
+@app.route('/api/export_jobs', methods=['POST'])
+def api_create_export_job():
+    """Queue an export (type=enhanced|simple, same filters as the dashboard)"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    kind = request.args.get('type', 'enhanced')
+    if kind not in EXPORT_KINDS:
+        return jsonify({'success': False, 'message': 'Invalid export type'}), 400
+    filters = get_entry_filters(request.args)
+    
+    conn, db_type = get_db_connection()
+    try:
+        job_id = create_export_job(conn.cursor(), db_type, session['user_id'], kind, filters)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        conn.close()
+    
+    start_export_job(job_id, export_job_builder(kind, filters, image_link_builder()))
+    print(f"📤 Export job {job_id} queued ({kind})")
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('api_export_job_status', job_id=job_id)
+    }), 202
+
+@app.route('/api/export_jobs/<job_id>')
+def api_export_job_status(job_id):
+    """Progress of an export job; download_url once it is done"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    conn, db_type = get_db_connection()
+    try:
+        job = get_export_job(conn.cursor(), db_type, job_id, session['user_id'])
+        conn.commit()
+    finally:
+        conn.close()
+    
+    if job is None:
+        return jsonify({'success': False, 'message': 'Export not found or expired'}), 404
+    
+    status = job_status(job)
+    if job['status'] == 'done':
+        status['download_url'] = url_for('api_export_job_download', job_id=job_id)
+    response = jsonify({'success': True, **status})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/export_jobs/<job_id>/download')
+def api_export_job_download(job_id):
+    """Send a finished export file"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    conn, db_type = get_db_connection()
+    try:
+        job = get_export_job(conn.cursor(), db_type, job_id, session['user_id'])
+        conn.commit()
+    finally:
+        conn.close()
+    
+    if job is None or job['status'] != 'done' or not os.path.exists(job['file_path'] or ''):
+        return jsonify({'success': False, 'message': 'Export not found or expired'}), 404
+    
+    # الملف يبقى حتى تنتهي صلاحية المهمة، فيمكن استئناف التنزيل (Range)
+    return send_export_file(job['file_path'], job['filename'])
+
 # تهيئة قاعدة البيانات عند بدء التطبيق
+# (تحت gunicorn تطبق الترحيلات في العملية الرئيسية، فهذا مجرد فحص للإصدار)
 init_db()
 
 if __name__ == '__main__':
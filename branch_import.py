@@ -0,0 +1,161 @@
+"""
+Bulk assignment of branches to users (user_branches + branches)
+
+Rows of (employee_code, branch_name, shop_code) are staged in a temporary
+table, checked with a handful of set-based UPDATEs and written with two
+INSERT ... SELECT statements, so importing thousands of rows costs the same
+few round trips as importing one. Every row gets a status for the report.
+"""
+
+import os
+
+import pandas as pd
+
+from database_manager import adapt_query
+
+IMPORT_COLUMNS = ('employee_code', 'branch_name', 'shop_code')
+
+STATUS_MESSAGES = {
+    'added': 'Branch assigned',
+    'invalid': 'Employee code, branch name and shop code are required',
+    'unknown_user': 'No user with this employee code',
+    'duplicate': 'Repeats an earlier row of the file',
+    'exists': 'Branch already assigned to this user',
+    'shop_code_taken': 'Shop code already used for another branch of this employee',
+}
+
+STAGING_TABLE = 'branch_import_rows'
+
+# صف branches الذي يحدثه صف الاستيراد: نفس الموظف ونفس اسم الفرع بدون
+# اعتبار حالة الأحرف (الأقدم إن وجد أكثر من واحد)
+TARGET_BRANCH = f'''(SELECT MIN(t.id) FROM branches t
+                     WHERE t.employee_code = {STAGING_TABLE}.employee_code
+                       AND LOWER(t.branch_name) = {STAGING_TABLE}.branch_key)'''
+
+
+def read_branch_rows(file):
+    """Read (employee_code, branch_name, shop_code) rows from a CSV or XLSX upload
+
+    Raises ValueError when the file type or the header row is not usable.
+    """
+    extension = os.path.splitext(file.filename or '')[1].lower()
+    if extension == '.csv':
+        frame = pd.read_csv(file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    elif extension in ('.xlsx', '.xls'):
+        frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+    else:
+        raise ValueError('Only .csv and .xlsx files are supported')
+
+    frame.columns = [str(column).strip().lower().replace(' ', '_') for column in frame.columns]
+    missing = [column for column in IMPORT_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    return [tuple(str(value).strip() for value in row)
+            for row in frame[list(IMPORT_COLUMNS)].itertuples(index=False)]
+
+
+def _create_staging_table(cursor, db_type):
+    cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+    on_commit = ' ON COMMIT DROP' if db_type == 'postgresql' else ''
+    cursor.execute(f'''CREATE TEMP TABLE {STAGING_TABLE} (
+        row_no INTEGER PRIMARY KEY,
+        employee_code TEXT NOT NULL,
+        branch_name TEXT NOT NULL,
+        branch_key TEXT NOT NULL,
+        shop_code TEXT NOT NULL,
+        user_id INTEGER,
+        branch_id INTEGER,
+        status TEXT
+    ){on_commit}''')
+
+
+def import_branches(cursor, db_type, rows, current_time):
+    """Assign branches in bulk; returns the per-row report
+
+    Runs inside the caller's transaction, which the caller commits. Rows
+    are numbered from 1 in file order; when rows conflict with each other
+    the first one wins.
+    """
+    _create_staging_table(cursor, db_type)
+    cursor.executemany(adapt_query(f'''INSERT INTO {STAGING_TABLE}
+                                       (row_no, employee_code, branch_name, branch_key, shop_code)
+                                       VALUES (?, ?, ?, ?, ?)''', db_type),
+                       [(row_no, employee_code, branch_name, branch_name.lower(), shop_code)
+                        for row_no, (employee_code, branch_name, shop_code) in enumerate(rows, 1)])
+
+    # كل فحص يعلّم الصفوف التي لم تفشل بعد (status IS NULL)، بالترتيب
+    checks = [
+        f'''UPDATE {STAGING_TABLE} SET status = 'invalid'
+            WHERE employee_code = '' OR branch_name = '' OR shop_code = '' ''',
+        f'''UPDATE {STAGING_TABLE}
+            SET user_id = (SELECT MIN(u.id) FROM users u WHERE u.company_code = {STAGING_TABLE}.employee_code)
+            WHERE status IS NULL''',
+        f'''UPDATE {STAGING_TABLE} SET status = 'unknown_user'
+            WHERE status IS NULL AND user_id IS NULL''',
+        # الصف الأول لكل (موظف، فرع) يبقى، والباقي مكرر
+        f'''UPDATE {STAGING_TABLE} SET status = 'duplicate'
+            WHERE status IS NULL AND EXISTS (
+                SELECT 1 FROM {STAGING_TABLE} e
+                WHERE e.employee_code = {STAGING_TABLE}.employee_code
+                  AND e.branch_key = {STAGING_TABLE}.branch_key
+                  AND e.row_no < {STAGING_TABLE}.row_no
+                  AND (e.status IS NULL OR e.status = 'duplicate'))''',
+        f'''UPDATE {STAGING_TABLE} SET status = 'exists'
+            WHERE status IS NULL AND EXISTS (
+                SELECT 1 FROM user_branches ub
+                WHERE ub.user_id = {STAGING_TABLE}.user_id
+                  AND LOWER(TRIM(ub.branch_name)) = {STAGING_TABLE}.branch_key)''',
+        # كود المحل لفرع آخر: في صف سابق من الملف أو في branches
+        f'''UPDATE {STAGING_TABLE} SET status = 'shop_code_taken'
+            WHERE status IS NULL AND EXISTS (
+                SELECT 1 FROM {STAGING_TABLE} e
+                WHERE e.employee_code = {STAGING_TABLE}.employee_code
+                  AND e.shop_code = {STAGING_TABLE}.shop_code
+                  AND e.row_no < {STAGING_TABLE}.row_no
+                  AND (e.status IS NULL OR e.status = 'shop_code_taken'))''',
+        f'''UPDATE {STAGING_TABLE} SET status = 'shop_code_taken'
+            WHERE status IS NULL AND EXISTS (
+                SELECT 1 FROM branches b
+                WHERE b.employee_code = {STAGING_TABLE}.employee_code
+                  AND b.shop_code = {STAGING_TABLE}.shop_code
+                  AND b.id <> COALESCE({TARGET_BRANCH}, 0))''',
+        f"UPDATE {STAGING_TABLE} SET status = 'added' WHERE status IS NULL",
+    ]
+    for check in checks:
+        cursor.execute(check)
+
+    cursor.execute(adapt_query(f'''INSERT INTO user_branches (user_id, branch_name, created_date)
+                                   SELECT user_id, branch_name, ? FROM {STAGING_TABLE}
+                                   WHERE status = 'added' ''', db_type), (current_time,))
+    # الفرع الموجود بحالة أحرف أخرى ('Qux' لـ 'qux') يحدث بدلاً من إضافة صف ثان
+    cursor.execute(f'''UPDATE {STAGING_TABLE} SET branch_id = {TARGET_BRANCH} WHERE status = 'added' ''')
+    cursor.execute(adapt_query(f'''UPDATE branches
+                                   SET shop_code = (SELECT s.shop_code FROM {STAGING_TABLE} s
+                                                    WHERE s.branch_id = branches.id),
+                                       created_date = ?
+                                   WHERE id IN (SELECT branch_id FROM {STAGING_TABLE})''', db_type),
+                   (current_time,))
+    cursor.execute(adapt_query(f'''INSERT INTO branches (branch_name, shop_code, employee_code, created_date)
+                                   SELECT branch_name, shop_code, employee_code, ? FROM {STAGING_TABLE}
+                                   WHERE status = 'added' AND branch_id IS NULL''', db_type),
+                   (current_time,))
+
+    cursor.execute(f'''SELECT row_no, employee_code, branch_name, shop_code, status
+                       FROM {STAGING_TABLE} ORDER BY row_no''')
+    return [{
+        'row': row_no,
+        'employee_code': employee_code,
+        'branch_name': branch_name,
+        'shop_code': shop_code,
+        'status': status,
+        'message': STATUS_MESSAGES[status],
+    } for row_no, employee_code, branch_name, shop_code, status in cursor.fetchall()]
+
+
+def summarize_report(report):
+    """Number of rows per status"""
+    summary = dict.fromkeys(STATUS_MESSAGES, 0)
+    for row in report:
+        summary[row['status']] += 1
+    return summary
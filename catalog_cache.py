@@ -0,0 +1,122 @@
+"""
+In-process cache of the product catalog (categories, models, display types
+and POP materials)
+
+The catalog only changes through /manage_data and the model image routes,
+so each worker keeps a copy in memory. Writers bump the 'catalog' row of cache_versions in the same
+transaction as their change; readers compare that one-row version with their
+copy and reload only when it moved, which invalidates every gunicorn worker.
+"""
+
+import gzip
+import json
+import threading
+
+from database_manager import adapt_query
+
+CATALOG = 'catalog'
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_cache_version(cursor, db_type, name):
+    cursor.execute(adapt_query('SELECT version FROM cache_versions WHERE name = ?', db_type), (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def bump_cache_version(cursor, db_type, name):
+    """Invalidate a cache everywhere; call inside the writer's transaction"""
+    cursor.execute(adapt_query('UPDATE cache_versions SET version = version + 1 WHERE name = ?', db_type), (name,))
+
+
+def _load_catalog(cursor, version):
+    cursor.execute('SELECT id, category_name, created_date FROM categories ORDER BY category_name')
+    categories = cursor.fetchall()
+
+    cursor.execute('''SELECT m.id, m.model_name, c.category_name, m.created_date
+                      FROM models m JOIN categories c ON c.id = m.category_id
+                      ORDER BY c.category_name, m.model_name''')
+    models = cursor.fetchall()
+
+    cursor.execute('''SELECT d.id, d.display_type_name, c.category_name, d.created_date
+                      FROM display_types d JOIN categories c ON c.id = d.category_id
+                      ORDER BY c.category_name, d.display_type_name''')
+    display_types = cursor.fetchall()
+
+    cursor.execute('''SELECT p.id, p.material_name, m.model_name, c.category_name, p.created_date
+                      FROM pop_materials_db p
+                      JOIN models m ON m.id = p.model_id
+                      JOIN categories c ON c.id = m.category_id
+                      ORDER BY c.category_name, m.model_name, p.material_name''')
+    pop_materials = cursor.fetchall()
+
+    cursor.execute('''SELECT c.category_name, m.model_name, mi.image_url
+                      FROM model_images mi
+                      JOIN models m ON m.id = mi.model_id
+                      JOIN categories c ON c.id = m.category_id''')
+    model_images = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+    # حسب model_id: موديلان بنفس الاسم في فئتين مختلفتين لهما قائمتان مختلفتان
+    cursor.execute('SELECT model_id, material_name FROM pop_materials_db ORDER BY material_name')
+    materials_by_model = {}
+    for model_id, material_name in cursor.fetchall():
+        materials_by_model.setdefault(model_id, []).append(material_name)
+
+    catalog = {
+        'version': version,
+        'etag': f'{CATALOG}-{version}',
+        'categories': categories,
+        'models': models,
+        'display_types': display_types,
+        'pop_materials': pop_materials,
+        'materials_by_model': materials_by_model,
+        'model_images': model_images,
+        'model_ids': {(row[2], row[1]): row[0] for row in models},
+        'display_type_ids': {(row[2], row[1]): row[0] for row in display_types},
+    }
+
+    # حزمة /api/catalog تبنى وتضغط مرة واحدة لكل إصدار
+    bundle = json.dumps(_build_bundle(catalog), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    catalog['bundle'] = bundle
+    catalog['bundle_gzip'] = gzip.compress(bundle)
+    return catalog
+
+
+def _build_bundle(catalog):
+    """Category -> display types / models -> materials and guide image tree"""
+    tree = []
+    for _, category, _ in catalog['categories']:
+        tree.append({
+            'name': category,
+            'display_types': [row[1] for row in catalog['display_types'] if row[2] == category],
+            'models': [{
+                'name': row[1],
+                'materials': catalog['materials_by_model'].get(row[0], []),
+                'guide_image': catalog['model_images'].get((category, row[1])),
+            } for row in catalog['models'] if row[2] == category],
+        })
+    return {'success': True, 'version': catalog['version'], 'categories': tree}
+
+
+def get_catalog(cursor, db_type):
+    """Current catalog snapshot, reloaded only when its version changed
+
+    Rows are tuples in the column order of the SELECTs above;
+    materials_by_model maps a model id to its material names, sorted;
+    model_images maps (category, model) to the guide image URL, model_ids
+    and display_type_ids map (category, name) to the row id. bundle and
+    bundle_gzip hold the serialized /api/catalog payload.
+    """
+    global _catalog
+    version = get_cache_version(cursor, db_type, CATALOG)
+    catalog = _catalog
+    if catalog is not None and catalog['version'] == version:
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is None or _catalog['version'] != version:
+            _catalog = _load_catalog(cursor, version)
+            print(f"🔄 Catalog cache loaded (version {version})")
+        return _catalog
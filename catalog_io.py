@@ -0,0 +1,289 @@
+"""
+Bulk catalog import and export (categories, models, display types and
+POP materials)
+
+The file format is one list of rows per entity, as XLSX sheets or JSON
+keys, with the row id from the export so that a changed name is a rename
+rather than a delete plus an add. Imports are diffed against the current
+tables in a staging table and applied with set-based statements, entity by
+entity, in the caller's transaction.
+"""
+
+import json
+import os
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+
+from database_manager import adapt_query
+
+# entity -> (اسم الورقة, أعمدة الملف)
+CATALOG_SHEETS = {
+    'categories': ('Categories', ('id', 'name')),
+    'models': ('Models', ('id', 'category', 'name')),
+    'display_types': ('Display Types', ('id', 'category', 'name')),
+    'materials': ('Materials', ('id', 'category', 'model', 'name')),
+}
+
+STAGING_TABLE = 'catalog_import_rows'
+
+# entity -> (الجدول, عمود الاسم, عمود الأب, استعلام معرف الأب من أسماء الملف)
+CATALOG_ENTITIES = {
+    'categories': ('categories', 'category_name', None, None),
+    'models': ('models', 'model_name', 'category_id',
+               f'SELECT c.id FROM categories c WHERE c.category_name = {STAGING_TABLE}.category'),
+    'display_types': ('display_types', 'display_type_name', 'category_id',
+                      f'SELECT c.id FROM categories c WHERE c.category_name = {STAGING_TABLE}.category'),
+    'materials': ('pop_materials_db', 'material_name', 'model_id',
+                  f'''SELECT m.id FROM models m JOIN categories c ON c.id = m.category_id
+                      WHERE c.category_name = {STAGING_TABLE}.category AND m.model_name = {STAGING_TABLE}.model'''),
+}
+
+ACTION_MESSAGES = {
+    'add': 'Added',
+    'rename': 'Renamed or moved',
+    'keep': 'Unchanged',
+    'invalid': 'Missing name or unknown category/model',
+    'duplicate': 'Repeats an earlier row of the file',
+    'name_taken': 'Name used by a row missing from the file (import with delete missing)',
+}
+
+
+def export_catalog_rows(catalog):
+    """Catalog snapshot as {entity: [row dict, ...]} in the import format"""
+    return {
+        'categories': [{'id': row[0], 'name': row[1]} for row in catalog['categories']],
+        'models': [{'id': row[0], 'category': row[2], 'name': row[1]} for row in catalog['models']],
+        'display_types': [{'id': row[0], 'category': row[2], 'name': row[1]} for row in catalog['display_types']],
+        'materials': [{'id': row[0], 'category': row[3], 'model': row[2], 'name': row[1]}
+                      for row in catalog['pop_materials']],
+    }
+
+
+def build_catalog_xlsx(catalog):
+    """XLSX export of the catalog, built once per catalog version"""
+    if 'export_xlsx' not in catalog:
+        wb = Workbook(write_only=True)
+        for entity, rows in export_catalog_rows(catalog).items():
+            sheet_name, columns = CATALOG_SHEETS[entity]
+            ws = wb.create_sheet(sheet_name)
+            ws.append(list(columns))
+            for row in rows:
+                ws.append([row[column] for column in columns])
+        output = BytesIO()
+        wb.save(output)
+        catalog['export_xlsx'] = output.getvalue()
+    return catalog['export_xlsx']
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    return str(value).strip()
+
+
+def _normalize_rows(entity, rows):
+    _, columns = CATALOG_SHEETS[entity]
+    normalized = []
+    for row in rows:
+        item_id = _clean(row.get('id'))
+        if item_id.endswith('.0'):  # أرقام Excel
+            item_id = item_id[:-2]
+        normalized.append({
+            'id': int(item_id) if item_id.isdigit() else None,
+            'category': _clean(row.get('category')),
+            'model': _clean(row.get('model')),
+            'name': _clean(row.get('name')),
+        })
+    return normalized
+
+
+def read_catalog_file(file):
+    """Read an XLSX or JSON catalog upload into {entity: [row dict, ...]}
+
+    Entities missing from the file are left out and not touched by the
+    import. Raises ValueError when the file cannot be used.
+    """
+    extension = os.path.splitext(file.filename or '')[1].lower()
+    data = {}
+
+    if extension == '.json':
+        payload = json.load(file)
+        if not isinstance(payload, dict):
+            raise ValueError('JSON catalog must be an object of entity lists')
+        for entity in CATALOG_SHEETS:
+            if entity in payload:
+                data[entity] = _normalize_rows(entity, payload[entity])
+    elif extension == '.xlsx':
+        sheets = pd.read_excel(file, sheet_name=None, dtype=str, keep_default_na=False)
+        for entity, (sheet_name, columns) in CATALOG_SHEETS.items():
+            if sheet_name not in sheets:
+                continue
+            frame = sheets[sheet_name]
+            frame.columns = [str(column).strip().lower() for column in frame.columns]
+            missing = [column for column in columns if column not in frame.columns]
+            if missing:
+                raise ValueError(f"Sheet {sheet_name} is missing columns: {', '.join(missing)}")
+            data[entity] = _normalize_rows(entity, frame.to_dict('records'))
+    else:
+        raise ValueError('Only .xlsx and .json files are supported')
+
+    if not data:
+        raise ValueError('The file has no catalog sheets')
+    return data
+
+
+def _create_staging_table(cursor, db_type):
+    cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+    on_commit = ' ON COMMIT DROP' if db_type == 'postgresql' else ''
+    cursor.execute(f'''CREATE TEMP TABLE {STAGING_TABLE} (
+        entity TEXT NOT NULL,
+        row_no INTEGER NOT NULL,
+        item_id INTEGER,
+        category TEXT NOT NULL,
+        model TEXT NOT NULL,
+        name TEXT NOT NULL,
+        parent_id INTEGER,
+        action TEXT,
+        PRIMARY KEY (entity, row_no)
+    ){on_commit}''')
+
+
+def _diff_entity(cursor, db_type, entity, delete_missing):
+    """Classify the staged rows of one entity with one of ACTION_MESSAGES"""
+    table, name_column, parent_column, parent_query = CATALOG_ENTITIES[entity]
+    staged = f"{STAGING_TABLE}.entity = '{entity}'"
+    same_parent = f' AND t.{parent_column} = {STAGING_TABLE}.parent_id' if parent_column else ''
+    moved = f' OR t.{parent_column} <> {STAGING_TABLE}.parent_id' if parent_column else ''
+
+    steps = []
+    if parent_column:
+        steps.append(f'UPDATE {STAGING_TABLE} SET parent_id = ({parent_query}) WHERE {staged}')
+    steps += [
+        f'''UPDATE {STAGING_TABLE} SET action = 'invalid'
+            WHERE {staged} AND (name = ''{' OR parent_id IS NULL' if parent_column else ''})''',
+        # معرفات غير موجودة (أو من قاعدة بيانات أخرى) تعامل كصفوف جديدة
+        f'''UPDATE {STAGING_TABLE} SET item_id = NULL
+            WHERE {staged} AND item_id IS NOT NULL AND item_id NOT IN (SELECT id FROM {table})''',
+        f'''UPDATE {STAGING_TABLE} SET action = 'duplicate'
+            WHERE {staged} AND action IS NULL AND EXISTS (
+                SELECT 1 FROM {STAGING_TABLE} e
+                WHERE e.entity = '{entity}' AND e.row_no < {STAGING_TABLE}.row_no
+                  AND (e.action IS NULL OR e.action = 'duplicate')
+                  AND (e.item_id = {STAGING_TABLE}.item_id
+                       OR (e.name = {STAGING_TABLE}.name
+                           {f'AND e.parent_id = {STAGING_TABLE}.parent_id' if parent_column else ''})))''',
+        # صفوف بدون معرف تطابق بالاسم، ما لم يطالب صف آخر بنفس المعرف صراحة
+        f'''UPDATE {STAGING_TABLE}
+            SET item_id = (SELECT t.id FROM {table} t WHERE t.{name_column} = {STAGING_TABLE}.name{same_parent})
+            WHERE {staged} AND action IS NULL AND item_id IS NULL''',
+        f'''UPDATE {STAGING_TABLE} SET item_id = NULL
+            WHERE {staged} AND action IS NULL AND item_id IN (
+                SELECT e.item_id FROM {STAGING_TABLE} e
+                WHERE e.entity = '{entity}' AND e.action IS NULL AND e.row_no <> {STAGING_TABLE}.row_no
+                  AND e.item_id = {STAGING_TABLE}.item_id AND e.name <> {STAGING_TABLE}.name)''',
+    ]
+    if not delete_missing:
+        # الاسم محجوز لصف لن يحذف لأنه غير موجود في الملف (قيد UNIQUE)
+        steps.append(f'''UPDATE {STAGING_TABLE} SET action = 'name_taken'
+            WHERE {staged} AND action IS NULL AND EXISTS (
+                SELECT 1 FROM {table} t
+                WHERE t.{name_column} = {STAGING_TABLE}.name{same_parent}
+                  AND t.id <> COALESCE({STAGING_TABLE}.item_id, 0)
+                  AND t.id NOT IN (SELECT e.item_id FROM {STAGING_TABLE} e
+                                   WHERE e.entity = '{entity}' AND e.action IS NULL
+                                     AND e.item_id IS NOT NULL))''')
+    steps += [
+        f'''UPDATE {STAGING_TABLE} SET action = 'rename'
+            WHERE {staged} AND action IS NULL AND item_id IS NOT NULL AND EXISTS (
+                SELECT 1 FROM {table} t
+                WHERE t.id = {STAGING_TABLE}.item_id
+                  AND (t.{name_column} <> {STAGING_TABLE}.name{moved}))''',
+        f"UPDATE {STAGING_TABLE} SET action = 'keep' WHERE {staged} AND action IS NULL AND item_id IS NOT NULL",
+        f"UPDATE {STAGING_TABLE} SET action = 'add' WHERE {staged} AND action IS NULL",
+    ]
+    for step in steps:
+        cursor.execute(step)
+
+
+def _apply_entity(cursor, db_type, entity, current_time, delete_missing):
+    """Apply the diff of one entity; returns the rows missing from the file"""
+    table, name_column, parent_column, _ = CATALOG_ENTITIES[entity]
+    listed = f'''SELECT item_id FROM {STAGING_TABLE}
+                 WHERE entity = '{entity}' AND action IN ('keep', 'rename', 'name_taken')
+                   AND item_id IS NOT NULL'''
+
+    cursor.execute(f'SELECT id, {name_column} FROM {table} WHERE id NOT IN ({listed}) ORDER BY id')
+    missing = [{'id': item_id, 'name': name} for item_id, name in cursor.fetchall()]
+
+    # الحذف أولاً حتى يمكن إعادة استخدام أسماء الصفوف المحذوفة
+    if delete_missing and missing:
+        cursor.execute(f'DELETE FROM {table} WHERE id NOT IN ({listed})')
+
+    parent_update = ''
+    if parent_column:
+        parent_update = f''', {parent_column} = (SELECT s.parent_id FROM {STAGING_TABLE} s
+                                                  WHERE s.entity = '{entity}' AND s.item_id = {table}.id
+                                                    AND s.action = 'rename')'''
+    cursor.execute(f'''UPDATE {table}
+                       SET {name_column} = (SELECT s.name FROM {STAGING_TABLE} s
+                                            WHERE s.entity = '{entity}' AND s.item_id = {table}.id
+                                              AND s.action = 'rename'){parent_update}
+                       WHERE id IN (SELECT item_id FROM {STAGING_TABLE}
+                                    WHERE entity = '{entity}' AND action = 'rename')''')
+
+    columns = f'{name_column}, {parent_column}, created_date' if parent_column else f'{name_column}, created_date'
+    values = 'name, parent_id, ?' if parent_column else 'name, ?'
+    cursor.execute(adapt_query(f'''INSERT INTO {table} ({columns})
+                                   SELECT {values} FROM {STAGING_TABLE}
+                                   WHERE entity = '{entity}' AND action = 'add' ''', db_type), (current_time,))
+    return missing
+
+
+def import_catalog(cursor, db_type, data, current_time, delete_missing=False):
+    """Diff and apply a catalog file read by read_catalog_file
+
+    Entities are handled parent first, so models can refer to categories
+    added or renamed by the same file. Rows of the current tables that the
+    file leaves out are reported as missing and deleted only with
+    delete_missing (deleting cascades to their children). Runs in the
+    caller's transaction; roll it back for a dry run.
+    """
+    _create_staging_table(cursor, db_type)
+    staged = [(entity, row_no, row['id'], row['category'], row['model'], row['name'])
+              for entity, rows in data.items() for row_no, row in enumerate(rows, 1)]
+    cursor.executemany(adapt_query(f'''INSERT INTO {STAGING_TABLE}
+                                       (entity, row_no, item_id, category, model, name)
+                                       VALUES (?, ?, ?, ?, ?, ?)''', db_type), staged)
+
+    report = {}
+    for entity in CATALOG_ENTITIES:
+        if entity not in data:
+            continue
+        _diff_entity(cursor, db_type, entity, delete_missing)
+        missing = _apply_entity(cursor, db_type, entity, current_time, delete_missing)
+
+        cursor.execute(adapt_query(f'''SELECT row_no, item_id, category, model, name, action FROM {STAGING_TABLE}
+                                       WHERE entity = ? ORDER BY row_no''', db_type), (entity,))
+        rows = [{
+            'row': row_no,
+            'id': item_id,
+            'category': category,
+            'model': model,
+            'name': name,
+            'action': action,
+            'message': ACTION_MESSAGES[action],
+        } for row_no, item_id, category, model, name, action in cursor.fetchall()]
+
+        summary = dict.fromkeys(ACTION_MESSAGES, 0)
+        for row in rows:
+            summary[row['action']] += 1
+        summary['deleted' if delete_missing else 'missing'] = len(missing)
+        report[entity] = {
+            'summary': summary,
+            'rows': [row for row in rows if row['action'] != 'keep'],
+            'deleted' if delete_missing else 'missing': missing,
+        }
+
+    return report
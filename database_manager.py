@@ -0,0 +1,309 @@
+"""
+Database connection management
+
+PostgreSQL connections come from a process-wide pool that is safe to share
+between threads and is rebuilt automatically after gunicorn forks a worker.
+Connections handed out during a request are tracked on ``flask.g`` and are
+returned to the pool when the app context is torn down.
+
+SQLite uses a single connection per request, opened in WAL mode with tuned
+PRAGMAs and closed at teardown.
+"""
+
+import os
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+from flask import g, has_app_context
+
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+    from psycopg2 import extensions as pg_extensions
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+# يمكن استيراد هذه الوحدة قبل app.py (مثلاً من gunicorn.conf.py)
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+SQLITE_DATABASE_PATH = '/app/data/database.db'
+
+# إعدادات مجمع الاتصالات
+POOL_SETTINGS = {
+    'MIN_CONNECTIONS': int(os.getenv('DB_POOL_MIN', 1)),
+    'MAX_CONNECTIONS': int(os.getenv('DB_POOL_MAX', 10)),
+    'CHECKOUT_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'HEALTH_CHECK': os.getenv('DB_POOL_HEALTH_CHECK', 'true').lower() != 'false',
+    'CONNECT_TIMEOUT': int(os.getenv('DB_CONNECT_TIMEOUT', 10)),
+}
+
+# إعدادات SQLite (تطبق على كل اتصال)
+SQLITE_SETTINGS = {
+    'BUSY_TIMEOUT_MS': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'CACHE_SIZE_KB': int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000)),
+    'MMAP_SIZE': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+
+
+# مجمعات ورثتها العملية من العملية الأم قبل التفرع (لا تغلق ولا تحرر)
+_INHERITED_POOLS = []
+
+
+class PostgresConnectionPool:
+    """Thread-safe, fork-aware pool of PostgreSQL connections"""
+
+    def __init__(self, database_url, minconn=None, maxconn=None):
+        self.database_url = database_url
+        self.minconn = minconn if minconn is not None else POOL_SETTINGS['MIN_CONNECTIONS']
+        self.maxconn = maxconn if maxconn is not None else POOL_SETTINGS['MAX_CONNECTIONS']
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = None
+        self._pid = None
+
+    def _connect_kwargs(self):
+        url = urlparse(self.database_url)
+        return {
+            'host': url.hostname,
+            'port': url.port,
+            'database': url.path[1:],
+            'user': url.username,
+            'password': url.password,
+            'sslmode': 'require',
+            'connect_timeout': POOL_SETTINGS['CONNECT_TIMEOUT'],
+        }
+
+    def _ensure_pool(self):
+        """Create the pool lazily, and again in every forked child process"""
+        pid = os.getpid()
+        if self._pool is not None and self._pid == pid:
+            return self._pool
+
+        with self._lock:
+            if self._pool is None or self._pid != pid:
+                # الاتصالات الموروثة من العملية الأم تشترك معها في نفس المقبس.
+                # إذا جمع المجمع الموروث كـ garbage يغلق psycopg2 اتصالاته ويرسل
+                # Terminate على المقبس المشترك، لذلك نبقي مرجعاً له لا يحرر أبداً
+                if self._pool is not None:
+                    _INHERITED_POOLS.append(self._pool)
+                self._pool = pg_pool.ThreadedConnectionPool(
+                    self.minconn, self.maxconn, **self._connect_kwargs()
+                )
+                self._slots = threading.BoundedSemaphore(self.maxconn)
+                self._pid = pid
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not POOL_SETTINGS['HEALTH_CHECK']:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check a healthy connection out of the pool"""
+        pool = self._ensure_pool()
+        if not self._slots.acquire(timeout=POOL_SETTINGS['CHECKOUT_TIMEOUT']):
+            raise pg_pool.PoolError('Timed out waiting for a free database connection')
+
+        try:
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                # استبدال الاتصال المعطوب باتصال جديد
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection to the pool, discarding it if it is broken"""
+        if self._pid != os.getpid():
+            # اتصال من عملية سابقة للتفرع - لا يخص هذا المجمع
+            return
+
+        try:
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                return
+            if conn.get_transaction_status() != pg_extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.putconn(conn)
+        except psycopg2.Error:
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pid = None
+
+
+class PooledConnection:
+    """Proxy around a pooled connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def released(self):
+        return self._released
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.putconn(self._conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_postgres_pool(database_url):
+    """Get the process-wide pool for a database URL"""
+    pool = _pools.get(database_url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(database_url)
+            if pool is None:
+                pool = PostgresConnectionPool(database_url)
+                _pools[database_url] = pool
+    return pool
+
+
+def get_postgres_connection(database_url):
+    """Check out a pooled PostgreSQL connection
+
+    Inside an app context the connection is tracked on ``g`` so that it is
+    returned to the pool at teardown even if the caller never closes it.
+    """
+    pool = get_postgres_pool(database_url)
+    conn = PooledConnection(pool, pool.getconn())
+
+    if has_app_context():
+        if '_pooled_connections' not in g:
+            g._pooled_connections = []
+        g._pooled_connections.append(conn)
+
+    return conn
+
+
+class RequestConnection:
+    """Proxy for the request's SQLite connection; close() waits for teardown"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        # الاتصال مشترك بين جميع استدعاءات الطلب ويغلق في teardown
+        pass
+
+
+_wal_enabled_paths = set()
+
+
+def _open_sqlite_connection(database_path):
+    """Open a SQLite connection with the project's PRAGMAs applied"""
+    os.makedirs(os.path.dirname(database_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(database_path, timeout=SQLITE_SETTINGS['BUSY_TIMEOUT_MS'] / 1000)
+
+    # وضع WAL يحفظ في ملف قاعدة البيانات نفسه، فيكفي تفعيله مرة لكل عملية
+    if database_path not in _wal_enabled_paths:
+        conn.execute('PRAGMA journal_mode=WAL')
+        _wal_enabled_paths.add(database_path)
+
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_SETTINGS['BUSY_TIMEOUT_MS']}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_SETTINGS['CACHE_SIZE_KB']}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_SETTINGS['MMAP_SIZE']}")
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_sqlite_connection(database_path):
+    """Get the SQLite connection for the current request
+
+    Outside an app context a private connection is returned and the caller
+    is responsible for closing it.
+    """
+    if not has_app_context():
+        return _open_sqlite_connection(database_path)
+
+    conn = g.get('_sqlite_connection')
+    if conn is None:
+        conn = _open_sqlite_connection(database_path)
+        g._sqlite_connection = conn
+    return RequestConnection(conn)
+
+
+def close_request_connections(exception=None):
+    """Release every connection opened by this app context"""
+    connections = g.pop('_pooled_connections', [])
+    for conn in connections:
+        if not conn.released:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"⚠️ خطأ في إرجاع اتصال قاعدة البيانات: {e}")
+
+    sqlite_conn = g.pop('_sqlite_connection', None)
+    if sqlite_conn is not None:
+        try:
+            if sqlite_conn.in_transaction:
+                sqlite_conn.rollback()
+            sqlite_conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ خطأ في إغلاق اتصال SQLite: {e}")
+
+
+def init_app(app):
+    """Register connection cleanup with the Flask app"""
+    app.teardown_appcontext(close_request_connections)
+
+
+def get_connection():
+    """Get a connection for the configured backend as (conn, db_type)"""
+    if DATABASE_URL and PSYCOPG2_AVAILABLE:
+        return get_postgres_connection(DATABASE_URL), 'postgresql'
+    return get_sqlite_connection(SQLITE_DATABASE_PATH), 'sqlite'
+
+
+def adapt_query(query, db_type):
+    """Convert SQLite-style ? placeholders for the target backend"""
+    if db_type == 'postgresql':
+        return query.replace('?', '%s')
+    return query
+
+
+def insert_or_ignore(db_type, table, columns):
+    """Build an INSERT that skips rows violating a unique constraint"""
+    column_list = ', '.join(columns)
+    placeholders = ', '.join('?' for _ in columns)
+    if db_type == 'postgresql':
+        return f'INSERT INTO {table} ({column_list}) VALUES ({placeholders}) ON CONFLICT DO NOTHING'
+    return f'INSERT OR IGNORE INTO {table} ({column_list}) VALUES ({placeholders})'
@@ -0,0 +1,341 @@
+"""
+Filters shared by the admin dashboard and every export route
+
+All routes that list data_entries build their WHERE clause here so that the
+data_entries indexes (and the EXPLAIN check below) cover exactly the
+queries the application runs.
+"""
+
+import re
+from itertools import combinations
+
+import database_manager
+from timezone_config import local_day_bounds
+
+FILTER_KEYS = ('employee', 'branch', 'model', 'date_from', 'date_to', 'search')
+
+# الأسماء الحالية من الكتالوج عبر model_id / display_type_id (إعادة التسمية
+# لا تعدل data_entries)، والاسم المحفوظ وقت الإدخال إذا حذف عنصر الكتالوج
+MODEL_LABEL = '''COALESCE((SELECT c.category_name || ' - ' || m.model_name
+                           FROM models m JOIN categories c ON c.id = m.category_id
+                           WHERE m.id = data_entries.model_id), model)'''
+DISPLAY_TYPE_LABEL = '''COALESCE((SELECT d.display_type_name FROM display_types d
+                                  WHERE d.id = data_entries.display_type_id), display_type)'''
+
+# أعمدة data_entries للتصدير؛ قائمة المواد تضاف من entry_materials
+# (with_entry_materials) في الموضعين 7 و 8 والصور من entry_images
+# (with_entry_images) في الموضع 9 كما تتوقع دوال تصدير Excel
+EXPORT_COLUMNS = f'''id, employee_name, employee_code, branch, shop_code, {MODEL_LABEL},
+                    {DISPLAY_TYPE_LABEL}, date, comment'''
+
+# أعمدة صفحات /api/entries: أعمدة التصدير + entry_ts لبناء المؤشر التالي
+PAGE_COLUMNS = EXPORT_COLUMNS + ', entry_ts'
+
+ORDER_BY = ' ORDER BY entry_ts DESC, id DESC'
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# فلتر -> العمود المقابل في data_entries_fts (SQLite) أو data_entries
+COLUMN_FILTERS = (
+    ('employee', 'employee_name'),
+    ('branch', 'branch'),
+)
+
+SEARCH_LIKE_COLUMNS = ('employee_name', 'branch', 'model', 'comment')
+
+# الموديلات التي يطابق اسمها الحالي "الفئة - الموديل" النص المطلوب
+MODELS_LIKE = '''model_id IN (SELECT m.id FROM models m JOIN categories c ON c.id = m.category_id
+                              WHERE c.category_name || ' - ' || m.model_name LIKE ?)'''
+
+# أسماء المواد في entry_materials (فهرس pg_trgm على materials.material_name)
+MATERIALS_LIKE = '''id IN (SELECT em.entry_id FROM entry_materials em
+                           JOIN materials m ON m.id = em.material_id
+                           WHERE m.material_name LIKE ?)'''
+
+# فهرس trigram لا يطابق النصوص الأقصر من 3 أحرف
+MIN_TRIGRAM_LENGTH = 3
+
+_sqlite_fts_enabled = None
+
+
+def sqlite_fts_enabled():
+    """Whether migration 0006 could create the FTS5 trigram table"""
+    global _sqlite_fts_enabled
+    if _sqlite_fts_enabled is None:
+        conn, db_type = database_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'data_entries_fts'")
+            _sqlite_fts_enabled = cursor.fetchone() is not None
+        finally:
+            conn.close()
+    return _sqlite_fts_enabled
+
+
+def get_entry_filters(args):
+    """Read the filter parameters from request.args"""
+    return {key: args.get(key, '').strip() for key in FILTER_KEYS}
+
+
+def load_entry_facets(cursor):
+    """Filter dropdown options as {facet: [(value, label, entry_count), ...]}
+
+    Read from entry_facets (migration 0007), which triggers on data_entries
+    keep up to date, instead of SELECT DISTINCT over the whole table. Model
+    values are model ids; their label is the current catalog name.
+    """
+    facets = {'employee': [], 'branch': [], 'model': []}
+    cursor.execute('''SELECT f.facet, f.value, COALESCE(c.category_name || ' - ' || m.model_name, f.value),
+                             f.entry_count
+                      FROM entry_facets f
+                      LEFT JOIN models m ON f.facet = 'model' AND CAST(m.id AS TEXT) = f.value
+                      LEFT JOIN categories c ON c.id = m.category_id''')
+    for facet, value, label, entry_count in cursor.fetchall():
+        facets.setdefault(facet, []).append((value, label, entry_count))
+    for options in facets.values():
+        options.sort(key=lambda option: option[1])
+    return facets
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_filter_clause(filters, db_type):
+    """Build the AND-ed conditions and parameters for the given filters
+
+    Substring filters go through the search index: an FTS5 trigram MATCH on
+    SQLite, and LIKE served by pg_trgm GIN indexes on PostgreSQL. Matching
+    is the same LIKE '%term%' substring match either way.
+    """
+    clause = ''
+    params = []
+    use_fts = db_type == 'sqlite' and sqlite_fts_enabled()
+    fts_terms = []
+
+    for key, column in COLUMN_FILTERS:
+        term = filters.get(key)
+        if not term:
+            continue
+        if use_fts and len(term) >= MIN_TRIGRAM_LENGTH:
+            fts_terms.append(f'{column} : {_fts_phrase(term)}')
+        else:
+            clause += f' AND {column} LIKE ?'
+            params.append(f'%{term}%')
+
+    if fts_terms:
+        clause += ' AND id IN (SELECT rowid FROM data_entries_fts WHERE data_entries_fts MATCH ?)'
+        params.append(' AND '.join(fts_terms))
+
+    # قائمة الموديلات في لوحة التحكم ترسل model_id، والروابط القديمة ترسل الاسم
+    model = filters.get('model')
+    if model:
+        if model.isdigit():
+            clause += ' AND model_id = ?'
+            params.append(int(model))
+        else:
+            # والإدخالات التي حذف موديلها تبحث بالاسم المحفوظ وقت الإدخال
+            clause += f' AND ({MODELS_LIKE} OR (model_id IS NULL AND model LIKE ?))'
+            params.extend([f'%{model}%', f'%{model}%'])
+
+    # البحث العام يشمل التعليقات وأسماء المواد والاسم الحالي للموديل أيضاً
+    search = filters.get('search')
+    if search:
+        if use_fts and len(search) >= MIN_TRIGRAM_LENGTH:
+            clause += (' AND (id IN (SELECT rowid FROM data_entries_fts WHERE data_entries_fts MATCH ?)'
+                       f' OR {MODELS_LIKE})')
+            params.extend([_fts_phrase(search), f'%{search}%'])
+        else:
+            conditions = [f'{column} LIKE ?' for column in SEARCH_LIKE_COLUMNS] + [MATERIALS_LIKE, MODELS_LIKE]
+            clause += ' AND (' + ' OR '.join(conditions) + ')'
+            params.extend([f'%{search}%'] * len(conditions))
+
+    # نطاق نصف مفتوح [بداية يوم date_from, بداية اليوم التالي لـ date_to) بتوقيت UTC
+    start, end = local_day_bounds(filters.get('date_from'), filters.get('date_to'))
+
+    if start is not None:
+        clause += ' AND entry_ts >= ?'
+        params.append(start)
+
+    if end is not None:
+        clause += ' AND entry_ts < ?'
+        params.append(end)
+
+    return clause, params
+
+
+def build_entries_query(filters, db_type, columns='*'):
+    """Build the filtered, newest-first data_entries query"""
+    clause, params = build_filter_clause(filters, db_type)
+    query = f'SELECT {columns} FROM data_entries WHERE 1=1{clause}{ORDER_BY}'
+    return query, params
+
+
+def build_entries_count_query(filters, db_type):
+    """Build the COUNT(*) query for the filtered entries"""
+    clause, params = build_filter_clause(filters, db_type)
+    return f'SELECT COUNT(*) FROM data_entries WHERE 1=1{clause}', params
+
+
+def facet_entry_count(cursor, db_type, filters):
+    """Number of filtered entries read from entry_facets, or None if the filters need a COUNT
+
+    Exact without filters (every entry has an employee name) and for a
+    single model-id filter; both are one small lookup however large
+    data_entries is.
+    """
+    active = {key: value for key, value in filters.items() if value}
+    if not active:
+        cursor.execute("SELECT COALESCE(SUM(entry_count), 0) FROM entry_facets WHERE facet = 'employee'")
+        return cursor.fetchone()[0]
+    if list(active) == ['model'] and active['model'].isdigit():
+        cursor.execute(database_manager.adapt_query(
+            "SELECT entry_count FROM entry_facets WHERE facet = 'model' AND value = ?", db_type), (active['model'],))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    return None
+
+
+def encode_cursor(entry_ts, entry_id):
+    """Opaque keyset cursor pointing just after the given row"""
+    if entry_ts is None:
+        # لا يحدث بعد الترحيل 0015؛ مؤشر 'None.<id>' سيرفض في الصفحة التالية
+        raise ValueError(f'Entry {entry_id} has no entry_ts; apply pending migrations')
+    return f'{entry_ts}.{entry_id}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor from encode_cursor; raises ValueError if malformed"""
+    entry_ts, entry_id = cursor.split('.')
+    return int(entry_ts), int(entry_id)
+
+
+def build_entries_page_query(filters, db_type, columns=PAGE_COLUMNS, cursor=None, limit=PAGE_SIZE):
+    """Build one keyset page of the filtered, newest-first query
+
+    The cursor continues after the last row of the previous page by
+    (entry_ts, id), so every page is an index range scan no matter how deep
+    the client has scrolled. entry_ts is never NULL (migration 0015), so
+    the cursor is always numeric and every row falls inside some page.
+    """
+    clause, params = build_filter_clause(filters, db_type)
+    if cursor:
+        entry_ts, entry_id = decode_cursor(cursor)
+        # entry_ts <= ? مكرر منطقياً لكنه يجعل الصفحة نطاقاً في الفهرس (OR وحده لا)
+        clause += ' AND entry_ts <= ? AND (entry_ts < ? OR (entry_ts = ? AND id < ?))'
+        params.extend([entry_ts, entry_ts, entry_ts, entry_id])
+    query = f'SELECT {columns} FROM data_entries WHERE 1=1{clause}{ORDER_BY} LIMIT ?'
+    params.append(limit)
+    return query, params
+
+
+# نتيجة فحص الخطة: بحث في فهرس، مسح كامل لفهرس بترتيبه (يقرأ كل الصفوف ما لم يوجد LIMIT)، أو مسح كامل لجدول
+PLAN_SEARCH = 'search'
+PLAN_INDEX_SCAN = 'index_scan'
+PLAN_FULL_SCAN = 'full_scan'
+
+_PLAN_RANK = {PLAN_SEARCH: 0, PLAN_INDEX_SCAN: 1, PLAN_FULL_SCAN: 2}
+
+# SQLite: SCAN <table or alias> [USING [COVERING] INDEX ...]
+_SQLITE_SCAN = re.compile(r'\bSCAN (\S+)( USING (COVERING )?INDEX\b)?')
+# PostgreSQL: عقدة قراءة جدول أو فهرس وما يليها من شروط
+_PG_SCAN_NODE = re.compile(r'\b(Seq Scan|Index Only Scan|Index Scan|Bitmap Index Scan)\b(?: Backward)?(?: using \S+)? on (\S+)')
+
+
+def _classify_scan(table, uses_index, has_cond):
+    if has_cond:
+        return PLAN_SEARCH
+    if not uses_index:
+        return PLAN_FULL_SCAN
+    # مسح data_entries بترتيب فهرس مقبول (LIMIT يوقفه)؛ مسح جدول مرتبط أو استعلام فرعي يقرأه كله
+    return PLAN_INDEX_SCAN if table == 'data_entries' else PLAN_FULL_SCAN
+
+
+def _classify_plan(plan, db_type):
+    """Worst scan in the plan, judged the same way on both backends
+
+    Every table read counts, including joined and subquery tables
+    (entry_materials, models), not only data_entries.
+    """
+    scans = []
+    if db_type == 'postgresql':
+        nodes = []
+        for line in plan.splitlines():
+            match = _PG_SCAN_NODE.search(line)
+            if match:
+                nodes.append([match.group(1), match.group(2), False])
+            elif '->' in line:
+                nodes.append(None)
+            elif nodes and nodes[-1] is not None and 'Index Cond' in line:
+                nodes[-1][2] = True
+        for node in nodes:
+            if node is None:
+                continue
+            kind, table, has_cond = node
+            if kind == 'Bitmap Index Scan':
+                # "on" يسمي الفهرس هنا وليس الجدول
+                scans.append(PLAN_SEARCH if has_cond else PLAN_INDEX_SCAN)
+            else:
+                scans.append(_classify_scan(table, kind != 'Seq Scan', has_cond))
+    else:
+        for line in plan.splitlines():
+            match = _SQLITE_SCAN.search(line)
+            if match and 'VIRTUAL TABLE' not in line and match.group(1) != 'CONSTANT':
+                scans.append(_classify_scan(match.group(1), bool(match.group(2)), False))
+    return max(scans, key=_PLAN_RANK.get, default=PLAN_SEARCH)
+
+
+SUBSTRING_FILTERS = ('employee', 'branch', 'search')
+
+
+def _sample_filters(keys, term='abc'):
+    samples = {
+        'employee': term,
+        'branch': term,
+        'model': '1',
+        'date_from': '2024-01-01',
+        'date_to': '2024-01-31',
+        'search': term,
+    }
+    return {key: samples[key] for key in keys}
+
+
+def explain_entry_filters(conn, db_type):
+    """Check that every filter combination is served by an index
+
+    Both the full query and a keyset page of it (marked with a 'cursor' key)
+    are checked. Returns a list of (filter keys, PLAN_* result, plan text). On
+    PostgreSQL sequential scans are disabled for the check so that the result
+    reflects whether an index *can* serve the query, independent of table size.
+    """
+    cursor = conn.cursor()
+    results = []
+
+    if db_type == 'postgresql':
+        cursor.execute('SET LOCAL enable_seqscan = off')
+
+    queries = []
+    for size in range(len(FILTER_KEYS) + 1):
+        for keys in combinations(FILTER_KEYS, size):
+            variants = [(keys, _sample_filters(keys))]
+            if set(keys) & set(SUBSTRING_FILTERS):
+                # النصوص الأقصر من MIN_TRIGRAM_LENGTH لا تمر عبر فهرس البحث
+                variants.append((keys + ('short terms',), _sample_filters(keys, 'ab')))
+            for label, filters in variants:
+                queries.append((label, build_entries_query(filters, db_type, EXPORT_COLUMNS)))
+                queries.append((label + ('cursor',),
+                                build_entries_page_query(filters, db_type, cursor=encode_cursor(1704067200, 1000))))
+
+    for keys, (query, params) in queries:
+        if db_type == 'postgresql':
+            cursor.execute('EXPLAIN ' + query.replace('?', '%s'), params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+
+        results.append((keys, _classify_plan(plan, db_type), plan))
+
+    conn.rollback()
+    return results
@@ -0,0 +1,117 @@
+"""
+Per-entry POP material checklist (materials / entry_materials tables)
+
+Each data entry has one entry_materials row per material of its model,
+with present = selected on the form. Readers load the checklist in batched
+queries, and material compliance questions are answered with indexed SQL
+aggregates instead of splitting comma-joined strings.
+"""
+
+import database_manager
+from database_manager import adapt_query
+from entry_filters import build_filter_clause
+
+# حد آمن لعدد المتغيرات في IN (...) على SQLite
+ID_BATCH_SIZE = 500
+
+
+def ensure_materials(cursor, db_type, names):
+    """Return {material_name: id}, creating missing materials"""
+    names = sorted(set(names))
+    if not names:
+        return {}
+
+    cursor.executemany(adapt_query(database_manager.insert_or_ignore(db_type, 'materials', ('material_name',)),
+                                   db_type),
+                       [(name,) for name in names])
+
+    material_ids = {}
+    for start in range(0, len(names), ID_BATCH_SIZE):
+        batch = names[start:start + ID_BATCH_SIZE]
+        placeholders = ', '.join('?' for _ in batch)
+        cursor.execute(adapt_query(f'SELECT id, material_name FROM materials WHERE material_name IN ({placeholders})',
+                                   db_type), batch)
+        material_ids.update({name: material_id for material_id, name in cursor.fetchall()})
+    return material_ids
+
+
+def save_entry_materials(cursor, db_type, checklists):
+    """Store checklists given as [(entry_id, selected, unselected), ...]"""
+    material_ids = ensure_materials(cursor, db_type, [
+        name for _, selected, unselected in checklists for name in selected + unselected
+    ])
+
+    rows = []
+    for entry_id, selected, unselected in checklists:
+        seen = set()
+        items = [(name, True) for name in selected] + [(name, False) for name in unselected]
+        for position, (name, present) in enumerate(items):
+            if name in seen:
+                continue
+            seen.add(name)
+            rows.append((entry_id, material_ids[name], present, position))
+
+    cursor.executemany(adapt_query('''INSERT INTO entry_materials (entry_id, material_id, present, position)
+                                      VALUES (?, ?, ?, ?)''', db_type), rows)
+
+
+def load_entry_materials(cursor, db_type, entry_ids):
+    """Return {entry_id: (selected names, missing names)} in form order"""
+    checklists = {entry_id: ([], []) for entry_id in entry_ids}
+    entry_ids = list(checklists)
+
+    for start in range(0, len(entry_ids), ID_BATCH_SIZE):
+        batch = entry_ids[start:start + ID_BATCH_SIZE]
+        placeholders = ', '.join('?' for _ in batch)
+        cursor.execute(adapt_query(f'''SELECT em.entry_id, m.material_name, em.present
+                                       FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                                       WHERE em.entry_id IN ({placeholders})
+                                       ORDER BY em.entry_id, em.position''', db_type), batch)
+        for entry_id, name, present in cursor.fetchall():
+            checklists[entry_id][0 if present else 1].append(name)
+
+    return checklists
+
+
+def with_entry_materials(cursor, db_type, rows):
+    """Insert the checklist into EXPORT_COLUMNS rows at positions 7 and 8
+
+    Rows keep the layout the Excel builders expect, with lists of selected
+    and missing material names in place of the old comma-joined strings.
+    """
+    checklists = load_entry_materials(cursor, db_type, [row[0] for row in rows])
+    return [tuple(row[:7]) + checklists[row[0]] + tuple(row[7:]) for row in rows]
+
+
+def _entries_subquery(filters, db_type):
+    clause, params = build_filter_clause(filters, db_type)
+    if not clause:
+        return '', []
+    return f' AND em.entry_id IN (SELECT id FROM data_entries WHERE 1=1{clause})', params
+
+
+def material_compliance(cursor, db_type, filters):
+    """Per material: entries checked, present and missing, for the filtered entries"""
+    subquery, params = _entries_subquery(filters, db_type)
+    cursor.execute(adapt_query(f'''SELECT m.material_name, COUNT(*),
+                                          SUM(CASE WHEN em.present THEN 1 ELSE 0 END)
+                                   FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                                   WHERE 1=1{subquery}
+                                   GROUP BY m.material_name
+                                   ORDER BY m.material_name''', db_type), params)
+    return [{'material': name, 'entries': total, 'present': present, 'missing': total - present}
+            for name, total, present in cursor.fetchall()]
+
+
+def branches_missing_material(cursor, db_type, material_name, filters):
+    """Branches whose entries reported the material as missing, with counts"""
+    subquery, params = _entries_subquery(filters, db_type)
+    cursor.execute(adapt_query(f'''SELECT d.branch, COUNT(*)
+                                   FROM materials m
+                                   JOIN entry_materials em ON em.material_id = m.id
+                                   JOIN data_entries d ON d.id = em.entry_id
+                                   WHERE m.material_name = ? AND em.present = ?{subquery}
+                                   GROUP BY d.branch
+                                   ORDER BY COUNT(*) DESC, d.branch''', db_type),
+                   [material_name, False] + params)
+    return [{'branch': branch, 'missing': missing} for branch, missing in cursor.fetchall()]
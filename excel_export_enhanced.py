@@ -4,27 +4,37 @@ Enhanced Excel export with local images support and better formatting
 """
 
 import os
+import shutil
 import tempfile
-import time
-from io import BytesIO
-from PIL import Image as PILImage
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, ZIP_DEFLATED
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.drawing.image import Image as ExcelImage
+from openpyxl.drawing.spreadsheet_drawing import _check_anchor
+from openpyxl.packaging.relationship import Relationship, get_rels_path
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
-import pandas as pd
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.xml.constants import DRAWING_NS, PKG_REL_NS, REL_NS, SHEET_DRAWING_NS
+from openpyxl.xml.functions import tostring
+
+from image_store import ensure_thumbnail
 
 # إعدادات محسنة للصور
 PYTHONANYWHERE_SETTINGS = {
     'MAX_RETRIES': 3,
     'TIMEOUT': 30,
-    'DELAY_BETWEEN_IMAGES': 1.5,
+    # تحميل الصور المحلية بالتوازي قبل كاتب الصفوف (بدون تأخير بين الصور)
+    'IMAGE_WORKERS': int(os.getenv('EXPORT_IMAGE_WORKERS', '4')),
+    'PREFETCH_ENTRIES': int(os.getenv('EXPORT_PREFETCH_ENTRIES', '16')),
     'MAX_IMAGE_SIZE_MB': 15,
     'IMAGE_QUALITY': 85,
     'MAX_IMAGE_DIMENSIONS': (800, 600)
 }
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 # استيراد دوال الوقت المحلي
 try:
@@ -60,135 +70,185 @@ except ImportError:
         
 
 
-def process_multiple_images(image_urls, max_images=None):
+def process_multiple_images(images, paths):
     """
-    معالجة صور متعددة مع تحسينات خاصة بـ PythonAnywhere
+    تجميع نتائج تحضير صور إدخال واحد بترتيبها الأصلي
     
     Args:
-        image_urls: قائمة بروابط الصور
-        max_images: الحد الأقصى لعدد الصور
+        images: بيانات الصور من entry_images (الصالحة فقط)
+        paths: نتائج load_export_image لنفس الصور وبنفس الترتيب
     
     Returns:
-        list: قائمة بالصور المحملة بنجاح
+        list: قائمة بالصور المحضرة بنجاح
     """
-    if not image_urls:
+    if not images:
         return []
     
     processed_images = []
-    failed_count = 0
-    
-    # تحديد عدد الصور للمعالجة
-    if max_images is None:
-        max_images = len(image_urls)
-    else:
-        max_images = min(max_images, len(image_urls))
-    
-    print(f"🖼️ بدء معالجة {len(image_urls)} صورة (سيتم معالجة {max_images})")
+    for i, (image, path) in enumerate(zip(images, paths)):
+        if path:
+            processed_images.append({
+                'path': path,
+                'url': image['filename'],
+                'index': i
+            })
+        else:
+            print(f"   ❌ فشل في تحميل الصورة {i+1}: {image['filename'][:60]}")
     
-    for i, image_url in enumerate(image_urls[:max_images]):
-        print(f"\n📸 معالجة الصورة {i+1}/{min(len(image_urls), max_images)}")
-        print(f"   الرابط: {image_url[:60]}...")
-        
-        # تأخير بين الصور لتجنب مشاكل الشبكة
-        if i > 0:
-            delay = PYTHONANYWHERE_SETTINGS['DELAY_BETWEEN_IMAGES']
-            print(f"   ⏳ انتظار {delay} ثانية...")
-            time.sleep(delay)
-        
-        try:
-            # تحميل الصورة (محلية فقط)
-            img_buffer = load_local_image(image_url)
-            
-            if img_buffer:
-                processed_images.append({
-                    'buffer': img_buffer,
-                    'url': image_url,
-                    'index': i
-                })
-                print(f"   ✅ تم تحميل الصورة بنجاح")
-            else:
-                failed_count += 1
-                print(f"   ❌ فشل في تحميل الصورة")
-                
-        except Exception as e:
-            failed_count += 1
-            print(f"   ❌ خطأ في معالجة الصورة: {e}")
+    print(f"   📊 تم تحميل {len(processed_images)} من {len(images)} صورة")
+    return processed_images
+
+def prefetch_entry_images(data_entries, spool_dir, workers=None, prefetch=None):
+    """
+    Yield (entry, valid_images, processed_images) in the order of data_entries
     
-    success_rate = len(processed_images) / len(image_urls[:max_images]) * 100
-    print(f"\n📊 نتيجة المعالجة:")
-    print(f"   نجح: {len(processed_images)}")
-    print(f"   فشل: {failed_count}")
-    print(f"   معدل النجاح: {success_rate:.1f}%")
+    Thumbnails of the next `prefetch` entries are prepared (regenerated if
+    missing, then spooled into spool_dir) by a pool of `workers` threads
+    while the caller writes the current row. Only file paths are passed
+    around; image bytes are read once, when the workbook is saved.
+    """
+    workers = workers or PYTHONANYWHERE_SETTINGS['IMAGE_WORKERS']
+    prefetch = prefetch or PYTHONANYWHERE_SETTINGS['PREFETCH_ENTRIES']
+    entries = iter(data_entries)
+    pending = deque()
     
-    return processed_images
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit_next():
+            entry = next(entries, None)
+            if entry is None:
+                return
+            # الصور الصالحة فقط (محسوبة عند الرفع)، والصور التي لم توصف بعد (None)
+            valid_images = [image for image in entry[9] if image['is_valid'] is not False]
+            futures = [pool.submit(load_export_image, image, spool_dir) for image in valid_images]
+            pending.append((entry, valid_images, futures))
+        
+        for _ in range(prefetch):
+            submit_next()
+        
+        while pending:
+            entry, valid_images, futures = pending.popleft()
+            submit_next()
+            paths = [future.result() for future in futures]
+            yield entry, valid_images, process_multiple_images(valid_images, paths)
 
-def load_local_image(image_path):
+def load_export_image(image, spool_dir):
     """
-    تحميل صورة محلية بدون أي معالجة - الملف الأصلي كما هو
+    تحضير الصورة المصغرة (حوالي 400 بكسل، JPEG) بدلاً من الصورة الأصلية
+    
+    الصور المصغرة تنشأ عند الرفع ومخزنة حسب hash المحتوى، وتعاد إنشاؤها
+    هنا فقط إذا حذف الملف. تربط (hard link، أو تنسخ) في مجلد مؤقت خاص
+    بالتصدير حتى لا يفشل الحفظ إذا حذف إدخال أثناء التصدير، ولا تقرأ
+    محتوياتها إلا عند حفظ الملف.
     
     Args:
-        image_path: مسار الصورة المحلية
+        image: بيانات الصورة من entry_images
+        spool_dir: المجلد المؤقت لصور هذا التصدير
     
     Returns:
-        BytesIO: الصورة الأصلية بدون معالجة أو None في حالة الخطأ
+        str: مسار الصورة في المجلد المؤقت أو None في حالة الخطأ
     """
     try:
-        # محاولة قراءة الملف المحلي
-        local_path = os.path.join('static/uploads', image_path)
-        if not os.path.exists(local_path):
-            print(f"   ❌ الملف المحلي غير موجود: {local_path}")
+        thumbnail_path = ensure_thumbnail(image)
+        if not thumbnail_path:
+            print(f"   ❌ لا توجد صورة مصغرة: {image['filename']}")
             return None
         
-        # قراءة الملف الأصلي بدون أي معالجة
-        with open(local_path, 'rb') as f:
-            original_img_data = f.read()
-        
-        if len(original_img_data) < 1000:  # أقل من 1 كيلوبايت
-            print(f"   ⚠️ الملف صغير جداً: {len(original_img_data)} bytes")
-            return None
-        
-        # التحقق من صحة الصورة فقط (بدون معالجة)
+        # الصور المتطابقة تشترك في نفس الملف المصغر (حسب hash المحتوى)
+        spooled_path = os.path.join(spool_dir, os.path.basename(thumbnail_path))
         try:
-            img_test = PILImage.open(BytesIO(original_img_data))
-            img_test.verify()  # التحقق من صحة الصورة فقط
-        except Exception as verify_error:
-            print(f"   ❌ الصورة تالفة: {verify_error}")
-            return None
-        
-        # إرجاع الصورة الأصلية بدون أي تعديل
-        img_buffer = BytesIO(original_img_data)
-        img_buffer.seek(0)
-        
-        print(f"   ✅ تم تحميل الصورة الأصلية بدون معالجة ({len(original_img_data)} bytes)")
-        return img_buffer
-        
+            os.link(thumbnail_path, spooled_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # نظام ملفات مختلف: نسخ بدلاً من الربط
+            shutil.copyfile(thumbnail_path, spooled_path)
+        return spooled_path
+    
     except Exception as e:
-        print(f"   ❌ خطأ في تحميل الصورة المحلية: {e}")
+        print(f"   ❌ خطأ في تحميل الصورة المصغرة: {e}")
         return None
 
 
 
-def create_enhanced_excel_with_images(data_entries, filename):
+class StreamingDrawingWriter(ExcelWriter):
+    """
+    ExcelWriter that writes image drawings one anchor at a time
+
+    openpyxl builds a sheet's whole drawing XML (a few KB per image) as one
+    tree before writing it; here each anchor is serialized straight into the
+    zip, so saving a sheet with thousands of images does not grow with them.
+    Image bytes are still read one file at a time by _write_images.
     """
-    إنشاء ملف Excel محسن مع الصور والتنسيق المحسن
+
+    def _write_drawing(self, drawing):
+        if drawing.charts:
+            return super()._write_drawing(drawing)
+
+        self._drawings.append(drawing)
+        drawing._id = len(self._drawings)
+        for img in drawing.images:
+            self._images.append(img)
+            img._id = len(self._images)
+
+        with self._archive.open(drawing.path[1:], 'w') as part:
+            part.write(f'<wsDr xmlns:a="{DRAWING_NS}" xmlns:r="{REL_NS}" xmlns="{SHEET_DRAWING_NS}">'.encode())
+            for idx, img in enumerate(drawing.images, 1):
+                anchor = _check_anchor(img)
+                anchor.pic = drawing._picture_frame(idx)
+                part.write(tostring(anchor.to_tree('oneCellAnchor')))
+            part.write(b'</wsDr>')
+
+        with self._archive.open(get_rels_path(drawing.path)[1:], 'w') as part:
+            part.write(f'<Relationships xmlns="{PKG_REL_NS}">'.encode())
+            for idx, img in enumerate(drawing.images, 1):
+                part.write(tostring(Relationship(type='image', Target=img.path, Id=f'rId{idx}').to_tree()))
+            part.write(b'</Relationships>')
+
+        self.manifest.append(drawing)
+
+def create_temp_xlsx_path():
+    """مسار ملف مؤقت فريد للتصدير (اسم التنزيل يحدد عند الإرسال فقط)
+
+    الملف يبقى بعد إنشائه (يرسل من القرص، أو ينقل للكاش أو لمجلد المهام)،
+    فلا يمكن أن يشترك تصديران في نفس المسار.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix='pop_export_', suffix='.xlsx')
+    os.close(fd)
+    return temp_path
+
+def save_streaming_workbook(wb, path):
+    """wb.save(path) with StreamingDrawingWriter"""
+    wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    StreamingDrawingWriter(wb, ZipFile(path, 'w', ZIP_DEFLATED, allowZip64=True)).save()
+
+def create_enhanced_excel_with_images(data_entries, image_url_for=None, progress=None):
+    """
+    إنشاء ملف Excel محسن مع الصور والتنسيق المحسن بذاكرة محدودة
+    
+    الورقة write_only: كل صف يكتب إلى الملف فور إضافته، والصور تضاف
+    كمسارات ملفات في مجلد مؤقت فلا تحمل في الذاكرة إلا واحدة تلو الأخرى
+    عند الحفظ. الإحصائيات تحسب أثناء الكتابة، فيمكن تمرير مولد مثل
+    iter_export_entries بدلاً من قائمة.
     
     Args:
-        data_entries: بيانات الإدخالات
-        filename: اسم الملف
+        data_entries: بيانات الإدخالات (قائمة أو مولد)
+        image_url_for: دالة تعيد رابط الصورة الأصلية من اسم الملف (اختياري)
+        progress: دالة تستدعى بعد كل صف بـ (الصفوف المكتملة, الصور المدرجة) (اختياري)
     
     Returns:
         str: مسار الملف المؤقت أو None في حالة الخطأ
     """
+    # مجلد مؤقت لصور هذا التصدير (يحذف بعد الحفظ)
+    spool_dir = tempfile.mkdtemp(prefix='pop_export_images_')
     try:
         # طباعة معلومات البيئة
         print("🌐 استخدام إعدادات محسنة للصور المحلية")
         
-        print(f"📊 بدء إنشاء تقرير Excel مع {len(data_entries)} إدخال")
+        print("📊 بدء إنشاء تقرير Excel مع الصور")
         
-        # إنشاء workbook جديد
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "POP Materials Report"
+        # إنشاء workbook جديد (كتابة متدفقة)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("POP Materials Report")
         
         # تعريف الألوان والأنماط
         colors = {
@@ -211,36 +271,69 @@ def create_enhanced_excel_with_images(data_entries, filename):
             bottom=Side(style='thin', color=colors['border'])
         )
         
+        # أنماط مشتركة بين كل الخلايا
+        header_fill = PatternFill(start_color=colors['header'], end_color=colors['header'], fill_type='solid')
+        row_fills = [
+            PatternFill(start_color=colors['alt_row'], end_color=colors['alt_row'], fill_type='solid'),
+            PatternFill(start_color=colors['white'], end_color=colors['white'], fill_type='solid'),
+        ]
+        data_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        
+        # أعرض محسنة للأعمدة (يجب تعيينها قبل الصف الأول في وضع write_only)
+        column_widths = {
+            1: 22,   # Employee Name - زيادة العرض
+            2: 16,   # Employee Code
+            3: 28,   # Branch - زيادة العرض
+            4: 14,   # Shop Code
+            5: 30,   # Model - زيادة العرض
+            6: 22,   # Display Type
+            7: 38,   # Selected Materials - زيادة العرض
+            8: 38,   # Missing Materials - زيادة العرض
+            9: 25,   # Comments - زيادة العرض
+            10: 14,  # Images Count
+            11: 20,  # Date - زيادة العرض
+            12: 25,  # Image Preview/Image 1
+        }
+        
+        # إضافة أعمدة إضافية للصور (حتى 10 صور)
+        for i in range(13, 22):  # أعمدة M إلى U للصور الإضافية
+            column_widths[i] = 25
+        
+        # تطبيق الأعرض
+        for col_idx, width in column_widths.items():
+            column_letter = get_column_letter(col_idx)
+            ws.column_dimensions[column_letter].width = width
+        
         # العناوين بدون ID
         headers = [
-            'Employee Name', 'Employee Code', 'Branch', 'Shop Code', 
-            'Model', 'Display Type', 'Selected Materials', 'Missing Materials', 
+            'Employee Name', 'Employee Code', 'Branch', 'Shop Code',
+            'Model', 'Display Type', 'Selected Materials', 'Missing Materials',
             'Comments', 'Images Count', 'Date', 'Image Preview'
         ]
         
         # إضافة العناوين
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
+        header_row = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.font = header_font
-            cell.fill = PatternFill(start_color=colors['header'], end_color=colors['header'], fill_type='solid')
+            cell.fill = header_fill
             cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
             cell.border = thin_border
-        
-        # سيتم تعيين عرض الأعمدة تلقائياً في النهاية بناءً على المحتوى
+            header_row.append(cell)
+        ws.append(header_row)
         
         # إضافة البيانات
         current_row = 2
+        images_embedded = 0
+        stats = {'entries': 0, 'images': 0, 'employees': set(), 'branches': set()}
         
-        for entry in data_entries:
+        # الصور تحضر مسبقاً في خيوط متوازية بينما تكتب الصفوف بالترتيب
+        for entry, valid_images, processed_images in prefetch_entry_images(data_entries, spool_dir):
             # تحديد لون الصف (متناوب)
-            row_fill = PatternFill(
-                start_color=colors['alt_row'] if current_row % 2 == 0 else colors['white'],
-                end_color=colors['alt_row'] if current_row % 2 == 0 else colors['white'],
-                fill_type='solid'
-            )
+            row_fill = row_fills[current_row % 2]
             
             # البيانات الأساسية (بدون ID)
-            # الترتيب في الاستعلام: images(9), date(10), comment(11)
+            # الترتيب: قوائم المواد (7, 8) من entry_materials، images(9) من entry_images, date(10), comment(11)
             entry_data = [
                 entry[1],  # Employee Name
                 entry[2],  # Employee Code
@@ -248,36 +341,38 @@ def create_enhanced_excel_with_images(data_entries, filename):
                 entry[4] if entry[4] else 'N/A',  # Shop Code
                 entry[5],  # Model
                 entry[6],  # Display Type
-                entry[7].replace(',', '\n') if entry[7] else 'None',  # Selected Materials
-                entry[8].replace(',', '\n') if entry[8] else 'None',  # Missing Materials
+                '\n'.join(entry[7]) if entry[7] else 'None',  # Selected Materials
+                '\n'.join(entry[8]) if entry[8] else 'None',  # Missing Materials
                 entry[11] if entry[11] else 'No comment',  # Comments
-                len(entry[9].split(',')) if entry[9] else 0,  # Images Count
+                len(entry[9]),  # Images Count
                 entry[10]  # Date
             ]
             
             # إضافة البيانات إلى الخلايا
-            for col, value in enumerate(entry_data, 1):
-                cell = ws.cell(row=current_row, column=col, value=value)
+            row_cells = []
+            for value in entry_data:
+                cell = WriteOnlyCell(ws, value=value)
                 cell.font = data_font
                 cell.fill = row_fill
                 cell.border = thin_border
-                cell.alignment = Alignment(horizontal='left', 
-                                         vertical='top', wrap_text=True)
+                cell.alignment = data_alignment
+                row_cells.append(cell)
             
             # تعيين ارتفاع الصف لاستيعاب النص متعدد الأسطر والصور
             # حساب عدد الأسطر المطلوبة للمواد (بعد التحويل إلى أسطر منفصلة)
-            selected_lines = len(entry[7].replace(',', '\n').split('\n')) if entry[7] else 1
-            missing_lines = len(entry[8].replace(',', '\n').split('\n')) if entry[8] else 1
+            selected_lines = len(entry[7]) or 1
+            missing_lines = len(entry[8]) or 1
             max_material_lines = max(selected_lines, missing_lines)
             
+            img_cell = WriteOnlyCell(ws)
+            img_cell.font = data_font
+            img_cell.fill = row_fill
+            img_cell.border = thin_border
+            row_cells.append(img_cell)
+            
             # معالجة الصور
-            images_data = entry[9] if entry[9] else ''
-            if images_data:
-                # تنظيف وتصفية روابط الصور
-                raw_urls = [url.strip() for url in images_data.split(',') if url.strip()]
-                image_urls = [url for url in raw_urls if url and len(url) > 10]  # تصفية الروابط الفارغة أو القصيرة
-                
-                print(f"\n🖼️ الصف {current_row}: معالجة {len(image_urls)} صورة")
+            if entry[9]:
+                print(f"\n🖼️ الصف {current_row}: معالجة {len(valid_images)} صورة")
                 
                 # تعيين ارتفاع الصف بناءً على المحتوى والصور
                 min_height_for_materials = max_material_lines * 15 + 10
@@ -286,20 +381,14 @@ def create_enhanced_excel_with_images(data_entries, filename):
                 required_height = max(min_height_for_materials, max_image_height + 20)
                 ws.row_dimensions[current_row].height = required_height
                 
-                # معالجة الصور باستخدام الدالة المحسنة - جميع الصور بدون حد أقصى
-                processed_images = process_multiple_images(image_urls, max_images=len(image_urls))
-                
                 # إدراج الصور في Excel
                 images_added = 0
                 for img_data in processed_images:
                     try:
-                        img_buffer = img_data['buffer']
                         img_index = img_data['index']
                         
-                        # إنشاء صورة Excel من الملف الأصلي
-                        excel_img = ExcelImage(img_buffer)
-                        
-                        # الحصول على الأبعاد الأصلية
+                        # صورة Excel من مسار الملف المصغر: تقرأ الأبعاد فقط الآن
+                        excel_img = ExcelImage(img_data['path'])
                         original_width = excel_img.width
                         original_height = excel_img.height
                         
@@ -324,126 +413,116 @@ def create_enhanced_excel_with_images(data_entries, filename):
                         image_column = 12 + img_index  # العمود L, M, N, O, P, Q... للصور
                         col_letter = get_column_letter(image_column)
                         
-                        # تعيين عرض العمود للصور
-                        ws.column_dimensions[col_letter].width = 25
-                        
-                        # حساب الموقع المتوسط للصورة في الخلية (توسيط)
-                        cell_width_pixels = 25 * 7  # تقريبي: عرض العمود بالبكسل
-                        cell_height_pixels = required_height * 1.33  # تقريبي: ارتفاع الصف بالبكسل
-                        
-                        # حساب الإزاحة للتوسيط
-                        offset_x = max(0, (cell_width_pixels - excel_img.width) // 2)
-                        offset_y = max(0, (cell_height_pixels - excel_img.height) // 2)
-                        
-                        # تعيين موقع الصورة مع التوسيط
+                        # تعيين موقع الصورة
                         excel_img.anchor = f"{col_letter}{current_row}"
                         
                         # إضافة الصورة
                         ws.add_image(excel_img)
                         images_added += 1
                         
-                        print(f"   ✅ تم إدراج الصورة {img_index + 1} في العمود {col_letter}{current_row}")
+                        # الملف يحتوي الصورة المصغرة فقط؛ رابط للصورة الأصلية أسفل الخلية
+                        if image_url_for:
+                            while len(row_cells) < image_column:
+                                row_cells.append(None)
+                            if image_column > 12:
+                                link_cell = WriteOnlyCell(ws, value='Open original')
+                                link_cell.style = 'Hyperlink'
+                                link_cell.alignment = Alignment(horizontal='center', vertical='bottom')
+                                row_cells[image_column - 1] = link_cell
+                            link_cell = row_cells[image_column - 1]
+                            link_cell.hyperlink = image_url_for(img_data['url'])
+                            # خلايا write_only لا تعرف موقعها قبل الكتابة
+                            link_cell.hyperlink.ref = f"{col_letter}{current_row}"
                         
+                        print(f"   ✅ تم إدراج الصورة {img_index + 1} في العمود {col_letter}{current_row}")
+                    
                     except Exception as e:
                         print(f"   ❌ خطأ في إدراج الصورة {img_index + 1}: {e}")
                 
                 # إضافة نص في خلية الصور
-                failed_count = len(image_urls) - images_added
+                failed_count = len(valid_images) - images_added
                 if images_added > 0:
-                    img_text = f"{images_added} of {len(image_urls)} images loaded"
+                    img_text = f"{images_added} of {len(valid_images)} images loaded"
                     if failed_count > 0:
                         img_text += f" ({failed_count} failed)"
                 else:
-                    img_text = f"0 of {len(image_urls)} images (all failed)"
+                    img_text = f"0 of {len(valid_images)} images (all failed)"
                 
                 print(f"   📊 النتيجة النهائية: {img_text}")
+                images_embedded += images_added
                 
-                img_cell = ws.cell(row=current_row, column=12, value=img_text)
-                img_cell.font = data_font
-                img_cell.fill = row_fill
-                img_cell.border = thin_border
-                img_cell.alignment = Alignment(horizontal='center', vertical='center')
+                img_cell.value = img_text
+                # أسفل الخلية حتى لا تغطيه الصورة الأولى (والنص رابط لصورتها الأصلية)
+                img_cell.alignment = Alignment(horizontal='center', vertical='bottom')
             else:
                 # لا توجد صور - تعيين ارتفاع الصف للنص فقط (مقلل)
                 min_height_for_materials = max_material_lines * 15 + 5
                 ws.row_dimensions[current_row].height = max(35, min_height_for_materials)
                 
-                img_cell = ws.cell(row=current_row, column=12, value="No images")
-                img_cell.font = data_font
-                img_cell.fill = row_fill
-                img_cell.border = thin_border
+                img_cell.value = "No images"
                 img_cell.alignment = Alignment(horizontal='center', vertical='center')
             
+            ws.append(row_cells)
+            # الصف كتب إلى الملف؛ لا داعي للاحتفاظ بأبعاده في الذاكرة
+            del ws.row_dimensions[current_row]
+            
+            stats['entries'] += 1
+            stats['images'] += len(entry[9])
+            stats['employees'].add(entry[2])
+            stats['branches'].add(entry[3])
+            
             current_row += 1
+            if progress:
+                progress(current_row - 2, images_embedded)
         
-        # إضافة ملخص في النهاية
+        if stats['entries'] == 0:
+            print("لا توجد بيانات صالحة للتصدير")
+            return None
+        
+        # إضافة ملخص في النهاية (صفان فارغان ثم العنوان)
+        ws.append([])
+        ws.append([])
         summary_row = current_row + 2
         
         # عنوان الملخص
-        summary_cell = ws.cell(row=summary_row, column=1, value="Report Summary")
+        summary_cell = WriteOnlyCell(ws, value="Report Summary")
         summary_cell.font = Font(name='Arial', size=14, bold=True, color=colors['white'])
-        summary_cell.fill = PatternFill(start_color=colors['header'], end_color=colors['header'], fill_type='solid')
-        ws.merge_cells(f'A{summary_row}:L{summary_row}')
+        summary_cell.fill = header_fill
         summary_cell.alignment = Alignment(horizontal='center', vertical='center')
+        ws.append([summary_cell])
+        ws.merged_cells.add(f'A{summary_row}:L{summary_row}')
         
         # بيانات الملخص
-        total_entries = len(data_entries)
-        total_images = sum(len(entry[9].split(',')) if entry[9] else 0 for entry in data_entries)
-        unique_employees = len(set(entry[2] for entry in data_entries))
-        unique_branches = len(set(entry[3] for entry in data_entries))
-        
         summary_data = [
-            f"Total Entries: {total_entries}",
-            f"Total Images: {total_images}",
-            f"Unique Employees: {unique_employees}",
-            f"Unique Branches: {unique_branches}",
+            f"Total Entries: {stats['entries']}",
+            f"Total Images: {stats['images']}",
+            f"Unique Employees: {len(stats['employees'])}",
+            f"Unique Branches: {len(stats['branches'])}",
             f"Report Date: {get_local_time_string()}"
         ]
         
         for i, summary_text in enumerate(summary_data):
-            cell = ws.cell(row=summary_row + 1 + i, column=1, value=summary_text)
+            cell = WriteOnlyCell(ws, value=summary_text)
             cell.font = Font(name='Arial', size=10, bold=True)
-            ws.merge_cells(f'A{summary_row + 1 + i}:L{summary_row + 1 + i}')
             cell.alignment = Alignment(horizontal='left', vertical='center')
+            ws.append([cell])
+            ws.merged_cells.add(f'A{summary_row + 1 + i}:L{summary_row + 1 + i}')
         
-        # الحل النهائي: استخدام auto_fit للأعمدة
-        # تعيين عرض مناسب لكل عمود بناءً على المحتوى
-        
-        # أعرض محسنة للأعمدة بناءً على المحتوى
-        column_widths = {
-            1: 22,   # Employee Name - زيادة العرض
-            2: 16,   # Employee Code  
-            3: 28,   # Branch - زيادة العرض
-            4: 14,   # Shop Code
-            5: 30,   # Model - زيادة العرض
-            6: 22,   # Display Type
-            7: 38,   # Selected Materials - زيادة العرض
-            8: 38,   # Missing Materials - زيادة العرض
-            9: 25,   # Comments - زيادة العرض
-            10: 14,  # Images Count
-            11: 20,  # Date - زيادة العرض
-            12: 25,  # Image Preview/Image 1
-        }
-        
-        # إضافة أعمدة إضافية للصور (حتى 10 صور)
-        for i in range(13, 22):  # أعمدة M إلى U للصور الإضافية
-            column_widths[i] = 25
-        
-        # تطبيق الأعرض
-        for col_idx, width in column_widths.items():
-            column_letter = get_column_letter(col_idx)
-            ws.column_dimensions[column_letter].width = width
-        
-        # حفظ الملف
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, filename)
-        wb.save(temp_path)
+        # حفظ الملف (الصور تقرأ من المجلد المؤقت واحدة تلو الأخرى)
+        temp_path = create_temp_xlsx_path()
+        try:
+            save_streaming_workbook(wb, temp_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
         
         return temp_path
-        
+    
     except Exception as e:
         print(f"خطأ في إنشاء ملف Excel: {e}")
         return None
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
 
 
 
@@ -484,212 +563,196 @@ def calculate_optimal_row_height(cell_values, font_size=11):
     # حد أدنى وأقصى معقول
     return max(20, min(total_height, 200))
 
-def create_simple_excel_with_formatting(data_entries, filename):
+# أعمدة التصدير البسيط: (العنوان, مفتاح الطول في export_column_lengths)
+SIMPLE_EXPORT_COLUMNS = [
+    ('Employee Name', 'employee_name'),
+    ('Employee Code', 'employee_code'),
+    ('Branch', 'branch'),
+    ('Shop Code', 'shop_code'),
+    ('Model', 'model'),
+    ('Display Type', 'display_type'),
+    ('Selected Materials', 'selected_materials'),
+    ('Missing Materials', 'missing_materials'),
+    ('Comments', 'comment'),
+    ('Date', 'date'),
+]
+
+def simple_export_values(entry):
+    """قيم صف التصدير البسيط بترتيب SIMPLE_EXPORT_COLUMNS"""
+    return [
+        str(entry[1]) if entry[1] else 'N/A',
+        str(entry[2]) if entry[2] else 'N/A',
+        str(entry[3]) if entry[3] else 'N/A',
+        str(entry[4]) if entry[4] else 'N/A',
+        str(entry[5]) if entry[5] else 'N/A',
+        str(entry[6]) if entry[6] else 'N/A',
+        '\n'.join(entry[7]) if entry[7] else 'None',
+        '\n'.join(entry[8]) if entry[8] else 'None',
+        str(entry[11]) if entry[11] else 'No comment',
+        str(entry[10]) if entry[10] else 'N/A',
+    ]
+
+def simple_column_lengths(data_entries):
+    """أطول سطر في كل عمود لقائمة إدخالات في الذاكرة (مثل export_column_lengths)"""
+    lengths = {key: 0 for _, key in SIMPLE_EXPORT_COLUMNS}
+    for entry in data_entries:
+        for (_, key), value in zip(SIMPLE_EXPORT_COLUMNS, simple_export_values(entry)):
+            lengths[key] = max(lengths[key], max(len(line) for line in value.split('\n')))
+    return lengths
+
+def create_simple_excel_with_formatting(data_entries, progress=None, column_lengths=None):
     """
-    إنشاء ملف Excel بسيط مع تنسيق جيد (بدون صور)
+    إنشاء ملف Excel بسيط مع تنسيق جيد (بدون صور) بذاكرة ثابتة
+    
+    الصفوف تكتب وتنسق واحداً تلو الآخر في ورقة write_only، فلا يحتفظ
+    بالبيانات كاملة في الذاكرة. عرض الأعمدة يجب أن يعرف قبل الصف الأول،
+    لذلك يؤخذ من column_lengths (export_column_lengths من قاعدة البيانات)،
+    أو يحسب من data_entries إذا كانت قائمة.
     
     Args:
-        data_entries: بيانات الإدخالات
-        filename: اسم الملف
+        data_entries: الإدخالات (قائمة أو مولد مثل iter_export_entries)
+        progress: دالة تستدعى لكل صف بـ (الصفوف المكتملة, 0) (اختياري)
+        column_lengths: أطول قيمة لكل عمود (مطلوب إذا كانت data_entries مولداً)
     
     Returns:
         str: مسار الملف المؤقت
     """
     try:
-        # التحقق من وجود البيانات
-        if not data_entries:
-            print("لا توجد بيانات للتصدير")
-            return None
-            
-        # تحويل البيانات إلى DataFrame
-        df_data = []
-        for entry in data_entries:
-            try:
-                # التأكد من أن entry هو tuple أو list وله العدد المطلوب من العناصر
-                if len(entry) < 12:
-                    print(f"تحذير: السجل لا يحتوي على جميع الحقول المطلوبة: {len(entry)} حقل")
-                    continue
-                    
-                df_data.append({
-                    'Employee Name': str(entry[1]) if entry[1] else 'N/A',
-                    'Employee Code': str(entry[2]) if entry[2] else 'N/A',
-                    'Branch': str(entry[3]) if entry[3] else 'N/A',
-                    'Shop Code': str(entry[4]) if entry[4] else 'N/A',
-                    'Model': str(entry[5]) if entry[5] else 'N/A',
-                    'Display Type': str(entry[6]) if entry[6] else 'N/A',
-                    'Selected Materials': str(entry[7]).replace(',', '\n') if entry[7] else 'None',
-                    'Missing Materials': str(entry[8]).replace(',', '\n') if entry[8] else 'None',
-                    'Comments': str(entry[11]) if len(entry) > 11 and entry[11] else 'No comment',
-                    'Date': str(entry[10]) if len(entry) > 10 and entry[10] else 'N/A'
-                })
-            except Exception as e:
-                print(f"خطأ في معالجة السجل: {e}")
-                continue
-        
-        if not df_data:
-            print("لا توجد بيانات صالحة للتصدير")
-            return None
-            
-        df = pd.DataFrame(df_data)
+        if column_lengths is None:
+            column_lengths = simple_column_lengths(data_entries)
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('POP Materials Data')
+        
+        # تعريف الحدود والأنماط (كائنات مشتركة بين كل الخلايا)
+        side = Side(style='thin', color='FF000000')
+        thin_border = Border(left=side, right=side, top=side, bottom=side)
+        header_font = Font(name='Calibri', size=14, bold=True, color='FFFFFF')
+        header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+        header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        data_font = Font(name='Calibri', size=11)
+        data_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        
+        # عرض الأعمدة (مع حد أدنى وأقصى) قبل كتابة أي صف
+        for col_idx, (header, key) in enumerate(SIMPLE_EXPORT_COLUMNS, 1):
+            max_length = max(len(header), column_lengths.get(key) or 0)
+            ws.column_dimensions[get_column_letter(col_idx)].width = max(10, min(max_length + 3, 60))
+        
+        # العناوين
+        ws.row_dimensions[1].height = 30
+        header_row = []
+        for header, _ in SIMPLE_EXPORT_COLUMNS:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            cell.border = thin_border
+            header_row.append(cell)
+        ws.append(header_row)
         
-        # حفظ مع تنسيق
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, filename)
+        # إحصائيات الملخص تحسب أثناء الكتابة
+        stats = {'entries': 0, 'images': 0, 'employees': set(), 'branches': set()}
+        row_num = 1
         
-        with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='POP Materials Data', index=False)
-            
-            # تحسين التنسيق
-            worksheet = writer.sheets['POP Materials Data']
+        for entry in data_entries:
+            # التأكد من أن entry له العدد المطلوب من العناصر
+            if len(entry) < 12:
+                print(f"تحذير: السجل لا يحتوي على جميع الحقول المطلوبة: {len(entry)} حقل")
+                continue
             
-            # استيراد الأنماط المطلوبة
-            from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+            values = simple_export_values(entry)
+            row_num += 1
             
-            # تعريف الحدود
-            thin_border = Border(
-                left=Side(style='thin', color='FF000000'),
-                right=Side(style='thin', color='FF000000'),
-                top=Side(style='thin', color='FF000000'),
-                bottom=Side(style='thin', color='FF000000')
-            )
+            # حساب ارتفاع الصف بناءً على المحتوى
+            max_lines = max(value.count('\n') + 1 for value in values)
+            max_content_length = max(len(value) for value in values)
+            content_bonus = min(10, max_content_length // 50)  # مساحة إضافية للمحتوى الطويل
+            calculated_height = 20 + (max_lines - 1) * 15 + content_bonus
+            ws.row_dimensions[row_num].height = max(25, min(calculated_height, 150))
             
-            # تنسيق العناوين المحسن
-            for cell in worksheet[1]:
-                cell.font = Font(name='Calibri', size=14, bold=True, color='FFFFFF')
-                cell.fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+            row = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.font = data_font
+                cell.alignment = data_alignment
                 cell.border = thin_border
+                row.append(cell)
+            ws.append(row)
+            # الصف كتب إلى الملف؛ لا داعي للاحتفاظ بأبعاده في الذاكرة
+            del ws.row_dimensions[row_num]
             
-            # تعيين ارتفاع صف العناوين
-            worksheet.row_dimensions[1].height = 30
-            
-            # تنسيق البيانات وتوسيع الخلايا تلقائياً
-            for row_num, row in enumerate(worksheet.iter_rows(min_row=2), start=2):
-                # حساب ارتفاع الصف بناءً على المحتوى (محسن)
-                max_lines = 1
-                max_content_length = 0
-                
-                for cell in row:
-                    # تطبيق التنسيق العام المحسن
-                    cell.font = Font(name='Calibri', size=11)
-                    cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-                    cell.border = thin_border
-                    
-                    # حساب عدد الأسطر في الخلية بدقة أكبر
-                    if cell.value and isinstance(cell.value, str):
-                        # حساب الأسطر الفعلية
-                        lines_count = cell.value.count('\n') + 1
-                        max_lines = max(max_lines, lines_count)
-                        
-                        # حساب طول المحتوى لتقدير الحاجة لأسطر إضافية
-                        content_length = len(cell.value)
-                        max_content_length = max(max_content_length, content_length)
-                
-                # حساب ارتفاع الصف المطلوب (محسن)
-                # الحد الأدنى: 20 نقطة
-                # لكل سطر إضافي: 15 نقطة
-                # إضافة مساحة إضافية للمحتوى الطويل
-                base_height = 20
-                line_height = 15
-                content_bonus = min(10, max_content_length // 50)  # مساحة إضافية للمحتوى الطويل
-                
-                calculated_height = base_height + (max_lines - 1) * line_height + content_bonus
-                
-                # تعيين ارتفاع الصف (مع حد أدنى وأقصى معقول)
-                final_height = max(25, min(calculated_height, 150))
-                worksheet.row_dimensions[row_num].height = final_height
-                
-                # معلومات تشخيصية للصفوف التي تحتوي على محتوى كثير (تم إزالة print للأداء)
-                # if max_lines > 3 or max_content_length > 100:
-                #     pass  # تم إزالة print statement
-            
-            # تعديل عرض الأعمدة بذكاء أكبر
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                for cell in column:
-                    try:
-                        if cell.value:
-                            # حساب أطول سطر في الخلية
-                            if isinstance(cell.value, str) and '\n' in cell.value:
-                                lines = cell.value.split('\n')
-                                cell_max_length = max(len(line) for line in lines)
-                            else:
-                                cell_max_length = len(str(cell.value))
-                            
-                            if cell_max_length > max_length:
-                                max_length = cell_max_length
-                    except:
-                        pass
-                
-                # تعيين عرض العمود (مع حد أدنى وأقصى)
-                adjusted_width = max(10, min(max_length + 3, 60))
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            stats['entries'] += 1
+            stats['images'] += len(entry[9])
+            stats['employees'].add(entry[2])
+            stats['branches'].add(entry[3])
             
-            # إضافة Report Summary للملف البسيط
-            add_report_summary_to_simple_excel(worksheet, data_entries)
+            if progress:
+                progress(stats['entries'], 0)
         
+        if stats['entries'] == 0:
+            print("لا توجد بيانات صالحة للتصدير")
+            return None
+        
+        # إضافة Report Summary للملف البسيط
+        add_report_summary_to_simple_excel(ws, stats, row_num)
+        
+        temp_path = create_temp_xlsx_path()
+        try:
+            wb.save(temp_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
         return temp_path
         
     except Exception as e:
         print(f"خطأ في إنشاء ملف Excel البسيط: {e}")
         return None
 
-def add_report_summary_to_simple_excel(worksheet, data_entries):
+def add_report_summary_to_simple_excel(worksheet, stats, last_row):
     """
-    إضافة ملخص التقرير للملف البسيط
+    إضافة ملخص التقرير للملف البسيط (بعد آخر صف بيانات)
     
     Args:
-        worksheet: ورقة العمل
-        data_entries: بيانات الإدخالات
+        worksheet: ورقة العمل (write_only)
+        stats: الإحصائيات المحسوبة أثناء كتابة الصفوف
+        last_row: رقم آخر صف مكتوب
     """
     try:
-        from openpyxl.styles import Font, Alignment, PatternFill
+        last_col = get_column_letter(len(SIMPLE_EXPORT_COLUMNS))
         
-        # تحديد الصف التالي بعد البيانات
-        last_row = worksheet.max_row
+        # صفان فارغان ثم العنوان
+        worksheet.append([])
+        worksheet.append([])
         summary_start_row = last_row + 3
         
-        # ألوان التنسيق
-        header_color = '366092'
-        
         # عنوان الملخص
-        summary_title_cell = worksheet.cell(row=summary_start_row, column=1, value="Report Summary")
-        summary_title_cell.font = Font(name='Calibri', size=14, bold=True, color='FFFFFF')
-        summary_title_cell.fill = PatternFill(start_color=header_color, end_color=header_color, fill_type='solid')
-        summary_title_cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # دمج الخلايا للعنوان (عبر جميع الأعمدة)
-        max_col = worksheet.max_column
-        worksheet.merge_cells(f'A{summary_start_row}:{chr(64 + max_col)}{summary_start_row}')
-        
-        # حساب إحصائيات التقرير
-        total_entries = len(data_entries)
-        total_images = sum(len(entry[9].split(',')) if entry[9] else 0 for entry in data_entries)
-        unique_employees = len(set(entry[2] for entry in data_entries))
-        unique_branches = len(set(entry[3] for entry in data_entries))
+        title_cell = WriteOnlyCell(worksheet, value="Report Summary")
+        title_cell.font = Font(name='Calibri', size=14, bold=True, color='FFFFFF')
+        title_cell.fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+        title_cell.alignment = Alignment(horizontal='center', vertical='center')
+        worksheet.append([title_cell])
+        worksheet.merged_cells.add(f'A{summary_start_row}:{last_col}{summary_start_row}')
         
         # بيانات الملخص مع الوقت المحلي الصحيح
         summary_data = [
-            f"Total Entries: {total_entries}",
-            f"Total Images: {total_images}",
-            f"Unique Employees: {unique_employees}",
-            f"Unique Branches: {unique_branches}",
+            f"Total Entries: {stats['entries']}",
+            f"Total Images: {stats['images']}",
+            f"Unique Employees: {len(stats['employees'])}",
+            f"Unique Branches: {len(stats['branches'])}",
             f"Report Generated: {get_local_time_string()}"  # استخدام الوقت المحلي الصحيح
         ]
         
-        # إضافة بيانات الملخص
+        summary_font = Font(name='Calibri', size=11, bold=True)
+        summary_alignment = Alignment(horizontal='left', vertical='center')
         for i, summary_text in enumerate(summary_data):
             row_num = summary_start_row + 1 + i
-            cell = worksheet.cell(row=row_num, column=1, value=summary_text)
-            cell.font = Font(name='Calibri', size=11, bold=True)
-            cell.alignment = Alignment(horizontal='left', vertical='center')
+            cell = WriteOnlyCell(worksheet, value=summary_text)
+            cell.font = summary_font
+            cell.alignment = summary_alignment
+            worksheet.append([cell])
             
             # دمج الخلايا لكل سطر ملخص
-            worksheet.merge_cells(f'A{row_num}:{chr(64 + max_col)}{row_num}')
-        
-
+            worksheet.merged_cells.add(f'A{row_num}:{last_col}{row_num}')
         
     except Exception as e:
         print(f"⚠️ خطأ في إضافة Report Summary: {e}")
@@ -0,0 +1,151 @@
+"""
+On-disk cache of finished Excel exports
+
+A finished export is kept under a key made of the export type, the
+normalized filters and the data version: the 'entries' row of
+cache_versions, which every writer of data_entries bumps in its own
+transaction, plus the 'catalog' version, since catalog renames change the
+model and display type labels. A repeated export with the same filters and
+unchanged data is sent straight from disk.
+
+The folder is shared by all gunicorn workers. Files are evicted least
+recently used first (a hit touches the file's mtime) once their total size
+passes EXPORT_CACHE_MAX_MB. Concurrent requests for the same key wait on a
+file lock while the first one builds, then get its file.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+from catalog_cache import CATALOG, get_cache_version
+from export_jobs import EXPORT_JOB_SETTINGS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ENTRIES = 'entries'
+
+EXPORT_CACHE_SETTINGS = {
+    # داخل مجلد التصدير حتى يرسلها nginx أيضاً (X-Accel-Redirect)
+    'FOLDER': os.getenv('EXPORT_CACHE_FOLDER', os.path.join(EXPORT_JOB_SETTINGS['FOLDER'], 'cache')),
+    'MAX_BYTES': int(os.getenv('EXPORT_CACHE_MAX_MB', 500)) * 1024 * 1024,
+}
+
+# عدد ملفات القفل (كل مفتاح يقع على واحد منها)
+LOCK_STRIPES = 256
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def normalize_filters(filters):
+    """Filters without empty values, in a stable order"""
+    return {key: value for key, value in sorted(filters.items()) if value}
+
+
+def export_cache_key(cursor, db_type, kind, filters, variant=''):
+    """Cache key of an export with these filters at the current data version
+
+    variant separates outputs that differ for the same data (the enhanced
+    export embeds absolute links to the original images).
+    """
+    parts = [kind, normalize_filters(filters), variant,
+             get_cache_version(cursor, db_type, ENTRIES), get_cache_version(cursor, db_type, CATALOG)]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def _key_lock(key):
+    stripe = int(key[:2], 16) % LOCK_STRIPES
+    if fcntl is None:
+        with _thread_locks[stripe]:
+            yield
+        return
+
+    # flock يعمل بين الـ workers وبين الخيوط (كل فتح للملف قفل مستقل)
+    os.makedirs(EXPORT_CACHE_SETTINGS['FOLDER'], exist_ok=True)
+    with open(os.path.join(EXPORT_CACHE_SETTINGS['FOLDER'], f'lock-{stripe:02x}'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CachedExport:
+    """The cache slot of one key; path is the cached file or None"""
+
+    def __init__(self, key):
+        self.key = key
+        self.path = None
+        self._file_path = os.path.join(EXPORT_CACHE_SETTINGS['FOLDER'], f'{key}.xlsx')
+
+    def _lookup(self):
+        try:
+            os.utime(self._file_path)
+        except OSError:
+            return None
+        self.path = self._file_path
+        return self.path
+
+    def store(self, temp_path):
+        """Move a freshly built file into the cache and return its cached path"""
+        os.makedirs(EXPORT_CACHE_SETTINGS['FOLDER'], exist_ok=True)
+        partial_path = f'{self._file_path}.{uuid.uuid4().hex}.part'
+        shutil.move(temp_path, partial_path)
+        os.replace(partial_path, self._file_path)
+        self.path = self._file_path
+        evict_cached_exports(keep=self._file_path)
+        return self.path
+
+
+@contextmanager
+def claim_export(cursor, db_type, kind, filters, variant=''):
+    """Yield the CachedExport for these filters and data version
+
+    If its path is None the caller builds the file and store()s it while
+    holding the claim; identical requests wait here and then find it.
+    """
+    cached = CachedExport(export_cache_key(cursor, db_type, kind, filters, variant))
+    if cached._lookup():
+        print(f"📦 Export cache hit ({kind})")
+        yield cached
+        return
+
+    with _key_lock(cached.key):
+        if cached._lookup():
+            print(f"📦 Export cache hit after waiting for a concurrent build ({kind})")
+        yield cached
+
+
+def evict_cached_exports(keep=None):
+    """Delete the least recently used files until the cache fits in MAX_BYTES"""
+    folder = EXPORT_CACHE_SETTINGS['FOLDER']
+    files = []
+    for name in os.listdir(folder):
+        if not name.endswith('.xlsx'):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= EXPORT_CACHE_SETTINGS['MAX_BYTES']:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
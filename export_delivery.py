@@ -0,0 +1,97 @@
+"""
+Sending finished export files to the client
+
+Exports are always served from their file on disk, never read back into
+memory. By default the app sends the file itself (gunicorn uses sendfile(2)
+for it, and Range/If-Range requests get 206 partial responses). When nginx
+fronts the app and EXPORT_ACCEL_REDIRECT_PREFIX is set, files inside
+EXPORT_FOLDER are handed to nginx with X-Accel-Redirect instead, so the
+worker is free as soon as the headers are out (see the /_exports/ location
+in nginx-subdomain.conf).
+"""
+
+import os
+import shutil
+import time
+import uuid
+from urllib.parse import quote
+
+from flask import current_app, send_file
+from werkzeug.wsgi import ClosingIterator
+
+from export_jobs import EXPORT_JOB_SETTINGS
+
+EXPORT_DELIVERY_SETTINGS = {
+    # مثال: /_exports/ (فارغ = التطبيق يرسل الملف بنفسه)
+    'ACCEL_REDIRECT_PREFIX': os.getenv('EXPORT_ACCEL_REDIRECT_PREFIX', ''),
+    # ملفات التنزيل المباشر التي يرسلها nginx تحذف بعد هذه المدة
+    'DOWNLOAD_GRACE_SECONDS': int(os.getenv('EXPORT_DOWNLOAD_GRACE_SECONDS', 3600)),
+}
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+DOWNLOAD_PREFIX = 'download-'
+
+
+def _accel_path(path):
+    """X-Accel-Redirect URI of a file in EXPORT_FOLDER, or None"""
+    prefix = EXPORT_DELIVERY_SETTINGS['ACCEL_REDIRECT_PREFIX']
+    if not prefix:
+        return None
+    folder = os.path.realpath(EXPORT_JOB_SETTINGS['FOLDER'])
+    path = os.path.realpath(path)
+    if os.path.commonpath([folder, path]) != folder:
+        return None
+    return prefix.rstrip('/') + '/' + quote(os.path.relpath(path, folder).replace(os.sep, '/'))
+
+
+def cleanup_delivered_files():
+    """Delete one-shot downloads handed to nginx once their grace period is over"""
+    folder = EXPORT_JOB_SETTINGS['FOLDER']
+    if not os.path.isdir(folder):
+        return
+    expired = time.time() - EXPORT_DELIVERY_SETTINGS['DOWNLOAD_GRACE_SECONDS']
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if name.startswith(DOWNLOAD_PREFIX) and os.path.getmtime(path) < expired:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def send_export_file(path, filename, mimetype=XLSX_MIMETYPE, remove=False):
+    """Response sending the file at path as an attachment named filename
+
+    remove=True is for one-shot temporary files (the synchronous export
+    routes): the file is deleted once it has been sent. Without it the file
+    is left alone (export jobs expire their own files), so interrupted
+    downloads can be resumed with Range requests.
+    """
+    if remove and EXPORT_DELIVERY_SETTINGS['ACCEL_REDIRECT_PREFIX']:
+        # nginx يفتح الملف بعد انتهاء الاستجابة، فلا يحذف الآن: ينقل لمجلد التصدير ويحذف لاحقاً
+        cleanup_delivered_files()
+        os.makedirs(EXPORT_JOB_SETTINGS['FOLDER'], exist_ok=True)
+        download_path = os.path.join(EXPORT_JOB_SETTINGS['FOLDER'],
+                                     f'{DOWNLOAD_PREFIX}{uuid.uuid4().hex}{os.path.splitext(path)[1]}')
+        shutil.move(path, download_path)
+        path = download_path
+
+    accel_path = _accel_path(path)
+    if accel_path:
+        # nginx يرسل الملف (مع دعم Range)؛ الاستجابة هنا رؤوس فقط
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        response.headers['X-Accel-Redirect'] = accel_path
+        response.cache_control.no_cache = True
+        return response
+
+    response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+    if remove:
+        # send_file فتح الملف بالفعل، فيمكن حذفه الآن وتبقى القراءة صالحة حتى يغلق
+        try:
+            os.remove(path)
+        except OSError:
+            # (Windows) الحذف بعد إغلاق الاستجابة بدلاً من ذلك
+            response.response = ClosingIterator(response.response, lambda: os.path.exists(path) and os.remove(path))
+    return response
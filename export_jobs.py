@@ -0,0 +1,208 @@
+"""
+Background export jobs (/api/export_jobs)
+
+An export request only queues a job and returns. A small thread pool in the
+worker process that received it builds the file into EXPORT_FOLDER and
+records progress in export_jobs, so any gunicorn worker can answer the
+status polls and serve the finished file. There is no broker: a running
+job whose worker died stops sending progress and is reported as failed
+once its heartbeat is stale. Queued jobs send no heartbeat while they wait
+for a pool thread, so they are never marked stale; a job left queued by a
+dead worker just expires. Finished files expire after EXPORT_JOB_TTL_HOURS and
+are removed when the next job is queued.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database_manager
+from database_manager import adapt_query
+
+EXPORT_JOB_SETTINGS = {
+    'FOLDER': os.getenv('EXPORT_FOLDER', os.path.join(tempfile.gettempdir(), 'pop_exports')),
+    'WORKERS': int(os.getenv('EXPORT_JOB_WORKERS', 2)),
+    'TTL_SECONDS': int(os.getenv('EXPORT_JOB_TTL_HOURS', 24)) * 3600,
+    # المهمة التي لم تحدث تقدمها خلال هذه المدة تعتبر متوقفة (مات الـ worker)
+    'STALE_SECONDS': int(os.getenv('EXPORT_JOB_STALE_SECONDS', 300)),
+    'PROGRESS_INTERVAL': 1.0,
+}
+
+EXPORT_KINDS = ('enhanced', 'simple')
+
+JOB_COLUMNS = ('id', 'user_id', 'kind', 'filters', 'status', 'rows_total', 'rows_done', 'images_total',
+               'images_done', 'filename', 'file_path', 'byte_size', 'error', 'created_at', 'updated_at',
+               'finished_at', 'expires_at')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Process-wide job pool, created lazily (again after a gunicorn fork)"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_SETTINGS['WORKERS'],
+                                               thread_name_prefix='export-job')
+                _executor_pid = pid
+    return _executor
+
+
+def _update_job(cursor, db_type, job_id, **values):
+    """Update an unfinished job; returns False if it is already done or failed"""
+    values['updated_at'] = int(time.time())
+    assignments = ', '.join(f'{column} = ?' for column in values)
+    # مهمة اعتبرت متوقفة (failed) لا تعود إلى running أو done
+    cursor.execute(adapt_query(f'''UPDATE export_jobs SET {assignments}
+                                   WHERE id = ? AND status IN ('queued', 'running')''', db_type),
+                   list(values.values()) + [job_id])
+    return cursor.rowcount > 0
+
+
+def create_export_job(cursor, db_type, user_id, kind, filters):
+    """Insert a queued job and return its id; the caller commits"""
+    cleanup_expired_jobs(cursor, db_type)
+
+    now = int(time.time())
+    job_id = uuid.uuid4().hex
+    cursor.execute(adapt_query('''INSERT INTO export_jobs
+                                  (id, user_id, kind, filters, status, created_at, updated_at, expires_at)
+                                  VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)''', db_type),
+                   (job_id, user_id, kind, json.dumps(filters), now, now,
+                    now + EXPORT_JOB_SETTINGS['TTL_SECONDS']))
+    return job_id
+
+
+def get_export_job(cursor, db_type, job_id, user_id):
+    """The user's job as a dict, or None; stale running jobs are marked failed"""
+    cursor.execute(adapt_query(f'''SELECT {', '.join(JOB_COLUMNS)} FROM export_jobs
+                                   WHERE id = ? AND user_id = ?''', db_type), (job_id, user_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    job = dict(zip(JOB_COLUMNS, row))
+    stale_before = int(time.time()) - EXPORT_JOB_SETTINGS['STALE_SECONDS']
+    # المهام في الطابور لا ترسل تقدماً حتى تبدأ، فلا تعتبر متوقفة
+    if job['status'] == 'running' and job['updated_at'] < stale_before:
+        job['status'] = 'failed'
+        job['error'] = 'Export stopped responding (the server was restarted)'
+        _update_job(cursor, db_type, job_id, status=job['status'], error=job['error'])
+    return job
+
+
+def cleanup_expired_jobs(cursor, db_type):
+    """Delete expired jobs and their files"""
+    now = int(time.time())
+    cursor.execute(adapt_query('SELECT file_path FROM export_jobs WHERE expires_at < ?', db_type), (now,))
+    for (file_path,) in cursor.fetchall():
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+    cursor.execute(adapt_query('DELETE FROM export_jobs WHERE expires_at < ?', db_type), (now,))
+
+
+class ExportProgress:
+    """Progress callback handed to the Excel builders
+
+    Writes rows/images done to the job row at most once per
+    PROGRESS_INTERVAL, on the job thread's own connection.
+    """
+
+    def __init__(self, conn, db_type, job_id):
+        self.conn = conn
+        self.db_type = db_type
+        self.job_id = job_id
+        self._last_write = 0
+
+    def start(self, rows_total, images_total):
+        self._write(rows_total=rows_total, images_total=images_total)
+
+    def __call__(self, rows_done, images_done):
+        if time.monotonic() - self._last_write >= EXPORT_JOB_SETTINGS['PROGRESS_INTERVAL']:
+            self._write(rows_done=rows_done, images_done=images_done)
+
+    def _write(self, **values):
+        _update_job(self.conn.cursor(), self.db_type, self.job_id, **values)
+        self.conn.commit()
+        self._last_write = time.monotonic()
+
+
+def _run_job(job_id, build):
+    conn, db_type = database_manager.get_connection()
+    try:
+        progress = ExportProgress(conn, db_type, job_id)
+        started = _update_job(conn.cursor(), db_type, job_id, status='running')
+        conn.commit()
+        if not started:
+            print(f"⚠️ Export job {job_id} is no longer queued; skipped")
+            return
+
+        try:
+            temp_path, filename = build(progress)
+            if not temp_path or not os.path.exists(temp_path):
+                raise RuntimeError('Export produced no file')
+
+            os.makedirs(EXPORT_JOB_SETTINGS['FOLDER'], exist_ok=True)
+            file_path = os.path.join(EXPORT_JOB_SETTINGS['FOLDER'], f'{job_id}.xlsx')
+            shutil.move(temp_path, file_path)
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Export job {job_id} failed: {e}")
+            _update_job(conn.cursor(), db_type, job_id, status='failed', error=str(e),
+                        finished_at=int(time.time()))
+            conn.commit()
+            return
+
+        cursor = conn.cursor()
+        cursor.execute(adapt_query('SELECT rows_total, images_total FROM export_jobs WHERE id = ?', db_type),
+                       (job_id,))
+        rows_total, images_total = cursor.fetchone()
+        done = _update_job(cursor, db_type, job_id, status='done', filename=filename, file_path=file_path,
+                           byte_size=os.path.getsize(file_path), rows_done=rows_total or 0,
+                           images_done=images_total or 0, finished_at=int(time.time()))
+        conn.commit()
+        if not done:
+            # اعتبرت متوقفة أثناء البناء: العميل توقف عن المتابعة
+            os.remove(file_path)
+            print(f"⚠️ Export job {job_id} finished after it was marked failed; file discarded")
+            return
+        print(f"✅ Export job {job_id} done: {filename}")
+    finally:
+        conn.close()
+
+
+def start_export_job(job_id, build):
+    """Run build(progress) -> (temp_path, download filename) in the job pool
+
+    Call after the job row is committed. build runs outside the request, so
+    it must open its own database connection and not use flask.request.
+    """
+    _get_executor().submit(_run_job, job_id, build)
+
+
+def job_status(job):
+    """Public JSON fields of a job"""
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'rows_total': job['rows_total'],
+        'rows_done': job['rows_done'],
+        'images_total': job['images_total'],
+        'images_done': job['images_done'],
+        'filename': job['filename'],
+        'byte_size': job['byte_size'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at'],
+        'expires_at': job['expires_at'],
+    }
@@ -0,0 +1,74 @@
+"""
+Batched reading of the filtered entries for the streaming Excel exports
+
+Entries are read one keyset page at a time (the same (entry_ts, id) cursor
+as /api/entries) and get their materials and images per page, so an export
+holds one batch in memory however many rows it covers.
+"""
+
+import os
+
+from database_manager import adapt_query
+from entry_filters import DISPLAY_TYPE_LABEL, MODEL_LABEL, build_entries_page_query, build_filter_clause, encode_cursor
+from entry_materials import with_entry_materials
+from image_store import with_entry_images
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+
+
+def iter_export_entries(cursor, db_type, filters, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the filtered entries newest first, in the with_entry_details layout
+
+    Rows carry entry_ts after the comment (PAGE_COLUMNS).
+    """
+    page_cursor = None
+    while True:
+        query, params = build_entries_page_query(filters, db_type, cursor=page_cursor, limit=batch_size)
+        cursor.execute(adapt_query(query, db_type), params)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        yield from with_entry_images(cursor, db_type, with_entry_materials(cursor, db_type, rows))
+
+        if len(rows) < batch_size:
+            return
+        page_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+
+
+def export_column_lengths(cursor, db_type, filters):
+    """Longest value per simple-export column (and the row count), from SQL
+
+    The streaming writer has to set column widths before its first row, so
+    they are measured with MAX(LENGTH(...)) over the filtered entries instead
+    of a pass over the rows. Returns {column key: length, 'rows': count}.
+    """
+    clause, params = build_filter_clause(filters, db_type)
+    cursor.execute(adapt_query(f'''SELECT COUNT(*), MAX(LENGTH(employee_name)), MAX(LENGTH(employee_code)),
+                                          MAX(LENGTH(branch)), MAX(LENGTH(shop_code)),
+                                          MAX(LENGTH({MODEL_LABEL})), MAX(LENGTH({DISPLAY_TYPE_LABEL})),
+                                          MAX(LENGTH(comment)), MAX(LENGTH(date))
+                                   FROM data_entries WHERE 1=1{clause}''', db_type), params)
+    row = cursor.fetchone()
+    lengths = dict(zip(('rows', 'employee_name', 'employee_code', 'branch', 'shop_code', 'model',
+                        'display_type', 'comment', 'date'), (value or 0 for value in row)))
+
+    # قوائم المواد سطر لكل مادة، فالعرض هو أطول اسم مادة
+    cursor.execute(adapt_query(f'''SELECT em.present, MAX(LENGTH(m.material_name))
+                                   FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                                   WHERE em.entry_id IN (SELECT id FROM data_entries WHERE 1=1{clause})
+                                   GROUP BY em.present''', db_type), params)
+    lengths['selected_materials'] = lengths['missing_materials'] = 0
+    for present, length in cursor.fetchall():
+        lengths['selected_materials' if present else 'missing_materials'] = length or 0
+    return lengths
+
+
+def export_image_count(cursor, db_type, filters):
+    """Number of usable images of the filtered entries (the enhanced export's image total)"""
+    clause, params = build_filter_clause(filters, db_type)
+    cursor.execute(adapt_query(f'''SELECT COUNT(*) FROM entry_images
+                                   WHERE (is_valid = TRUE OR is_valid IS NULL)
+                                   AND entry_id IN (SELECT id FROM data_entries WHERE 1=1{clause})''', db_type),
+                   params)
+    return cursor.fetchone()[0]
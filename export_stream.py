@@ -0,0 +1,159 @@
+"""
+Streaming CSV / NDJSON export of the filtered entries (/api/export.csv)
+
+Meant for BI loads: flat rows, no styling, no file on disk. The rows are
+read in fetchmany batches (through a named server-side cursor on
+PostgreSQL, so the result set stays on the server) and every batch is
+formatted, optionally gzipped with a sync flush, and yielded at once. The
+first bytes go out before the query runs, and memory holds one batch
+however many rows the export has.
+"""
+
+import csv
+import io
+import json
+import os
+import uuid
+import zlib
+
+from database_manager import adapt_query
+from entry_filters import DISPLAY_TYPE_LABEL, MODEL_LABEL, build_entries_query
+
+STREAM_BATCH_SIZE = int(os.getenv('EXPORT_STREAM_BATCH_SIZE', 2000))
+
+STREAM_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+STREAM_COLUMNS = ('id', 'employee_name', 'employee_code', 'branch', 'shop_code', 'model', 'display_type',
+                  'date', 'entry_ts', 'comment', 'selected_materials', 'missing_materials', 'images_count')
+
+# أسماء المواد بترتيب النموذج، مفصولة بـ \x1f داخل الاستعلام (لا يظهر في الأسماء)
+MATERIAL_SEPARATOR = '\x1f'
+
+CSV_MATERIAL_SEPARATOR = '; '
+
+MATERIAL_COLUMNS = ('selected_materials', 'missing_materials')
+
+
+def _materials_sql(db_type, present):
+    if db_type == 'postgresql':
+        return f'''(SELECT string_agg(m.material_name, chr(31) ORDER BY em.position)
+                    FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                    WHERE em.entry_id = data_entries.id AND em.present = {present})'''
+    return f'''(SELECT group_concat(material_name, char(31)) FROM
+                    (SELECT m.material_name FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                     WHERE em.entry_id = data_entries.id AND em.present = {present}
+                     ORDER BY em.position))'''
+
+
+def _entry_subquery(subquery):
+    # NULL بدلاً من قائمة فارغة أو 0 إذا لم يوجد صف data_entries (إدخال محذوف في export_changes)
+    return f'CASE WHEN data_entries.id IS NULL THEN NULL ELSE {subquery} END'
+
+
+def stream_columns_sql(db_type, id_column='id'):
+    """SELECT list matching STREAM_COLUMNS
+
+    Material lists are '' for an entry without materials and NULL only when
+    the data_entries row is missing (a deleted entry joined from entry_changes).
+    """
+    selected = _entry_subquery(f"COALESCE({_materials_sql(db_type, 'TRUE')}, '')")
+    missing = _entry_subquery(f"COALESCE({_materials_sql(db_type, 'FALSE')}, '')")
+    images_count = _entry_subquery('(SELECT COUNT(*) FROM entry_images ei WHERE ei.entry_id = data_entries.id)')
+    return f'''{id_column}, employee_name, employee_code, branch, shop_code, {MODEL_LABEL}, {DISPLAY_TYPE_LABEL},
+               date, entry_ts, comment, {selected}, {missing}, {images_count}'''
+
+
+def iter_query_batches(conn, db_type, query, params, batch_size=STREAM_BATCH_SIZE):
+    """Yield the rows of query in lists of up to batch_size"""
+    if db_type == 'postgresql':
+        # مؤشر مسمى: النتائج تبقى على الخادم وتجلب دفعة دفعة
+        cursor = conn.cursor(name=f'export_stream_{uuid.uuid4().hex}')
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+
+    try:
+        cursor.execute(adapt_query(query, db_type), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_stream_batches(conn, db_type, filters, batch_size=STREAM_BATCH_SIZE):
+    """Yield lists of filtered rows (STREAM_COLUMNS), newest first"""
+    query, params = build_entries_query(filters, db_type, stream_columns_sql(db_type))
+    return iter_query_batches(conn, db_type, query, params, batch_size)
+
+
+def _split_materials(value):
+    if value is None:
+        return None
+    return value.split(MATERIAL_SEPARATOR) if value else []
+
+
+def csv_chunks(batches, columns=STREAM_COLUMNS):
+    """Header line, then one CSV chunk per batch"""
+    material_indexes = [columns.index(name) for name in MATERIAL_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            row = list(row)
+            for index in material_indexes:
+                if row[index]:
+                    row[index] = CSV_MATERIAL_SEPARATOR.join(_split_materials(row[index]))
+            writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(batches, columns=STREAM_COLUMNS):
+    """One JSON object per line, material lists as arrays"""
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for name in MATERIAL_COLUMNS:
+                record[name] = _split_materials(record[name])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        lines.append('')
+        yield '\n'.join(lines)
+
+
+def gzip_chunks(chunks):
+    """gzip a stream of text chunks, flushing after each so the client gets it right away"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream_body(conn, batches, fmt, gzip=False, columns=STREAM_COLUMNS):
+    """Response body generator formatting batches as fmt; closes conn when done"""
+    def body():
+        try:
+            chunks = csv_chunks(batches, columns) if fmt == 'csv' else ndjson_chunks(batches, columns)
+            if gzip:
+                yield from gzip_chunks(chunks)
+            else:
+                for chunk in chunks:
+                    yield chunk.encode('utf-8')
+        finally:
+            conn.close()
+    return body()
+
+
+def stream_export(conn, db_type, filters, fmt, gzip=False):
+    """Response body generator for /api/export.<fmt>; closes conn when done"""
+    return stream_body(conn, iter_stream_batches(conn, db_type, filters), fmt, gzip)
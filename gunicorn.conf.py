@@ -0,0 +1,13 @@
+"""
+إعدادات gunicorn
+
+تطبق ترحيلات قاعدة البيانات مرة واحدة في العملية الرئيسية قبل إنشاء
+العمال، فيكتفي كل عامل عند الإقلاع بفحص رقم الإصدار فقط.
+"""
+
+
+def on_starting(server):
+    from migrations import ensure_schema
+
+    applied = ensure_schema()
+    server.log.info("Database schema ready (%d migrations applied)", applied)
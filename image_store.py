@@ -0,0 +1,197 @@
+"""
+Uploaded entry images: storage, metadata and thumbnails
+
+Every image saved by submit_data is described once at upload time (size,
+dimensions, content hash, MIME type, validity) and gets a JPEG thumbnail
+keyed by its content hash. The entry_images table holds that metadata so
+the dashboard and the exports never have to open files to learn about them.
+"""
+
+import hashlib
+import mimetypes
+import os
+from io import BytesIO
+
+from PIL import Image as PILImage, ImageOps
+
+from database_manager import adapt_query
+
+UPLOAD_FOLDER = 'static/uploads'
+THUMBNAIL_FOLDER = 'thumbs'
+THUMBNAIL_MAX_SIZE = (400, 400)
+THUMBNAIL_QUALITY = 80
+
+# الملفات الأصغر من 1 كيلوبايت تعتبر تالفة (نفس قاعدة التصدير السابقة)
+MIN_IMAGE_BYTES = 1000
+
+IMAGE_COLUMNS = ('filename', 'byte_size', 'width', 'height', 'content_hash', 'mime_type', 'thumbnail', 'is_valid')
+
+# حد آمن لعدد المتغيرات في IN (...) على SQLite
+ID_BATCH_SIZE = 500
+
+# عدد الصور الموصوفة في كل معاملة (flask backfill-images)
+BACKFILL_BATCH_SIZE = 200
+
+
+def _make_thumbnail(img, content_hash, upload_folder):
+    thumbnail = f'{THUMBNAIL_FOLDER}/{content_hash[:32]}.jpg'
+    thumbnail_path = os.path.join(upload_folder, thumbnail)
+    if os.path.exists(thumbnail_path):
+        return thumbnail
+
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    thumb = ImageOps.exif_transpose(img).convert('RGB')
+    thumb.thumbnail(THUMBNAIL_MAX_SIZE)
+    thumb.save(thumbnail_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return thumbnail
+
+
+def describe_image(filename, upload_folder=UPLOAD_FOLDER):
+    """Metadata dict (IMAGE_COLUMNS) for an uploaded file, creating its thumbnail"""
+    info = dict.fromkeys(IMAGE_COLUMNS)
+    info['filename'] = filename
+    info['is_valid'] = False
+
+    try:
+        with open(os.path.join(upload_folder, filename), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return info
+
+    info['byte_size'] = len(data)
+    info['content_hash'] = hashlib.sha256(data).hexdigest()
+    info['mime_type'] = mimetypes.guess_type(filename)[0]
+
+    if len(data) < MIN_IMAGE_BYTES:
+        return info
+
+    try:
+        with PILImage.open(BytesIO(data)) as img:
+            img.verify()
+        with PILImage.open(BytesIO(data)) as img:
+            info['width'], info['height'] = img.size
+            info['mime_type'] = PILImage.MIME.get(img.format, info['mime_type'])
+            info['thumbnail'] = _make_thumbnail(img, info['content_hash'], upload_folder)
+        info['is_valid'] = True
+    except Exception as e:
+        print(f"⚠️ Invalid image {filename}: {e}")
+
+    return info
+
+
+def ensure_thumbnail(image, upload_folder=UPLOAD_FOLDER):
+    """Path of an image's thumbnail file, regenerated from the original if missing"""
+    if image['thumbnail']:
+        thumbnail_path = os.path.join(upload_folder, image['thumbnail'])
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+    if not image['content_hash']:
+        if image['is_valid'] is None:
+            # لم توصف بعد (قبل flask backfill-images): الصورة المصغرة من الأصل مباشرة
+            thumbnail = describe_image(image['filename'], upload_folder)['thumbnail']
+            return os.path.join(upload_folder, thumbnail) if thumbnail else None
+        return None
+
+    try:
+        with PILImage.open(os.path.join(upload_folder, image['filename'])) as img:
+            return os.path.join(upload_folder, _make_thumbnail(img, image['content_hash'], upload_folder))
+    except Exception as e:
+        print(f"⚠️ Could not create thumbnail for {image['filename']}: {e}")
+        return None
+
+
+def save_upload(file, filename, upload_folder=UPLOAD_FOLDER):
+    """Save an uploaded file and return its metadata"""
+    file.save(os.path.join(upload_folder, filename))
+    return describe_image(filename, upload_folder)
+
+
+def save_entry_images(cursor, db_type, entry_id, images):
+    """Insert the metadata dicts of an entry's images, in upload order"""
+    columns = ', '.join(IMAGE_COLUMNS)
+    placeholders = ', '.join('?' for _ in IMAGE_COLUMNS)
+    cursor.executemany(adapt_query(f'''INSERT INTO entry_images (entry_id, position, {columns})
+                                       VALUES (?, ?, {placeholders})''', db_type),
+                       [(entry_id, position) + tuple(image[column] for column in IMAGE_COLUMNS)
+                        for position, image in enumerate(images)])
+
+
+def load_entry_images(cursor, db_type, entry_ids):
+    """Return {entry_id: [metadata dict, ...]} in upload order"""
+    images = {entry_id: [] for entry_id in entry_ids}
+    entry_ids = list(images)
+
+    for start in range(0, len(entry_ids), ID_BATCH_SIZE):
+        batch = entry_ids[start:start + ID_BATCH_SIZE]
+        placeholders = ', '.join('?' for _ in batch)
+        cursor.execute(adapt_query(f'''SELECT entry_id, {', '.join(IMAGE_COLUMNS)} FROM entry_images
+                                       WHERE entry_id IN ({placeholders})
+                                       ORDER BY entry_id, position''', db_type), batch)
+        for row in cursor.fetchall():
+            image = dict(zip(IMAGE_COLUMNS, row[1:]))
+            # None = لم توصف بعد (انظر backfill_entry_images)
+            if image['is_valid'] is not None:
+                image['is_valid'] = bool(image['is_valid'])
+            images[row[0]].append(image)
+
+    return images
+
+
+def backfill_entry_images(conn, db_type, batch_size=BACKFILL_BATCH_SIZE, upload_folder=UPLOAD_FOLDER):
+    """Describe the images copied without metadata (is_valid NULL), committing each batch
+
+    Yields the number of images described so far after every batch.
+    """
+    cursor = conn.cursor()
+    assignments = ', '.join(f'{column} = ?' for column in IMAGE_COLUMNS if column != 'filename')
+    last_id = 0
+    done = 0
+    while True:
+        cursor.execute(adapt_query('''SELECT id, filename FROM entry_images
+                                       WHERE is_valid IS NULL AND id > ? ORDER BY id LIMIT ?''', db_type),
+                       (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        updates = []
+        for image_id, filename in rows:
+            info = describe_image(filename, upload_folder)
+            updates.append(tuple(info[column] for column in IMAGE_COLUMNS if column != 'filename') + (image_id,))
+        cursor.executemany(adapt_query(f'UPDATE entry_images SET {assignments} WHERE id = ?', db_type), updates)
+        conn.commit()
+        done += len(rows)
+        yield done
+
+
+def with_entry_images(cursor, db_type, rows):
+    """Insert each row's image list at position 9 (after the material lists)"""
+    images = load_entry_images(cursor, db_type, [row[0] for row in rows])
+    return [tuple(row[:9]) + (images[row[0]],) + tuple(row[9:]) for row in rows]
+
+
+def entry_image_files(cursor, db_type, where, params):
+    """(filename, thumbnail) of the images of the entries matching a data_entries condition"""
+    cursor.execute(adapt_query(f'''SELECT filename, thumbnail FROM entry_images
+                                   WHERE entry_id IN (SELECT id FROM data_entries WHERE {where})''', db_type),
+                   params)
+    return cursor.fetchall()
+
+
+def remove_unreferenced_files(cursor, db_type, files, upload_folder=UPLOAD_FOLDER):
+    """Delete image and thumbnail files no remaining entry_images row uses
+
+    Call after the entries were deleted; thumbnails are shared by identical
+    uploads, so they are kept while any other image still points at them.
+    """
+    for filename, thumbnail in files:
+        for column, name in (('filename', filename), ('thumbnail', thumbnail)):
+            if not name or name.startswith('http'):
+                continue
+            cursor.execute(adapt_query(f'SELECT 1 FROM entry_images WHERE {column} = ? LIMIT 1', db_type), (name,))
+            if cursor.fetchone():
+                continue
+            path = os.path.join(upload_folder, name)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,18 @@
+"""
+Add columns that older databases created before full_name/comment existed
+may be missing (previously probed with ALTER TABLE on every start).
+"""
+
+from migrations import column_exists
+
+LEGACY_COLUMNS = [
+    ('users', 'created_date', 'TEXT'),
+    ('users', 'full_name', 'TEXT'),
+    ('data_entries', 'comment', 'TEXT'),
+]
+
+
+def upgrade(cursor, db_type, current_time):
+    for table, column, column_type in LEGACY_COLUMNS:
+        if not column_exists(cursor, db_type, table, column):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
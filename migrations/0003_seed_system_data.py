@@ -0,0 +1,127 @@
+"""
+Seed the admin account and the default catalog.
+
+Databases created before versioned migrations track what they already
+seeded in db_init_status; those components are skipped so that defaults
+an admin has since deleted are not brought back.
+"""
+
+from werkzeug.security import generate_password_hash
+
+from database_manager import insert_or_ignore
+from migrations import table_exists
+
+
+def upgrade(cursor, db_type, current_time):
+    initialized = set()
+    if table_exists(cursor, db_type, 'db_init_status'):
+        cursor.execute('SELECT component FROM db_init_status WHERE initialized = TRUE')
+        initialized = {row[0] for row in cursor.fetchall()}
+
+    # Check if admin user exists
+    cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = TRUE')
+    admin_count = cursor.fetchone()[0]
+
+    if admin_count == 0:
+        print("🔧 Creating admin user...")
+        admin_password = generate_password_hash('admin123')
+        cursor.execute('INSERT INTO users (name, company_code, password, is_admin) VALUES (?, ?, ?, ?)',
+                       ('Admin', 'ADMIN', admin_password, True))
+        print("✅ Admin user created")
+
+    if 'default_categories' not in initialized:
+        initialize_default_categories(cursor, db_type, current_time)
+    if 'default_models' not in initialized:
+        initialize_default_models(cursor, db_type, current_time)
+    if 'default_display_types' not in initialized:
+        initialize_default_display_types(cursor, db_type, current_time)
+    if 'default_pop_materials' not in initialized:
+        initialize_default_pop_materials(cursor, db_type, current_time)
+
+
+def initialize_default_categories(cursor, db_type, current_time):
+    """Initialize default categories"""
+    categories = ['OLED', 'Neo QLED', 'QLED', 'UHD', 'LTV', 'BESPOKE COMBO',
+                  'BESPOKE Front', 'Front', 'TL', 'SBS', 'TMF', 'BMF', 'Local TMF']
+
+    query = insert_or_ignore(db_type, 'categories', ['category_name', 'created_date'])
+    cursor.executemany(query, [(category, current_time) for category in categories])
+
+
+def initialize_default_models(cursor, db_type, current_time):
+    """Initialize default models"""
+    models_data = {
+        'OLED': ['S95F', 'S90F', 'S85F'],
+        'Neo QLED': ['QN90', 'QN85F', 'QN80F', 'QN70F'],
+        'QLED': ['Q8F', 'Q7F'],
+        'UHD': ['U8000', '100"/98"'],
+        'LTV': ['The Frame'],
+        'BESPOKE COMBO': ['WD25DB8995', 'WD21D6400'],
+        'BESPOKE Front': ['WW11B1944DGB'],
+        'Front': ['WW11B1534D', 'WW90CGC', 'WW4040', 'WW4020'],
+        'TL': ['WA19CG6886', 'Local TL'],
+        'SBS': ['RS70F'],
+        'TMF': ['Bespoke', 'TMF Non-Bespoke', 'TMF'],
+        'BMF': ['(Bespoke, BMF)', '(Non-Bespoke, BMF)'],
+        'Local TMF': ['Local TMF']
+    }
+
+    query = insert_or_ignore(db_type, 'models', ['model_name', 'category_name', 'created_date'])
+    cursor.executemany(query, [(model, category, current_time)
+                               for category, models in models_data.items() for model in models])
+
+
+def initialize_default_display_types(cursor, db_type, current_time):
+    """Initialize default display types"""
+    display_types_data = {
+        'OLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
+        'Neo QLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
+        'QLED': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
+        'UHD': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
+        'LTV': ['Highlight Zone', 'Fixtures', 'Multi Brand Zone with Space', 'SIS (Endcap)'],
+        'BESPOKE COMBO': ['POP Out', 'POP Inner', 'POP'],
+        'BESPOKE Front': ['POP Out', 'POP Inner', 'POP'],
+        'Front': ['POP Out', 'POP Inner', 'POP'],
+        'TL': ['POP Out', 'POP Inner', 'POP'],
+        'SBS': ['POP Out', 'POP Inner', 'POP'],
+        'TMF': ['POP Out', 'POP Inner', 'POP'],
+        'BMF': ['POP Out', 'POP Inner', 'POP'],
+        'Local TMF': ['POP Out', 'POP Inner', 'POP']
+    }
+
+    query = insert_or_ignore(db_type, 'display_types', ['display_type_name', 'category_name', 'created_date'])
+    cursor.executemany(query, [(display_type, category, current_time)
+                               for category, display_types in display_types_data.items()
+                               for display_type in display_types])
+
+
+def initialize_default_pop_materials(cursor, db_type, current_time):
+    """Initialize default POP materials by model"""
+    # Get existing models
+    cursor.execute('SELECT model_name, category_name FROM models')
+    models = cursor.fetchall()
+
+    # Default materials by model
+    model_materials = {
+        # OLED Models
+        'S95F': ['S95F Premium Topper', 'S95F Gaming Features', 'S95F Design POP', 'Anti-Glare Technology', 'AI topper'],
+        'S90F': ['S90F Smart Features', 'S90F Connectivity POP', 'S90F Performance Card', 'AI topper'],
+        'S85F': ['S85F Essential Features', 'S85F Value POP', 'S85F Specs Display', 'AI topper'],
+
+        # Neo QLED Models
+        'QN90': ['QN90 Neo Quantum', 'QN90 Gaming Hub', 'QN90 Premium Features', 'Neo Quantum Processor 4K', 'AI topper'],
+        'QN85F': ['QN85F Neo Features', 'QN85F Smart Hub', 'QN85F Performance POP', 'AI topper'],
+        'QN80F': ['QN80F Neo Display', 'QN80F Features Card', 'QN80F Value POP', 'AI topper'],
+        'QN70F': ['QN70F Essential Neo', 'QN70F Basic Features', 'QN70F Entry POP', 'AI topper'],
+
+        # Add more models as needed...
+    }
+
+    query = insert_or_ignore(db_type, 'pop_materials_db',
+                             ['material_name', 'model_name', 'category_name', 'created_date'])
+    rows = []
+    for model_name, category_name in models:
+        # Get materials for this model or use default
+        materials = model_materials.get(model_name, [f'{model_name} Standard POP', f'{model_name} Features', 'AI topper'])
+        rows.extend((material, model_name, category_name, current_time) for material in materials)
+    cursor.executemany(query, rows)
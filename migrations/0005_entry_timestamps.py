@@ -0,0 +1,65 @@
+"""
+Store data_entries times as a UTC epoch (entry_ts) next to the local
+display string in `date`, backfill it, and move the date indexes onto it.
+
+A `date` that cannot be parsed gets entry_ts = 0 (the row sorts last and
+falls outside every date range) and is reported, so the backfill is total.
+"""
+
+from timezone_config import LOCAL_TIMEZONE_NAME, local_string_to_epoch
+
+BATCH_SIZE = 1000
+
+# قيمة ثابتة للتواريخ التي لا يمكن تحويلها
+UNPARSED_ENTRY_TS = 0
+
+DATE_INDEXES = [
+    'idx_data_entries_date',
+    'idx_data_entries_employee_code_date',
+    'idx_data_entries_employee_name_date',
+    'idx_data_entries_branch_date',
+    'idx_data_entries_model_date',
+    'idx_data_entries_employee_branch_date',
+    'idx_data_entries_branch_model_date',
+]
+
+TIMESTAMP_INDEXES = {
+    'idx_data_entries_entry_ts': '(entry_ts, id)',
+    'idx_data_entries_employee_code_ts': '(employee_code, entry_ts)',
+    'idx_data_entries_employee_name_ts': '(employee_name, entry_ts)',
+    'idx_data_entries_branch_ts': '(branch, entry_ts)',
+    'idx_data_entries_model_ts': '(model, entry_ts)',
+    'idx_data_entries_employee_branch_ts': '(employee_name, branch, entry_ts)',
+    'idx_data_entries_branch_model_ts': '(branch, model, entry_ts)',
+}
+
+
+def upgrade(cursor, db_type, current_time):
+    if db_type == 'postgresql':
+        cursor.execute('ALTER TABLE data_entries ADD COLUMN IF NOT EXISTS entry_ts BIGINT')
+        # التحويل داخل قاعدة البيانات مع مراعاة التوقيت الصيفي للمنطقة المحلية
+        cursor.execute(f'''UPDATE data_entries
+                           SET entry_ts = EXTRACT(EPOCH FROM (date::timestamp AT TIME ZONE '{LOCAL_TIMEZONE_NAME}'))::BIGINT
+                           WHERE entry_ts IS NULL
+                             AND date ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}( [0-9]{{2}}:[0-9]{{2}}:[0-9]{{2}})?$' ''')
+        cursor.execute('UPDATE data_entries SET entry_ts = ? WHERE entry_ts IS NULL', (UNPARSED_ENTRY_TS,))
+        if cursor.rowcount:
+            print(f"⚠️ {cursor.rowcount} entries have an unparseable date, entry_ts set to {UNPARSED_ENTRY_TS}")
+    else:
+        cursor.execute('ALTER TABLE data_entries ADD COLUMN entry_ts INTEGER')
+        cursor.execute('SELECT id, date FROM data_entries')
+        rows = cursor.fetchall()
+        updates = [(local_string_to_epoch(date), entry_id) for entry_id, date in rows]
+        unparsed = [entry_id for epoch, entry_id in updates if epoch is None]
+        if unparsed:
+            print(f"⚠️ {len(unparsed)} entries have an unparseable date, entry_ts set to {UNPARSED_ENTRY_TS}: "
+                  f"ids {unparsed[:20]}")
+        updates = [(UNPARSED_ENTRY_TS if epoch is None else epoch, entry_id) for epoch, entry_id in updates]
+        for start in range(0, len(updates), BATCH_SIZE):
+            cursor.executemany('UPDATE data_entries SET entry_ts = ? WHERE id = ?',
+                               updates[start:start + BATCH_SIZE])
+
+    for index_name in DATE_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+    for index_name, columns in TIMESTAMP_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON data_entries {columns}')
@@ -0,0 +1,69 @@
+"""
+Substring search index for the dashboard/export filters.
+
+SQLite: an FTS5 table with the trigram tokenizer, kept in sync with
+data_entries by triggers. PostgreSQL: pg_trgm GIN indexes, which serve the
+existing LIKE '%term%' conditions directly.
+"""
+
+SQLITE_MATERIALS_EXPR = "COALESCE({row}.selected_materials, '') || ' ' || COALESCE({row}.unselected_materials, '')"
+
+POSTGRES_MATERIALS_EXPR = "(COALESCE(selected_materials, '') || ' ' || COALESCE(unselected_materials, ''))"
+
+
+def _sqlite_trigram_available(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(value, tokenize='trigram')")
+        cursor.execute('DROP TABLE temp.fts_probe')
+        return True
+    except Exception:
+        return False
+
+
+def _upgrade_sqlite(cursor):
+    if not _sqlite_trigram_available(cursor):
+        print("⚠️ SQLite FTS5 trigram tokenizer not available - search falls back to LIKE")
+        return
+
+    cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS data_entries_fts USING fts5(
+        employee_name, branch, model, comment, materials,
+        tokenize='trigram'
+    )''')
+
+    insert_row = f'''INSERT INTO data_entries_fts (rowid, employee_name, branch, model, comment, materials)
+        VALUES (new.id, new.employee_name, new.branch, new.model, COALESCE(new.comment, ''),
+                {SQLITE_MATERIALS_EXPR.format(row='new')});'''
+
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS data_entries_fts_insert
+        AFTER INSERT ON data_entries BEGIN
+        {insert_row}
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS data_entries_fts_delete
+        AFTER DELETE ON data_entries BEGIN
+        DELETE FROM data_entries_fts WHERE rowid = old.id;
+    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS data_entries_fts_update
+        AFTER UPDATE ON data_entries BEGIN
+        DELETE FROM data_entries_fts WHERE rowid = old.id;
+        {insert_row}
+    END''')
+
+    cursor.execute(f'''INSERT INTO data_entries_fts (rowid, employee_name, branch, model, comment, materials)
+        SELECT id, employee_name, branch, model, COALESCE(comment, ''), {SQLITE_MATERIALS_EXPR.format(row='data_entries')}
+        FROM data_entries''')
+
+
+def _upgrade_postgresql(cursor):
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in ('employee_name', 'branch', 'model', 'comment'):
+        cursor.execute(f'''CREATE INDEX IF NOT EXISTS idx_data_entries_{column}_trgm
+                           ON data_entries USING gin ({column} gin_trgm_ops)''')
+    cursor.execute(f'''CREATE INDEX IF NOT EXISTS idx_data_entries_materials_trgm
+                       ON data_entries USING gin ({POSTGRES_MATERIALS_EXPR} gin_trgm_ops)''')
+
+
+def upgrade(cursor, db_type, current_time):
+    if db_type == 'postgresql':
+        _upgrade_postgresql(cursor)
+    else:
+        _upgrade_sqlite(cursor)
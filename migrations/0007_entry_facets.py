@@ -0,0 +1,97 @@
+"""
+Filter option lists for the admin dashboard (employee, branch, model)
+
+entry_facets holds one row per distinct value with the number of
+data_entries that carry it. Triggers on data_entries keep the counts
+current, so submit_data, delete_entry, the manage_data rename cascades and
+user deletion all maintain it without any code of their own.
+"""
+
+# facet -> العمود المقابل في data_entries
+FACET_COLUMNS = {
+    'employee': 'employee_name',
+    'branch': 'branch',
+    'model': 'model',
+}
+
+
+def _sqlite_add(facet, value):
+    return f'''INSERT INTO entry_facets (facet, value, entry_count) VALUES ('{facet}', {value}, 1)
+            ON CONFLICT (facet, value) DO UPDATE SET entry_count = entry_count + 1;'''
+
+
+def _sqlite_remove(facet, value):
+    return f'''UPDATE entry_facets SET entry_count = entry_count - 1 WHERE facet = '{facet}' AND value = {value};
+        DELETE FROM entry_facets WHERE facet = '{facet}' AND value = {value} AND entry_count <= 0;'''
+
+
+def _upgrade_sqlite(cursor):
+    for facet, column in FACET_COLUMNS.items():
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_facets_{facet}_insert
+            AFTER INSERT ON data_entries BEGIN
+            {_sqlite_add(facet, f'new.{column}')}
+        END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_facets_{facet}_delete
+            AFTER DELETE ON data_entries BEGIN
+            {_sqlite_remove(facet, f'old.{column}')}
+        END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_facets_{facet}_update
+            AFTER UPDATE OF {column} ON data_entries
+            WHEN old.{column} IS NOT new.{column} BEGIN
+            {_sqlite_remove(facet, f'old.{column}')}
+            {_sqlite_add(facet, f'new.{column}')}
+        END''')
+
+
+def _upgrade_postgresql(cursor):
+    cursor.execute('''CREATE OR REPLACE FUNCTION entry_facets_adjust(p_facet TEXT, p_value TEXT, p_delta INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO entry_facets (facet, value, entry_count) VALUES (p_facet, p_value, p_delta)
+            ON CONFLICT (facet, value) DO UPDATE SET entry_count = entry_facets.entry_count + p_delta;
+            DELETE FROM entry_facets WHERE facet = p_facet AND value = p_value AND entry_count <= 0;
+        END;
+        $$ LANGUAGE plpgsql''')
+
+    adjustments = []
+    for facet, column in FACET_COLUMNS.items():
+        adjustments.append(f'''
+            IF TG_OP IN ('UPDATE', 'DELETE') AND (TG_OP = 'DELETE' OR OLD.{column} IS DISTINCT FROM NEW.{column}) THEN
+                PERFORM entry_facets_adjust('{facet}', OLD.{column}, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR OLD.{column} IS DISTINCT FROM NEW.{column}) THEN
+                PERFORM entry_facets_adjust('{facet}', NEW.{column}, 1);
+            END IF;''')
+
+    cursor.execute(f'''CREATE OR REPLACE FUNCTION entry_facets_sync()
+        RETURNS TRIGGER AS $$
+        BEGIN{''.join(adjustments)}
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''')
+
+    cursor.execute('DROP TRIGGER IF EXISTS entry_facets_sync ON data_entries')
+    cursor.execute('''CREATE TRIGGER entry_facets_sync
+        AFTER INSERT OR UPDATE OR DELETE ON data_entries
+        FOR EACH ROW EXECUTE FUNCTION entry_facets_sync()''')
+
+
+def upgrade(cursor, db_type, current_time):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS entry_facets (
+        facet TEXT NOT NULL,
+        value TEXT NOT NULL,
+        entry_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (facet, value)
+    )''')
+
+    if db_type == 'postgresql':
+        _upgrade_postgresql(cursor)
+    else:
+        _upgrade_sqlite(cursor)
+
+    # تعبئة أولية من الإدخالات الحالية
+    cursor.execute('DELETE FROM entry_facets')
+    for facet, column in FACET_COLUMNS.items():
+        cursor.execute(f'''INSERT INTO entry_facets (facet, value, entry_count)
+                           SELECT '{facet}', {column}, COUNT(*) FROM data_entries
+                           WHERE {column} IS NOT NULL GROUP BY {column}''')
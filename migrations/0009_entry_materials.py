@@ -0,0 +1,135 @@
+"""
+Move the per-entry material checklist from the comma-joined
+selected_materials / unselected_materials columns into
+materials + entry_materials, backfill it, and drop the old columns.
+
+The search index keeps a materials column: on SQLite the FTS5 triggers now
+read it from entry_materials, on PostgreSQL a pg_trgm index on
+materials.material_name replaces the expression index over the old columns.
+"""
+
+from database_manager import insert_or_ignore
+from migrations import table_exists
+
+BATCH_SIZE = 1000
+
+MATERIALS_TEXT = '''COALESCE((SELECT group_concat(m.material_name, ' ')
+                  FROM entry_materials em JOIN materials m ON m.id = em.material_id
+                  WHERE em.entry_id = {entry_id}), '')'''
+
+
+def _create_tables(cursor, db_type):
+    if db_type == 'postgresql':
+        cursor.execute('''CREATE TABLE IF NOT EXISTS materials (
+            id SERIAL PRIMARY KEY,
+            material_name TEXT NOT NULL UNIQUE
+        )''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS entry_materials (
+            entry_id INTEGER NOT NULL REFERENCES data_entries (id) ON DELETE CASCADE,
+            material_id INTEGER NOT NULL REFERENCES materials (id),
+            present BOOLEAN NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (entry_id, material_id)
+        )''')
+    else:
+        cursor.execute('''CREATE TABLE IF NOT EXISTS materials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            material_name TEXT NOT NULL UNIQUE
+        )''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS entry_materials (
+            entry_id INTEGER NOT NULL REFERENCES data_entries (id) ON DELETE CASCADE,
+            material_id INTEGER NOT NULL REFERENCES materials (id),
+            present INTEGER NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (entry_id, material_id)
+        )''')
+
+    # استعلامات الالتزام: "أي الإدخالات ينقصها هذا العنصر"
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_entry_materials_material
+                      ON entry_materials (material_id, present, entry_id)''')
+
+
+def _split(value):
+    return [name for name in (value or '').split(',') if name]
+
+
+def _backfill(cursor, db_type):
+    last_id = 0
+    while True:
+        cursor.execute('''SELECT id, selected_materials, unselected_materials FROM data_entries
+                          WHERE id > ? ORDER BY id LIMIT ?''', (last_id, BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        names = sorted({name for _, selected, unselected in rows
+                        for name in _split(selected) + _split(unselected)})
+        cursor.executemany(insert_or_ignore(db_type, 'materials', ('material_name',)),
+                           [(name,) for name in names])
+        cursor.execute('SELECT id, material_name FROM materials')
+        material_ids = {name: material_id for material_id, name in cursor.fetchall()}
+
+        entry_rows = []
+        for entry_id, selected, unselected in rows:
+            seen = set()
+            items = [(name, True) for name in _split(selected)] + [(name, False) for name in _split(unselected)]
+            for position, (name, present) in enumerate(items):
+                if name not in seen:
+                    seen.add(name)
+                    entry_rows.append((entry_id, material_ids[name], present, position))
+        cursor.executemany('''INSERT INTO entry_materials (entry_id, material_id, present, position)
+                              VALUES (?, ?, ?, ?)''', entry_rows)
+
+
+def _upgrade_sqlite_search(cursor):
+    # SQLite لا يطبق ON DELETE CASCADE بدون PRAGMA foreign_keys
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS entry_materials_cascade
+        AFTER DELETE ON data_entries BEGIN
+        DELETE FROM entry_materials WHERE entry_id = old.id;
+    END''')
+
+    if not table_exists(cursor, 'sqlite', 'data_entries_fts'):
+        return
+
+    insert_row = f'''INSERT INTO data_entries_fts (rowid, employee_name, branch, model, comment, materials)
+        VALUES (new.id, new.employee_name, new.branch, new.model, COALESCE(new.comment, ''),
+                {MATERIALS_TEXT.format(entry_id='new.id')});'''
+    refresh_materials = '''UPDATE data_entries_fts SET materials = {text} WHERE rowid = {entry_id};'''
+
+    cursor.execute('DROP TRIGGER IF EXISTS data_entries_fts_insert')
+    cursor.execute('DROP TRIGGER IF EXISTS data_entries_fts_update')
+    cursor.execute(f'''CREATE TRIGGER data_entries_fts_insert
+        AFTER INSERT ON data_entries BEGIN
+        {insert_row}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER data_entries_fts_update
+        AFTER UPDATE ON data_entries BEGIN
+        DELETE FROM data_entries_fts WHERE rowid = old.id;
+        {insert_row}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER entry_materials_fts_insert
+        AFTER INSERT ON entry_materials BEGIN
+        {refresh_materials.format(text=MATERIALS_TEXT.format(entry_id='new.entry_id'), entry_id='new.entry_id')}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER entry_materials_fts_delete
+        AFTER DELETE ON entry_materials BEGIN
+        {refresh_materials.format(text=MATERIALS_TEXT.format(entry_id='old.entry_id'), entry_id='old.entry_id')}
+    END''')
+
+    cursor.execute(f'UPDATE data_entries_fts SET materials = {MATERIALS_TEXT.format(entry_id="data_entries_fts.rowid")}')
+
+
+def upgrade(cursor, db_type, current_time):
+    _create_tables(cursor, db_type)
+    _backfill(cursor, db_type)
+
+    if db_type == 'postgresql':
+        cursor.execute('DROP INDEX IF EXISTS idx_data_entries_materials_trgm')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_materials_name_trgm
+                          ON materials USING gin (material_name gin_trgm_ops)''')
+    else:
+        _upgrade_sqlite_search(cursor)
+
+    cursor.execute('ALTER TABLE data_entries DROP COLUMN selected_materials')
+    cursor.execute('ALTER TABLE data_entries DROP COLUMN unselected_materials')
@@ -0,0 +1,72 @@
+"""
+Move entry images from the comma-joined data_entries.images column into
+entry_images, with per-image metadata and thumbnails.
+
+Only the filenames are copied here, so startup does not wait for every
+historical upload to be decoded. Their metadata columns stay NULL
+(is_valid NULL = not described yet) until `flask backfill-images` fills
+them in batches; until then the exports treat them as usable and create
+thumbnails on demand. External URLs are copied as invalid rows.
+
+data_entries.images is left in place; a later migration drops it once the
+backfill has been confirmed.
+"""
+
+BATCH_SIZE = 1000
+
+
+def _create_table(cursor, db_type):
+    if db_type == 'postgresql':
+        id_column = 'id SERIAL PRIMARY KEY'
+        is_valid = 'is_valid BOOLEAN'
+    else:
+        id_column = 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+        is_valid = 'is_valid INTEGER'
+
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS entry_images (
+        {id_column},
+        entry_id INTEGER NOT NULL REFERENCES data_entries (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL DEFAULT 0,
+        filename TEXT NOT NULL,
+        byte_size INTEGER,
+        width INTEGER,
+        height INTEGER,
+        content_hash TEXT,
+        mime_type TEXT,
+        thumbnail TEXT,
+        {is_valid}
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_entry_images_entry ON entry_images (entry_id, position)')
+    # للتحقق من أن الملف أو الصورة المصغرة لم يعد مستخدماً قبل حذفه
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_entry_images_filename ON entry_images (filename)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_entry_images_thumbnail ON entry_images (thumbnail)')
+
+    if db_type == 'sqlite':
+        # SQLite لا يطبق ON DELETE CASCADE بدون PRAGMA foreign_keys
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS entry_images_cascade
+            AFTER DELETE ON data_entries BEGIN
+            DELETE FROM entry_images WHERE entry_id = old.id;
+        END''')
+
+
+def upgrade(cursor, db_type, current_time):
+    _create_table(cursor, db_type)
+
+    last_id = 0
+    while True:
+        cursor.execute('''SELECT id, images FROM data_entries
+                          WHERE id > ? ORDER BY id LIMIT ?''', (last_id, BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        image_rows = []
+        for entry_id, images in rows:
+            filenames = [name.strip() for name in (images or '').split(',') if name.strip()]
+            for position, filename in enumerate(filenames):
+                # الروابط الخارجية غير صالحة؛ الملفات المحلية توصف لاحقاً (NULL)
+                is_valid = False if filename.startswith('http') else None
+                image_rows.append((entry_id, position, filename, is_valid))
+        cursor.executemany('''INSERT INTO entry_images (entry_id, position, filename, is_valid)
+                               VALUES (?, ?, ?, ?)''', image_rows)
@@ -0,0 +1,286 @@
+"""
+Reference the catalog by id instead of by name.
+
+models and display_types point at categories.id, pop_materials_db and
+model_images at models.id, and data_entries gets model_id and
+display_type_id. Renaming a catalog item is then a single-row UPDATE, and
+deletes cascade through foreign keys (triggers on SQLite, which does not
+enforce them). data_entries.model / display_type keep the names as
+submitted and are only shown once the catalog row is gone.
+
+The model facet of entry_facets is re-keyed on model_id so that the
+dashboard filter follows renames too.
+
+Catalog rows whose parent no longer resolves by name (a model of a
+deleted category, say) cannot get an id. They are not silently lost:
+each is printed and kept as JSON in catalog_orphans so it can be
+re-created by hand.
+"""
+
+import json
+
+BATCH_SIZE = 1000
+
+# فهارس الموديل القديمة (بالاسم) -> فهارس model_id
+OLD_MODEL_INDEXES = ['idx_data_entries_model_ts', 'idx_data_entries_branch_model_ts']
+
+ID_INDEXES = {
+    'idx_data_entries_model_id_ts': '(model_id, entry_ts)',
+    'idx_data_entries_branch_model_id_ts': '(branch, model_id, entry_ts)',
+    'idx_data_entries_display_type_id': '(display_type_id)',
+}
+
+# جداول الكتالوج: (الجدول, الأعمدة الجديدة, SELECT لنسخ الصفوف من الجدول القديم)
+SQLITE_CATALOG_TABLES = [
+    ('models', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_name TEXT NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories (id) ON DELETE CASCADE,
+        created_date TEXT NOT NULL,
+        UNIQUE(model_name, category_id)''', '''
+        SELECT o.id, o.model_name, c.id, o.created_date
+        FROM models_old o JOIN categories c ON c.category_name = o.category_name'''),
+    ('display_types', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        display_type_name TEXT NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories (id) ON DELETE CASCADE,
+        created_date TEXT NOT NULL,
+        UNIQUE(display_type_name, category_id)''', '''
+        SELECT o.id, o.display_type_name, c.id, o.created_date
+        FROM display_types_old o JOIN categories c ON c.category_name = o.category_name'''),
+    ('pop_materials_db', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        material_name TEXT NOT NULL,
+        model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+        created_date TEXT NOT NULL,
+        UNIQUE(material_name, model_id)''', '''
+        SELECT o.id, o.material_name, m.id, o.created_date
+        FROM pop_materials_db_old o
+        JOIN categories c ON c.category_name = o.category_name
+        JOIN models m ON m.model_name = o.model_name AND m.category_id = c.id'''),
+    ('model_images', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model_id INTEGER NOT NULL UNIQUE REFERENCES models (id) ON DELETE CASCADE,
+        image_url TEXT NOT NULL,
+        created_date TEXT NOT NULL''', '''
+        SELECT o.id, m.id, o.image_url, o.created_date
+        FROM model_images_old o
+        JOIN categories c ON c.category_name = o.category_name
+        JOIN models m ON m.model_name = o.model_name AND m.category_id = c.id'''),
+]
+
+CATALOG_INDEXES = {
+    'idx_models_category': 'models (category_id)',
+    'idx_display_types_category': 'display_types (category_id)',
+    'idx_pop_materials_db_model': 'pop_materials_db (model_id)',
+}
+
+
+def _sqlite_add_facet(value):
+    return f'''INSERT INTO entry_facets (facet, value, entry_count) VALUES ('model', {value}, 1)
+            ON CONFLICT (facet, value) DO UPDATE SET entry_count = entry_count + 1;'''
+
+
+def _sqlite_remove_facet(value):
+    return f'''UPDATE entry_facets SET entry_count = entry_count - 1 WHERE facet = 'model' AND value = {value};
+        DELETE FROM entry_facets WHERE facet = 'model' AND value = {value} AND entry_count <= 0;'''
+
+
+def _keep_orphans(cursor, table, select_orphans):
+    """Save the rows returned by select_orphans to catalog_orphans and report them"""
+    cursor.execute(select_orphans)
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    if not rows:
+        return
+
+    print(f"⚠️ {len(rows)} {table} rows could not be linked to their parent and were moved to catalog_orphans:")
+    for row in rows:
+        print(f"   {dict(zip(columns, row))}")
+    cursor.executemany('INSERT INTO catalog_orphans (table_name, row_data) VALUES (?, ?)',
+                       [(table, json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                        for row in rows])
+
+
+def _upgrade_sqlite_catalog(cursor):
+    for table, columns, copy_rows in SQLITE_CATALOG_TABLES:
+        # SQLite لا يحذف عموداً داخل قيد UNIQUE، لذلك يعاد بناء الجدول
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+        cursor.execute(f'CREATE TABLE {table} ({columns}\n    )')
+        cursor.execute(f'INSERT OR IGNORE INTO {table} {copy_rows}')
+        # الصفوف التي لم تنسخ (الأب غير موجود بالاسم)
+        _keep_orphans(cursor, table, f'SELECT * FROM {table}_old WHERE id NOT IN (SELECT id FROM {table})')
+        cursor.execute(f'DROP TABLE {table}_old')
+
+    # SQLite لا يطبق ON DELETE CASCADE / SET NULL بدون PRAGMA foreign_keys
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS categories_cascade
+        AFTER DELETE ON categories BEGIN
+        DELETE FROM models WHERE category_id = old.id;
+        DELETE FROM display_types WHERE category_id = old.id;
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS models_cascade
+        AFTER DELETE ON models BEGIN
+        DELETE FROM pop_materials_db WHERE model_id = old.id;
+        DELETE FROM model_images WHERE model_id = old.id;
+        UPDATE data_entries SET model_id = NULL WHERE model_id = old.id;
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS display_types_cascade
+        AFTER DELETE ON display_types BEGIN
+        UPDATE data_entries SET display_type_id = NULL WHERE display_type_id = old.id;
+    END''')
+
+
+def _upgrade_sqlite_facets(cursor):
+    for suffix in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS entry_facets_model_{suffix}')
+
+    cursor.execute(f'''CREATE TRIGGER entry_facets_model_insert
+        AFTER INSERT ON data_entries WHEN new.model_id IS NOT NULL BEGIN
+        {_sqlite_add_facet('new.model_id')}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER entry_facets_model_delete
+        AFTER DELETE ON data_entries WHEN old.model_id IS NOT NULL BEGIN
+        {_sqlite_remove_facet('old.model_id')}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER entry_facets_model_update_remove
+        AFTER UPDATE OF model_id ON data_entries
+        WHEN old.model_id IS NOT new.model_id AND old.model_id IS NOT NULL BEGIN
+        {_sqlite_remove_facet('old.model_id')}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER entry_facets_model_update_add
+        AFTER UPDATE OF model_id ON data_entries
+        WHEN old.model_id IS NOT new.model_id AND new.model_id IS NOT NULL BEGIN
+        {_sqlite_add_facet('new.model_id')}
+    END''')
+
+
+def _upgrade_postgresql_catalog(cursor):
+    # (الجدول, العمود الجديد, الجدول المرجعي, شرط الربط, الأعمدة القديمة, قيد UNIQUE الجديد)
+    references = [
+        ('models', 'category_id', 'categories', 'categories.category_name = models.category_name',
+         ['category_name'], '(model_name, category_id)'),
+        ('display_types', 'category_id', 'categories', 'categories.category_name = display_types.category_name',
+         ['category_name'], '(display_type_name, category_id)'),
+        ('pop_materials_db', 'model_id', 'models',
+         '''models.model_name = pop_materials_db.model_name AND models.category_id =
+            (SELECT id FROM categories WHERE category_name = pop_materials_db.category_name)''',
+         ['model_name', 'category_name'], '(material_name, model_id)'),
+        ('model_images', 'model_id', 'models',
+         '''models.model_name = model_images.model_name AND models.category_id =
+            (SELECT id FROM categories WHERE category_name = model_images.category_name)''',
+         ['model_name', 'category_name'], '(model_id)'),
+    ]
+    for table, column, parent, join, old_columns, unique in references:
+        cursor.execute(f'''ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} INTEGER
+                           REFERENCES {parent} (id) ON DELETE CASCADE''')
+        cursor.execute(f'UPDATE {table} SET {column} = {parent}.id FROM {parent} WHERE {join}')
+        _keep_orphans(cursor, table, f'SELECT * FROM {table} WHERE {column} IS NULL')
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IS NULL')
+        cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+        # حذف الأعمدة يحذف قيود UNIQUE القديمة المبنية عليها
+        for old_column in old_columns:
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN {old_column}')
+        cursor.execute(f'ALTER TABLE {table} ADD UNIQUE {unique}')
+
+
+def _upgrade_postgresql_facets(cursor):
+    cursor.execute('''CREATE OR REPLACE FUNCTION entry_facets_adjust(p_facet TEXT, p_value TEXT, p_delta INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            IF p_value IS NULL THEN
+                RETURN;
+            END IF;
+            INSERT INTO entry_facets (facet, value, entry_count) VALUES (p_facet, p_value, p_delta)
+            ON CONFLICT (facet, value) DO UPDATE SET entry_count = entry_facets.entry_count + p_delta;
+            DELETE FROM entry_facets WHERE facet = p_facet AND value = p_value AND entry_count <= 0;
+        END;
+        $$ LANGUAGE plpgsql''')
+
+    adjustments = []
+    for facet, column in (('employee', 'employee_name'), ('branch', 'branch'), ('model', 'model_id')):
+        adjustments.append(f'''
+            IF TG_OP IN ('UPDATE', 'DELETE') AND (TG_OP = 'DELETE' OR OLD.{column} IS DISTINCT FROM NEW.{column}) THEN
+                PERFORM entry_facets_adjust('{facet}', OLD.{column}::TEXT, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR OLD.{column} IS DISTINCT FROM NEW.{column}) THEN
+                PERFORM entry_facets_adjust('{facet}', NEW.{column}::TEXT, 1);
+            END IF;''')
+
+    cursor.execute(f'''CREATE OR REPLACE FUNCTION entry_facets_sync()
+        RETURNS TRIGGER AS $$
+        BEGIN{''.join(adjustments)}
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''')
+
+
+def _backfill_entry_ids(cursor):
+    """Match the submitted "Category - Model" / display type names to ids"""
+    cursor.execute('''SELECT m.id, c.id, c.category_name, m.model_name
+                      FROM models m JOIN categories c ON c.id = m.category_id''')
+    models = {f'{category} - {model}': (model_id, category_id)
+              for model_id, category_id, category, model in cursor.fetchall()}
+
+    cursor.execute('SELECT id, category_id, display_type_name FROM display_types')
+    display_types = {(category_id, name): display_type_id
+                     for display_type_id, category_id, name in cursor.fetchall()}
+
+    cursor.execute('SELECT DISTINCT model, display_type FROM data_entries')
+    model_updates = {}
+    display_type_updates = []
+    for label, display_type in cursor.fetchall():
+        if label not in models:
+            continue
+        model_id, category_id = models[label]
+        model_updates[label] = model_id
+        display_type_id = display_types.get((category_id, display_type))
+        if display_type_id is not None:
+            display_type_updates.append((display_type_id, label, display_type))
+
+    # تحديث لكل اسم موديل مختلف عبر فهرس (model, entry_ts)
+    updates = [(model_id, label) for label, model_id in model_updates.items()]
+    for start in range(0, len(updates), BATCH_SIZE):
+        cursor.executemany('UPDATE data_entries SET model_id = ? WHERE model = ?',
+                           updates[start:start + BATCH_SIZE])
+    for start in range(0, len(display_type_updates), BATCH_SIZE):
+        cursor.executemany('UPDATE data_entries SET display_type_id = ? WHERE model = ? AND display_type = ?',
+                           display_type_updates[start:start + BATCH_SIZE])
+
+
+def upgrade(cursor, db_type, current_time):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS catalog_orphans (
+        table_name TEXT NOT NULL,
+        row_data TEXT NOT NULL
+    )''')
+
+    if db_type == 'postgresql':
+        _upgrade_postgresql_catalog(cursor)
+        cursor.execute('''ALTER TABLE data_entries
+                          ADD COLUMN IF NOT EXISTS model_id INTEGER REFERENCES models (id) ON DELETE SET NULL,
+                          ADD COLUMN IF NOT EXISTS display_type_id INTEGER
+                              REFERENCES display_types (id) ON DELETE SET NULL''')
+    else:
+        _upgrade_sqlite_catalog(cursor)
+        cursor.execute('ALTER TABLE data_entries ADD COLUMN model_id INTEGER REFERENCES models (id) ON DELETE SET NULL')
+        cursor.execute('''ALTER TABLE data_entries ADD COLUMN display_type_id INTEGER
+                          REFERENCES display_types (id) ON DELETE SET NULL''')
+
+    for index_name, columns in CATALOG_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {columns}')
+
+    # الفهارس الجديدة قبل التعبئة، فهرس (model, entry_ts) يخدم تحديثات التعبئة
+    for index_name, columns in ID_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON data_entries {columns}')
+    _backfill_entry_ids(cursor)
+    for index_name in OLD_MODEL_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+    if db_type == 'postgresql':
+        _upgrade_postgresql_facets(cursor)
+    else:
+        _upgrade_sqlite_facets(cursor)
+
+    cursor.execute("DELETE FROM entry_facets WHERE facet = 'model'")
+    cursor.execute('''INSERT INTO entry_facets (facet, value, entry_count)
+                      SELECT 'model', CAST(model_id AS TEXT), COUNT(*) FROM data_entries
+                      WHERE model_id IS NOT NULL GROUP BY model_id''')
@@ -0,0 +1,92 @@
+"""
+Change sequence of data_entries for delta exports (/api/export_changes.<fmt>)
+
+entry_changes holds one row per entry id with the sequence number of its
+latest insert, update or delete (deleted rows stay as tombstones).
+Triggers on data_entries assign the numbers, so submit_data, delete_entry,
+user deletion and the catalog delete cascades all record their changes
+without any code of their own. A client that remembers the highest seq it
+has seen reads only the rows above it.
+
+On PostgreSQL every writing transaction takes the same advisory lock
+before drawing a number, so numbers are committed in increasing order and
+a reader never sees a seq while a lower one is still uncommitted (SQLite
+has a single writer already).
+"""
+
+
+def _sqlite_log(entry_id, deleted):
+    # رقم جديد أكبر من كل الأرقام السابقة (كاتب واحد في SQLite)
+    return f'''INSERT INTO entry_changes (entry_id, seq, deleted)
+            VALUES ({entry_id}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM entry_changes), {deleted})
+            ON CONFLICT (entry_id) DO UPDATE SET seq = excluded.seq, deleted = excluded.deleted;'''
+
+
+def _upgrade_sqlite(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS entry_changes (
+        entry_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0
+    )''')
+
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_changes_insert
+        AFTER INSERT ON data_entries BEGIN
+        {_sqlite_log('new.id', 0)}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_changes_update
+        AFTER UPDATE ON data_entries BEGIN
+        {_sqlite_log('new.id', 0)}
+    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS entry_changes_delete
+        AFTER DELETE ON data_entries BEGIN
+        {_sqlite_log('old.id', 1)}
+    END''')
+
+    # تعبئة أولية: كل إدخال حالي تغيير واحد بترتيب id
+    cursor.execute('''INSERT OR IGNORE INTO entry_changes (entry_id, seq, deleted)
+                      SELECT id, ROW_NUMBER() OVER (ORDER BY id), 0 FROM data_entries''')
+
+
+def _upgrade_postgresql(cursor):
+    cursor.execute('CREATE SEQUENCE IF NOT EXISTS entry_changes_seq')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS entry_changes (
+        entry_id INTEGER PRIMARY KEY,
+        seq BIGINT NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT FALSE
+    )''')
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION entry_changes_log()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            -- القفل يبقى حتى COMMIT، فتظهر الأرقام للقراء بترتيبها
+            PERFORM pg_advisory_xact_lock(hashtext('entry_changes'));
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO entry_changes (entry_id, seq, deleted) VALUES (OLD.id, nextval('entry_changes_seq'), TRUE)
+                ON CONFLICT (entry_id) DO UPDATE SET seq = EXCLUDED.seq, deleted = EXCLUDED.deleted;
+            ELSE
+                INSERT INTO entry_changes (entry_id, seq, deleted) VALUES (NEW.id, nextval('entry_changes_seq'), FALSE)
+                ON CONFLICT (entry_id) DO UPDATE SET seq = EXCLUDED.seq, deleted = EXCLUDED.deleted;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''')
+
+    cursor.execute('DROP TRIGGER IF EXISTS entry_changes_log ON data_entries')
+    cursor.execute('''CREATE TRIGGER entry_changes_log
+        AFTER INSERT OR UPDATE OR DELETE ON data_entries
+        FOR EACH ROW EXECUTE FUNCTION entry_changes_log()''')
+
+    # تعبئة أولية: كل إدخال حالي تغيير واحد بترتيب id
+    cursor.execute('''INSERT INTO entry_changes (entry_id, seq, deleted)
+                      SELECT id, nextval('entry_changes_seq'), FALSE
+                      FROM (SELECT id FROM data_entries ORDER BY id) existing
+                      ON CONFLICT (entry_id) DO NOTHING''')
+
+
+def upgrade(cursor, db_type, current_time):
+    if db_type == 'postgresql':
+        _upgrade_postgresql(cursor)
+    else:
+        _upgrade_sqlite(cursor)
+
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_entry_changes_seq ON entry_changes (seq)')
@@ -0,0 +1,45 @@
+"""
+Make data_entries.entry_ts mandatory
+
+Databases that ran 0005 before it had a fallback for unparseable dates can
+still hold NULL entry_ts rows, which every range filter, facet and keyset
+page silently skipped. They get the same fallback here (the parsed `date`
+if possible, otherwise 0, so they sort last), and new NULLs are rejected:
+NOT NULL on PostgreSQL, BEFORE INSERT/UPDATE triggers on SQLite (which
+cannot add NOT NULL to an existing column without rebuilding the table).
+"""
+
+from timezone_config import local_string_to_epoch
+
+UNPARSED_ENTRY_TS = 0
+
+NOT_NULL_MESSAGE = 'NOT NULL constraint failed: data_entries.entry_ts'
+
+
+def _backfill(cursor):
+    cursor.execute('SELECT id, date FROM data_entries WHERE entry_ts IS NULL')
+    rows = cursor.fetchall()
+    if not rows:
+        return
+
+    updates = [(local_string_to_epoch(date), entry_id) for entry_id, date in rows]
+    unparsed = [entry_id for epoch, entry_id in updates if epoch is None]
+    if unparsed:
+        print(f"⚠️ {len(unparsed)} entries have an unparseable date, entry_ts set to {UNPARSED_ENTRY_TS}: "
+              f"ids {unparsed[:20]}")
+    cursor.executemany('UPDATE data_entries SET entry_ts = ? WHERE id = ?',
+                       [(UNPARSED_ENTRY_TS if epoch is None else epoch, entry_id) for epoch, entry_id in updates])
+
+
+def upgrade(cursor, db_type, current_time):
+    _backfill(cursor)
+
+    if db_type == 'postgresql':
+        cursor.execute('ALTER TABLE data_entries ALTER COLUMN entry_ts SET NOT NULL')
+        return
+
+    for event in ('INSERT', 'UPDATE'):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS data_entries_entry_ts_{event.lower()}
+            BEFORE {event} ON data_entries WHEN NEW.entry_ts IS NULL BEGIN
+            SELECT RAISE(ABORT, '{NOT_NULL_MESSAGE}');
+        END''')
@@ -0,0 +1,201 @@
+"""
+Versioned schema migrations
+
+A migration is either a pair of dialect-specific SQL scripts
+(``sqlite/NNNN_name.sql`` and ``postgresql/NNNN_name.sql``) or a Python
+module ``NNNN_name.py`` in this package exposing
+``upgrade(cursor, db_type, current_time)``. Applied versions are recorded in
+the ``schema_version`` table, and migrations run under a database-wide lock
+so that several processes starting together apply each one exactly once.
+"""
+
+import importlib.util
+import os
+import re
+from datetime import datetime
+
+import database_manager
+from database_manager import adapt_query
+from timezone_config import LOCAL_TIMEZONE
+
+try:
+    import fcntl
+except ImportError:  # Windows - لا يوجد قفل ملفات
+    fcntl = None
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADVISORY_LOCK_ID = 73400211
+
+_MIGRATION_FILE = re.compile(r'^(\d{4})_([a-z0-9_]+)\.(sql|py)$')
+_discovered = {}
+
+
+class MigrationCursor:
+    """Cursor wrapper that adapts ? placeholders to the target backend"""
+
+    def __init__(self, cursor, db_type):
+        self._cursor = cursor
+        self.db_type = db_type
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, params=None):
+        if params is None:
+            return self._cursor.execute(query)
+        return self._cursor.execute(adapt_query(query, self.db_type), params)
+
+    def executemany(self, query, seq_of_params):
+        return self._cursor.executemany(adapt_query(query, self.db_type), seq_of_params)
+
+
+def discover_migrations(db_type):
+    """List (version, name, path, kind) for every migration, in order"""
+    if db_type in _discovered:
+        return _discovered[db_type]
+
+    found = {}
+    candidates = [(MIGRATIONS_DIR, 'py'), (os.path.join(MIGRATIONS_DIR, db_type), 'sql')]
+    for directory, kind in candidates:
+        for filename in sorted(os.listdir(directory)):
+            match = _MIGRATION_FILE.match(filename)
+            if not match or match.group(3) != kind:
+                continue
+            version = int(match.group(1))
+            if version in found:
+                raise RuntimeError(f'Duplicate migration version {version}: {filename}')
+            found[version] = (version, match.group(2), os.path.join(directory, filename), kind)
+
+    migrations = [found[version] for version in sorted(found)]
+    _discovered[db_type] = migrations
+    return migrations
+
+
+def latest_version(db_type):
+    migrations = discover_migrations(db_type)
+    return migrations[-1][0] if migrations else 0
+
+
+def table_exists(cursor, db_type, table):
+    if db_type == 'postgresql':
+        cursor.execute('SELECT to_regclass(%s)', (table,))
+        return cursor.fetchone()[0] is not None
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def column_exists(cursor, db_type, table, column):
+    if db_type == 'postgresql':
+        cursor.execute('''SELECT 1 FROM information_schema.columns
+                          WHERE table_name = %s AND column_name = %s''', (table, column))
+        return cursor.fetchone() is not None
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def current_version(conn, db_type):
+    """Highest applied migration version (0 for an unversioned database)"""
+    cursor = conn.cursor()
+    if not table_exists(cursor, db_type, 'schema_version'):
+        return 0
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    version = cursor.fetchone()[0]
+    conn.rollback()
+    return version or 0
+
+
+def _acquire_lock(conn, db_type):
+    if db_type == 'postgresql':
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_advisory_lock(%s)', (ADVISORY_LOCK_ID,))
+        conn.commit()
+        return None
+
+    if fcntl is None:
+        return None
+    lock_file = open(database_manager.SQLITE_DATABASE_PATH + '.migrate.lock', 'w')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def _release_lock(conn, db_type, lock_file):
+    if db_type == 'postgresql':
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_advisory_unlock(%s)', (ADVISORY_LOCK_ID,))
+        conn.commit()
+    elif lock_file is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _apply_migration(conn, db_type, migration, current_time):
+    version, name, path, kind = migration
+
+    if kind == 'sql':
+        with open(path, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        if db_type == 'sqlite':
+            # executescript يعمل خارج المعاملات الضمنية، لذلك نغلف السكربت بمعاملة صريحة
+            conn.executescript(
+                f"BEGIN;\n{sql}\n;"
+                f"INSERT INTO schema_version (version, name, applied_at) "
+                f"VALUES ({version}, '{name}', '{current_time}');\nCOMMIT;"
+            )
+            return
+        cursor = conn.cursor()
+        cursor.execute(sql)
+    else:
+        spec = importlib.util.spec_from_file_location(f'migrations.m{version:04d}_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if db_type == 'sqlite':
+            conn.execute('BEGIN')
+        cursor = MigrationCursor(conn.cursor(), db_type)
+        module.upgrade(cursor, db_type, current_time)
+
+    cursor = MigrationCursor(conn.cursor(), db_type)
+    cursor.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                   (version, name, current_time))
+    conn.commit()
+
+
+def migrate(conn, db_type):
+    """Apply every pending migration; returns the number applied"""
+    lock_file = _acquire_lock(conn, db_type)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )''')
+        conn.commit()
+
+        # قد تكون عملية أخرى طبقت الترحيلات أثناء انتظار القفل
+        applied_version = current_version(conn, db_type)
+        pending = [m for m in discover_migrations(db_type) if m[0] > applied_version]
+
+        for migration in pending:
+            current_time = datetime.now(LOCAL_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"🔧 Applying migration {migration[0]:04d}_{migration[1]}...")
+            try:
+                _apply_migration(conn, db_type, migration, current_time)
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"✅ Migration {migration[0]:04d}_{migration[1]} applied")
+
+        return len(pending)
+    finally:
+        _release_lock(conn, db_type, lock_file)
+
+
+def ensure_schema():
+    """Cheap boot-time check that migrates only when the schema is behind"""
+    conn, db_type = database_manager.get_connection()
+    try:
+        if current_version(conn, db_type) >= latest_version(db_type):
+            return 0
+        return migrate(conn, db_type)
+    finally:
+        conn.close()
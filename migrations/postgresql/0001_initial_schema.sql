@@ -0,0 +1,86 @@
+-- المخطط الأساسي لقاعدة البيانات (PostgreSQL)
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    company_code TEXT NOT NULL,
+    password TEXT NOT NULL,
+    is_admin BOOLEAN DEFAULT FALSE,
+    created_date TEXT DEFAULT to_char(CURRENT_TIMESTAMP, 'YYYY-MM-DD HH24:MI:SS'),
+    full_name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS data_entries (
+    id SERIAL PRIMARY KEY,
+    employee_name TEXT NOT NULL,
+    employee_code TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    shop_code TEXT,
+    model TEXT NOT NULL,
+    display_type TEXT NOT NULL,
+    selected_materials TEXT,
+    unselected_materials TEXT,
+    images TEXT,
+    comment TEXT,
+    date TEXT NOT NULL
+);
+
+-- Branches table for autocomplete
+CREATE TABLE IF NOT EXISTS branches (
+    id SERIAL PRIMARY KEY,
+    branch_name TEXT NOT NULL,
+    shop_code TEXT NOT NULL,
+    employee_code TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(branch_name, employee_code),
+    UNIQUE(shop_code, employee_code)
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    category_name TEXT NOT NULL UNIQUE,
+    created_date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS models (
+    id SERIAL PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(model_name, category_name)
+);
+
+CREATE TABLE IF NOT EXISTS display_types (
+    id SERIAL PRIMARY KEY,
+    display_type_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(display_type_name, category_name)
+);
+
+CREATE TABLE IF NOT EXISTS pop_materials_db (
+    id SERIAL PRIMARY KEY,
+    material_name TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(material_name, model_name)
+);
+
+CREATE TABLE IF NOT EXISTS user_branches (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    branch_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(user_id, branch_name)
+);
+
+-- Model images table for guide images
+CREATE TABLE IF NOT EXISTS model_images (
+    id SERIAL PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    image_url TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(model_name, category_name)
+);
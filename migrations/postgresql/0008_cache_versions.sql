@@ -0,0 +1,9 @@
+-- عدادات إصدارات الكاش المشتركة بين كل العمليات (workers)
+-- كل تعديل على البيانات المخزنة مؤقتاً يزيد الإصدار في نفس المعاملة
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('catalog', 1);
@@ -0,0 +1,25 @@
+-- مهام التصدير في الخلفية (/api/export_jobs)
+-- التقدم محفوظ هنا حتى يرد أي worker على الاستعلام عن الحالة ويرسل الملف
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows_total INTEGER,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    images_total INTEGER,
+    images_done INTEGER NOT NULL DEFAULT 0,
+    filename TEXT,
+    file_path TEXT,
+    byte_size BIGINT,
+    error TEXT,
+    created_at BIGINT NOT NULL,
+    updated_at BIGINT NOT NULL,
+    finished_at BIGINT,
+    expires_at BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_expires_at ON export_jobs (expires_at);
+CREATE INDEX IF NOT EXISTS idx_export_jobs_user ON export_jobs (user_id, created_at);
@@ -0,0 +1,3 @@
+-- إصدار بيانات الإدخالات: يزيد مع كل إضافة أو حذف لإدخالات (كاش ملفات التصدير)
+
+INSERT INTO cache_versions (name, version) VALUES ('entries', 1);
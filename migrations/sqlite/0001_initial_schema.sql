@@ -0,0 +1,87 @@
+-- المخطط الأساسي لقاعدة البيانات (SQLite)
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    company_code TEXT NOT NULL,
+    password TEXT NOT NULL,
+    is_admin BOOLEAN DEFAULT FALSE,
+    created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    full_name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS data_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_name TEXT NOT NULL,
+    employee_code TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    shop_code TEXT,
+    model TEXT NOT NULL,
+    display_type TEXT NOT NULL,
+    selected_materials TEXT,
+    unselected_materials TEXT,
+    images TEXT,
+    comment TEXT,
+    date TEXT NOT NULL
+);
+
+-- Branches table for autocomplete
+CREATE TABLE IF NOT EXISTS branches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_name TEXT NOT NULL,
+    shop_code TEXT NOT NULL,
+    employee_code TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(branch_name, employee_code),
+    UNIQUE(shop_code, employee_code)
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_name TEXT NOT NULL UNIQUE,
+    created_date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(model_name, category_name)
+);
+
+CREATE TABLE IF NOT EXISTS display_types (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    display_type_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(display_type_name, category_name)
+);
+
+CREATE TABLE IF NOT EXISTS pop_materials_db (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_name TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(material_name, model_name)
+);
+
+CREATE TABLE IF NOT EXISTS user_branches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    branch_name TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    UNIQUE(user_id, branch_name)
+);
+
+-- Model images table for guide images
+CREATE TABLE IF NOT EXISTS model_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_name TEXT NOT NULL,
+    category_name TEXT NOT NULL,
+    image_url TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    UNIQUE(model_name, category_name)
+);
@@ -0,0 +1,16 @@
+-- فهارس data_entries لفلاتر لوحة التحكم والتصدير
+
+-- نطاقات التاريخ و ORDER BY date DESC
+CREATE INDEX IF NOT EXISTS idx_data_entries_date ON data_entries (date);
+
+-- فلاتر الموظف (حذف المستخدم يبحث بالكود، ولوحة التحكم بالاسم)
+CREATE INDEX IF NOT EXISTS idx_data_entries_employee_code_date ON data_entries (employee_code, date);
+CREATE INDEX IF NOT EXISTS idx_data_entries_employee_name_date ON data_entries (employee_name, date);
+
+-- فلاتر الفرع والموديل مع التاريخ
+CREATE INDEX IF NOT EXISTS idx_data_entries_branch_date ON data_entries (branch, date);
+CREATE INDEX IF NOT EXISTS idx_data_entries_model_date ON data_entries (model, date);
+
+-- تركيبات الفلاتر الشائعة
+CREATE INDEX IF NOT EXISTS idx_data_entries_employee_branch_date ON data_entries (employee_name, branch, date);
+CREATE INDEX IF NOT EXISTS idx_data_entries_branch_model_date ON data_entries (branch, model, date);
@@ -0,0 +1,272 @@
+// Admin Dashboard entries table
+// Entries are fetched in keyset pages from /api/entries and only the rows in
+// (or near) the viewport are in the DOM, so the first paint does not depend
+// on how many entries match the filters.
+
+const ENTRY_ROW_HEIGHT = 80; // must match .entries-table td height in style.css
+const OVERSCAN_ROWS = 10;
+
+let loadedEntries = [];
+let entriesTotal = null;
+let nextEntriesCursor = null;
+let hasMoreEntries = true;
+let loadingEntries = false;
+let renderedRange = null;
+
+document.addEventListener('DOMContentLoaded', function () {
+    const scroller = document.getElementById('entriesScroll');
+    if (!scroller) {
+        return;
+    }
+
+    scroller.addEventListener('scroll', onEntriesScroll, { passive: true });
+    window.addEventListener('resize', () => renderVisibleEntries(true));
+    loadNextEntriesPage();
+});
+
+function entriesPageUrl() {
+    const scroller = document.getElementById('entriesScroll');
+
+    // Same filters as the page itself (employee, branch, model, dates, search)
+    const params = new URLSearchParams(window.location.search);
+    params.set('limit', scroller.dataset.pageSize);
+    params.delete('cursor');
+    if (nextEntriesCursor) {
+        params.set('cursor', nextEntriesCursor);
+    }
+    return `${scroller.dataset.url}?${params.toString()}`;
+}
+
+function loadNextEntriesPage() {
+    if (loadingEntries || !hasMoreEntries) {
+        return;
+    }
+
+    loadingEntries = true;
+    setEntriesStatus('Loading entries...');
+
+    fetch(entriesPageUrl())
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message || 'Failed to load entries');
+            }
+
+            if (data.total !== null && data.total !== undefined) {
+                entriesTotal = data.total;
+            } else if (!nextEntriesCursor) {
+                // First page without a cheap total: count separately, after the rows are shown
+                loadEntriesTotal();
+            }
+            loadedEntries.push(...data.entries);
+            nextEntriesCursor = data.next_cursor;
+            hasMoreEntries = Boolean(data.next_cursor);
+            loadingEntries = false;
+
+            updateEntriesSummary();
+            renderVisibleEntries(true);
+
+            // Keep loading until the viewport is filled
+            loadMoreIfNearEnd();
+        })
+        .catch(error => {
+            loadingEntries = false;
+            console.error('Error loading entries:', error);
+            setEntriesStatus(`Error loading entries: ${error.message}`);
+        });
+}
+
+function loadEntriesTotal() {
+    const scroller = document.getElementById('entriesScroll');
+    const params = new URLSearchParams(window.location.search);
+    fetch(`${scroller.dataset.countUrl}?${params.toString()}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                entriesTotal = data.total;
+                updateEntriesSummary();
+            }
+        })
+        .catch(error => console.error('Error counting entries:', error));
+}
+
+function onEntriesScroll() {
+    renderVisibleEntries(false);
+    loadMoreIfNearEnd();
+}
+
+function loadMoreIfNearEnd() {
+    const scroller = document.getElementById('entriesScroll');
+    const remaining = scroller.scrollHeight - scroller.scrollTop - scroller.clientHeight;
+    if (remaining < ENTRY_ROW_HEIGHT * OVERSCAN_ROWS) {
+        loadNextEntriesPage();
+    }
+}
+
+function renderVisibleEntries(force) {
+    const scroller = document.getElementById('entriesScroll');
+    const tbody = document.getElementById('entriesBody');
+    const headerHeight = scroller.querySelector('thead').offsetHeight;
+
+    const scrolledRows = Math.floor(Math.max(0, scroller.scrollTop - headerHeight) / ENTRY_ROW_HEIGHT);
+    const viewportRows = Math.ceil(scroller.clientHeight / ENTRY_ROW_HEIGHT);
+    const first = Math.max(0, scrolledRows - OVERSCAN_ROWS);
+    const last = Math.min(loadedEntries.length, scrolledRows + viewportRows + OVERSCAN_ROWS);
+
+    if (!force && renderedRange && renderedRange[0] === first && renderedRange[1] === last) {
+        return;
+    }
+    renderedRange = [first, last];
+
+    // Spacer rows stand in for the rows above and below the rendered window
+    const fragment = document.createDocumentFragment();
+    fragment.appendChild(createSpacerRow(first * ENTRY_ROW_HEIGHT));
+    for (let i = first; i < last; i++) {
+        fragment.appendChild(createEntryRow(loadedEntries[i]));
+    }
+    fragment.appendChild(createSpacerRow((loadedEntries.length - last) * ENTRY_ROW_HEIGHT));
+    tbody.replaceChildren(fragment);
+}
+
+function createSpacerRow(height) {
+    const row = document.createElement('tr');
+    row.className = 'entries-spacer';
+    const cell = document.createElement('td');
+    cell.colSpan = 13;
+    cell.style.height = `${height}px`;
+    row.appendChild(cell);
+    return row;
+}
+
+function createCell(content) {
+    const cell = document.createElement('td');
+    const wrapper = document.createElement('div');
+    wrapper.className = 'entry-cell';
+    if (content instanceof Node) {
+        wrapper.appendChild(content);
+    } else {
+        wrapper.textContent = content;
+    }
+    cell.appendChild(wrapper);
+    return cell;
+}
+
+function createNoData(text) {
+    const span = document.createElement('span');
+    span.className = 'no-data';
+    span.textContent = text;
+    return span;
+}
+
+function createMaterialsList(materials, tagClass, emptyText) {
+    if (materials.length === 0) {
+        return createNoData(emptyText);
+    }
+
+    const list = document.createElement('div');
+    list.className = 'materials-list';
+    materials.forEach(material => {
+        const tag = document.createElement('span');
+        tag.className = `material-tag ${tagClass}`;
+        tag.textContent = material;
+        list.appendChild(tag);
+    });
+    return list;
+}
+
+function createComment(entry) {
+    const comment = entry.comment.trim();
+    if (!comment) {
+        return createNoData('No comment');
+    }
+
+    const display = document.createElement('div');
+    display.className = 'comment-display';
+
+    const preview = document.createElement('div');
+    preview.className = 'comment-preview';
+    preview.textContent = comment.length > 100 ? `${comment.slice(0, 100)}...` : comment;
+    display.appendChild(preview);
+
+    if (comment.length > 100) {
+        const button = document.createElement('button');
+        button.className = 'view-comment-btn';
+        button.textContent = 'View Full Comment';
+        button.addEventListener('click', () => showFullComment(entry.id, entry.comment));
+        display.appendChild(button);
+    }
+    return display;
+}
+
+function createImagesButton(entry) {
+    if (entry.images.length === 0) {
+        return createNoData('No images');
+    }
+
+    // Images are only requested when the modal is opened
+    const button = document.createElement('button');
+    button.className = 'view-images-btn';
+    button.innerHTML = '<span class="images-count"></span><span class="view-text">Click to View</span>';
+    button.querySelector('.images-count').textContent = `📷 ${entry.images.length} Images`;
+    button.addEventListener('click', () => openImageModal(entry.id, entry.model, entry.images));
+    return button;
+}
+
+function createEntryRow(entry) {
+    const row = document.createElement('tr');
+    row.dataset.entryId = entry.id;
+
+    row.appendChild(createCell(String(entry.id)));
+    row.appendChild(createCell(entry.employee_name));
+    row.appendChild(createCell(entry.employee_code));
+    row.appendChild(createCell(entry.branch));
+    row.appendChild(createCell(entry.shop_code || 'N/A'));
+    row.appendChild(createCell(entry.model));
+    row.appendChild(createCell(entry.display_type));
+    row.appendChild(createCell(createMaterialsList(entry.selected_materials, 'selected', 'No materials selected')));
+    row.appendChild(createCell(createMaterialsList(entry.unselected_materials, 'unselected', 'All materials selected')));
+    row.appendChild(createCell(createComment(entry)));
+    row.appendChild(createCell(createImagesButton(entry)));
+    row.appendChild(createCell(entry.date));
+
+    const deleteButton = document.createElement('button');
+    deleteButton.className = 'delete-entry-btn';
+    deleteButton.textContent = 'Delete';
+    deleteButton.addEventListener('click', () => deleteEntry(entry.id));
+    row.appendChild(createCell(deleteButton));
+
+    return row;
+}
+
+function removeEntryRow(entryId) {
+    const before = loadedEntries.length;
+    loadedEntries = loadedEntries.filter(entry => String(entry.id) !== String(entryId));
+    if (entriesTotal !== null && loadedEntries.length < before) {
+        entriesTotal -= 1;
+    }
+    updateEntriesSummary();
+    renderVisibleEntries(true);
+}
+
+function updateEntriesSummary() {
+    const totalElement = document.getElementById('totalEntries');
+    if (entriesTotal !== null) {
+        totalElement.textContent = entriesTotal;
+    }
+
+    const empty = loadedEntries.length === 0 && !hasMoreEntries;
+    document.getElementById('noEntriesMessage').style.display = empty ? 'block' : 'none';
+    document.getElementById('entriesScroll').style.display = empty ? 'none' : 'block';
+
+    if (empty) {
+        setEntriesStatus('');
+    } else if (hasMoreEntries) {
+        setEntriesStatus(`Showing ${loadedEntries.length} of ${entriesTotal} entries - scroll to load more`);
+    } else {
+        setEntriesStatus(`Showing all ${loadedEntries.length} entries`);
+    }
+}
+
+function setEntriesStatus(message) {
+    document.getElementById('entriesStatus').textContent = message;
+}
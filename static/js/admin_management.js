@@ -534,6 +534,73 @@ function closeDeleteModal() {
     deleteItemType = null;
 }
 
+function showImportCatalogModal() {
+    document.getElementById('import-catalog-file').value = '';
+    document.getElementById('import-catalog-result').innerHTML = '';
+    document.getElementById('importCatalogModal').style.display = 'block';
+}
+
+function closeImportCatalogModal() {
+    document.getElementById('importCatalogModal').style.display = 'none';
+}
+
+function importCatalogFile(dryRun) {
+    const fileInput = document.getElementById('import-catalog-file');
+    const result = document.getElementById('import-catalog-result');
+
+    if (!fileInput.files.length) {
+        alert('Please choose an XLSX or JSON file');
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('file', fileInput.files[0]);
+    formData.append('dry_run', dryRun ? 'true' : 'false');
+    formData.append('delete_missing', document.getElementById('import-catalog-delete-missing').checked ? 'true' : 'false');
+    result.textContent = dryRun ? 'Checking...' : 'Importing...';
+
+    fetch('/import_catalog', {
+        method: 'POST',
+        body: formData
+    })
+        .then(response => response.json())
+        .then(data => {
+            result.innerHTML = '';
+            const message = document.createElement('p');
+            message.textContent = data.message;
+            result.appendChild(message);
+
+            // ملخص لكل جدول + الصفوف المتغيرة أو المرفوضة
+            const list = document.createElement('ul');
+            Object.entries(data.report || {}).forEach(([entity, entityReport]) => {
+                const summary = entityReport.summary;
+                const removed = entityReport.deleted || entityReport.missing || [];
+                const item = document.createElement('li');
+                item.textContent = `${getDataTypeLabel(entity === 'materials' ? 'pop_materials' : entity)}: ` +
+                    `${summary.add} added, ${summary.rename} renamed, ${summary.keep} unchanged, ` +
+                    `${removed.length} ${entityReport.deleted ? 'deleted' : 'not in file'}`;
+                entityReport.rows.forEach(row => {
+                    if (row.action === 'add' || row.action === 'rename') return;
+                    const problem = document.createElement('div');
+                    problem.textContent = `Row ${row.row}: ${row.name} - ${row.message}`;
+                    item.appendChild(problem);
+                });
+                list.appendChild(item);
+            });
+            result.appendChild(list);
+
+            if (data.success && !data.dry_run) {
+                loadCategories();
+                refreshAllFilters();
+                reloadCurrentData(currentDataType);
+            }
+        })
+        .catch(error => {
+            console.error('Error importing catalog:', error);
+            result.textContent = 'Error importing catalog';
+        });
+}
+
 function getDataTypeLabel(dataType) {
     const labels = {
         'categories': 'Category',
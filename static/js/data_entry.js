@@ -230,6 +230,43 @@ const popMaterials = {
 
 let modelCounter = 1;
 
+// Catalog tree (categories -> models -> materials / guide image) from /api/catalog.
+// Fetched once and shared by every model block; dropdowns are filled locally.
+let catalogPromise = null;
+
+function loadCatalog() {
+    if (!catalogPromise) {
+        catalogPromise = fetch('/api/catalog')
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.message || 'Failed to load catalog');
+                }
+
+                const categories = {};
+                data.categories.forEach(category => {
+                    const modelsByName = {};
+                    category.models.forEach(model => {
+                        modelsByName[model.name] = model;
+                    });
+                    categories[category.name] = { ...category, modelsByName };
+                });
+                return { names: data.categories.map(category => category.name), categories };
+            })
+            .catch(error => {
+                // Allow a retry on the next dropdown interaction
+                catalogPromise = null;
+                throw error;
+            });
+    }
+    return catalogPromise;
+}
+
+function getCatalogModel(catalog, category, model) {
+    const entry = catalog.categories[category];
+    return entry ? entry.modelsByName[model] : undefined;
+}
+
 // Initialize data entry functionality
 document.addEventListener('DOMContentLoaded', function () {
     initializeDataEntry();
@@ -256,33 +293,30 @@ function initializeDataEntry() {
 }
 
 function loadCategories() {
-    fetch('/get_dynamic_data/categories')
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                const categorySelects = document.querySelectorAll('.category-select');
-                categorySelects.forEach(select => {
-                    // Keep the default option
-                    const defaultOption = select.querySelector('option[value=""]');
-                    select.innerHTML = '';
-                    if (defaultOption) {
-                        select.appendChild(defaultOption);
-                    } else {
-                        const option = document.createElement('option');
-                        option.value = '';
-                        option.textContent = 'Select Category';
-                        select.appendChild(option);
-                    }
+    loadCatalog()
+        .then(catalog => {
+            const categorySelects = document.querySelectorAll('.category-select');
+            categorySelects.forEach(select => {
+                // Keep the default option
+                const defaultOption = select.querySelector('option[value=""]');
+                select.innerHTML = '';
+                if (defaultOption) {
+                    select.appendChild(defaultOption);
+                } else {
+                    const option = document.createElement('option');
+                    option.value = '';
+                    option.textContent = 'Select Category';
+                    select.appendChild(option);
+                }
 
-                    // Add categories from database
-                    data.data.forEach(category => {
-                        const option = document.createElement('option');
-                        option.value = category;
-                        option.textContent = category;
-                        select.appendChild(option);
-                    });
+                // Add categories from the catalog
+                catalog.names.forEach(category => {
+                    const option = document.createElement('option');
+                    option.value = category;
+                    option.textContent = category;
+                    select.appendChild(option);
                 });
-            }
+            });
         })
         .catch(error => {
             console.error('Error loading categories:', error);
@@ -325,15 +359,15 @@ function handleCategoryChange(index, category) {
     modelSelect.disabled = true;
 
     if (category) {
-        // Fetch models from database
-        fetch(`/get_dynamic_data/models?category=${encodeURIComponent(category)}`)
-            .then(response => response.json())
-            .then(data => {
-                if (data.success && data.data.length > 0) {
-                    data.data.forEach(model => {
+        // Fill models from the catalog
+        loadCatalog()
+            .then(catalog => {
+                const entry = catalog.categories[category];
+                if (entry && entry.models.length > 0) {
+                    entry.models.forEach(model => {
                         const option = document.createElement('option');
-                        option.value = model;
-                        option.textContent = model;
+                        option.value = model.name;
+                        option.textContent = model.name;
                         modelSelect.appendChild(option);
                     });
                     modelSelect.disabled = false;
@@ -374,12 +408,12 @@ function showDisplayTypeSection(index) {
         select.innerHTML = '<option value="">Select Display Type</option>';
 
         if (selectedCategory) {
-            // Fetch display types from database
-            fetch(`/get_dynamic_data/display_types?category=${encodeURIComponent(selectedCategory)}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success && data.data.length > 0) {
-                        data.data.forEach(type => {
+            // Fill display types from the catalog
+            loadCatalog()
+                .then(catalog => {
+                    const entry = catalog.categories[selectedCategory];
+                    if (entry && entry.display_types.length > 0) {
+                        entry.display_types.forEach(type => {
                             const option = document.createElement('option');
                             option.value = type;
                             option.textContent = type;
@@ -400,6 +434,7 @@ function showPopMaterialSection(index) {
     const section = document.querySelector(`[data-index="${index}"] .pop-material-section`);
     const container = document.querySelector(`[data-index="${index}"] .checklist-container`);
     const modelSelect = document.getElementById(`model_${index}`);
+    const categorySelect = document.getElementById(`category_${index}`);
 
     if (section && container && modelSelect) {
         const selectedModel = modelSelect.value;
@@ -408,13 +443,14 @@ function showPopMaterialSection(index) {
         container.innerHTML = '';
 
         if (selectedModel) {
-            // Fetch POP materials from database by model
-            fetch(`/get_dynamic_data/pop_materials?model=${encodeURIComponent(selectedModel)}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success && data.data.length > 0) {
+            // POP materials of the model from the catalog
+            loadCatalog()
+                .then(catalog => {
+                    const model = getCatalogModel(catalog, categorySelect ? categorySelect.value : '', selectedModel);
+                    const materials = model ? model.materials : [];
+                    if (materials.length > 0) {
                         // Create checklist items
-                        data.data.forEach((material, materialIndex) => {
+                        materials.forEach((material, materialIndex) => {
                             const checkboxDiv = document.createElement('div');
                             checkboxDiv.className = 'checkbox-item';
 
@@ -1491,29 +1527,26 @@ function updateModelEntryHeaders() {
 
 // Load categories for a specific new model entry
 function loadCategoriesForNewModel(index) {
-    fetch('/get_dynamic_data/categories')
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                const categorySelect = document.getElementById(`category_${index}`);
-                if (categorySelect) {
-                    // Clear existing options
-                    categorySelect.innerHTML = '';
-
-                    // Add default option
-                    const defaultOption = document.createElement('option');
-                    defaultOption.value = '';
-                    defaultOption.textContent = 'Select Category';
-                    categorySelect.appendChild(defaultOption);
-
-                    // Add categories from database
-                    data.data.forEach(category => {
-                        const option = document.createElement('option');
-                        option.value = category;
-                        option.textContent = category;
-                        categorySelect.appendChild(option);
-                    });
-                }
+    loadCatalog()
+        .then(catalog => {
+            const categorySelect = document.getElementById(`category_${index}`);
+            if (categorySelect) {
+                // Clear existing options
+                categorySelect.innerHTML = '';
+
+                // Add default option
+                const defaultOption = document.createElement('option');
+                defaultOption.value = '';
+                defaultOption.textContent = 'Select Category';
+                categorySelect.appendChild(defaultOption);
+
+                // Add categories from the catalog
+                catalog.names.forEach(category => {
+                    const option = document.createElement('option');
+                    option.value = category;
+                    option.textContent = category;
+                    categorySelect.appendChild(option);
+                });
             }
         })
         .catch(error => {
@@ -1563,11 +1596,12 @@ function updateModelImageIcon(index, category, model, container) {
 
     if (!model) return;
 
-    // Check if model has an image
-    fetch(`/get_model_image/${encodeURIComponent(category)}/${encodeURIComponent(model)}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.success && data.image_url) {
+    // Check if model has a guide image in the catalog
+    loadCatalog()
+        .then(catalog => {
+            const catalogModel = getCatalogModel(catalog, category, model);
+            const imageUrl = catalogModel ? catalogModel.guide_image : null;
+            if (imageUrl) {
                 // Create image icon with text
                 const imageIcon = document.createElement('span');
                 imageIcon.className = 'model-image-icon';
@@ -1598,7 +1632,7 @@ function updateModelImageIcon(index, category, model, container) {
 
                 // Add click event to show popup
                 imageIcon.addEventListener('click', function () {
-                    showModelImagePopup(model, data.image_url);
+                    showModelImagePopup(model, imageUrl);
                 });
 
                 container.appendChild(imageIcon);
@@ -53,61 +53,26 @@ class ExportHandler {
         );
 
         try {
-            // Make the export request
-            const response = await fetch(url, {
-                method: 'GET',
-                headers: {
-                    'Accept': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                }
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-            }
-
-            // Check if response is actually an Excel file
-            const contentType = response.headers.get('content-type');
-            if (!contentType || !contentType.includes('spreadsheet')) {
-                // If not Excel, it might be a redirect to dashboard with error
-                const text = await response.text();
-                if (text.includes('لا توجد بيانات للتصدير')) {
-                    throw new Error('لا توجد بيانات للتصدير مع الفلاتر المحددة');
-                } else {
-                    throw new Error('فشل في إنشاء ملف Excel');
-                }
-            }
-
-            // Get the blob for download
-            const blob = await response.blob();
+            // التصدير يعمل في الخلفية على الخادم: إنشاء مهمة ثم متابعة تقدمها
+            const params = new URLSearchParams(new URL(url, window.location.origin).search);
+            params.set('type', isSimple ? 'simple' : 'enhanced');
             
-            if (blob.size === 0) {
-                throw new Error('الملف المُنشأ فارغ');
+            const response = await fetch(`/api/export_jobs?${params.toString()}`, { method: 'POST' });
+            const job = await response.json();
+            if (!response.ok || !job.success) {
+                throw new Error(job.message || `HTTP ${response.status}`);
             }
 
-            // Extract filename from response headers or create default
-            let filename = 'pop_materials_report.xlsx';
-            const contentDisposition = response.headers.get('content-disposition');
-            if (contentDisposition) {
-                const filenameMatch = contentDisposition.match(/filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/);
-                if (filenameMatch && filenameMatch[1]) {
-                    filename = filenameMatch[1].replace(/['"]/g, '');
-                }
-            } else {
-                // Create filename based on export type and timestamp
-                const timestamp = new Date().toISOString().slice(0, 19).replace(/[:-]/g, '');
-                filename = isSimple 
-                    ? `pop_materials_simple_${timestamp}.xlsx`
-                    : `pop_materials_enhanced_${timestamp}.xlsx`;
-            }
+            const status = await this.waitForJob(job.status_url, exportId);
 
-            // Download the file
-            this.downloadBlob(blob, filename);
+            // الملف جاهز على الخادم؛ المتصفح يحمله مباشرة
+            this.downloadUrl(status.download_url);
 
             // Update toast to success
             window.toastSystem.update(exportId, {
                 type: 'success',
                 title: isSimple ? 'تم إنشاء التقرير بنجاح!' : 'تم إنشاء التقرير المحسن بنجاح!',
-                message: `تم تحميل الملف: ${filename}`
+                message: `تم تحميل الملف: ${status.filename}`
             });
 
             // Auto-hide success toast after 4 seconds
@@ -132,31 +97,52 @@ class ExportHandler {
         }
     }
 
-    downloadBlob(blob, filename) {
-        try {
-            // Create download link
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = url;
-            a.download = filename;
+    async waitForJob(statusUrl, exportId) {
+        let delay = 1000;
+        
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay = Math.min(delay + 500, 3000);
             
-            // Add to DOM and trigger download
-            document.body.appendChild(a);
-            a.click();
+            const response = await fetch(statusUrl, { cache: 'no-store' });
+            const status = await response.json();
+            if (!response.ok || !status.success) {
+                throw new Error(status.message || `HTTP ${response.status}`);
+            }
             
-            // Cleanup
-            setTimeout(() => {
-                window.URL.revokeObjectURL(url);
-                if (a.parentNode) {
-                    a.parentNode.removeChild(a);
-                }
-            }, 100);
+            if (status.status === 'done') {
+                return status;
+            }
+            if (status.status === 'failed') {
+                throw new Error(status.error || 'فشل في إنشاء ملف Excel');
+            }
+            
+            window.toastSystem.update(exportId, { message: this.progressMessage(status) });
+        }
+    }
 
-        } catch (error) {
-            console.error('Download error:', error);
-            throw new Error('فشل في تحميل الملف');
+    progressMessage(status) {
+        if (status.status === 'queued' || status.rows_total === null) {
+            return 'في قائمة الانتظار...';
+        }
+        let message = `الصفوف: ${status.rows_done} / ${status.rows_total}`;
+        if (status.images_total) {
+            message += ` - الصور: ${status.images_done} / ${status.images_total}`;
         }
+        return message;
+    }
+
+    downloadUrl(url) {
+        const a = document.createElement('a');
+        a.style.display = 'none';
+        a.href = url;
+        document.body.appendChild(a);
+        a.click();
+        setTimeout(() => {
+            if (a.parentNode) {
+                a.parentNode.removeChild(a);
+            }
+        }, 100);
     }
 
     // Method to handle export with filters (for programmatic use)
@@ -819,6 +819,58 @@ function saveBranchesToUser() {
     });
 }
 
+function showImportBranchesModal() {
+    document.getElementById('import-branches-file').value = '';
+    document.getElementById('import-branches-result').innerHTML = '';
+    document.getElementById('importBranchesModal').style.display = 'block';
+}
+
+function closeImportBranchesModal() {
+    document.getElementById('importBranchesModal').style.display = 'none';
+}
+
+function importBranchesFile() {
+    const fileInput = document.getElementById('import-branches-file');
+    const result = document.getElementById('import-branches-result');
+    
+    if (!fileInput.files.length) {
+        alert('Please choose a CSV or XLSX file');
+        return;
+    }
+    
+    const formData = new FormData();
+    formData.append('file', fileInput.files[0]);
+    result.textContent = 'Importing...';
+    
+    fetch('/import_branches', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        result.innerHTML = '';
+        const message = document.createElement('p');
+        message.textContent = data.message;
+        result.appendChild(message);
+        
+        // الصفوف التي لم تضف فقط، مع السبب
+        const problems = (data.report || []).filter(row => row.status !== 'added');
+        if (problems.length > 0) {
+            const list = document.createElement('ul');
+            problems.forEach(row => {
+                const item = document.createElement('li');
+                item.textContent = `Row ${row.row}: ${row.employee_code} / ${row.branch_name} / ${row.shop_code} - ${row.message}`;
+                list.appendChild(item);
+            });
+            result.appendChild(list);
+        }
+    })
+    .catch(error => {
+        console.error('Error importing branches:', error);
+        result.textContent = 'Error importing branches';
+    });
+}
+
 // Close modals when clicking outside
 window.onclick = function(event) {
     const manageBranchesModal = document.getElementById('manageBranchesModal');
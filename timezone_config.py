@@ -0,0 +1,70 @@
+"""
+إعداد المنطقة الزمنية المحلية - مصر (القاهرة)
+
+التواريخ تخزن في قاعدة البيانات كطابع زمني UTC (ثوانٍ منذ epoch) وتعرض
+بالتوقيت المحلي، مع التعامل التلقائي مع التوقيت الشتوي والصيفي.
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+LOCAL_TIMEZONE_NAME = os.getenv('APP_TIMEZONE', 'Africa/Cairo')
+
+
+def get_timezone_from_env():
+    """Resolve LOCAL_TIMEZONE_NAME with zoneinfo, then pytz, then fixed UTC+2"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(LOCAL_TIMEZONE_NAME)
+    except ImportError:
+        # Fallback for older Python versions
+        try:
+            import pytz
+            return pytz.timezone(LOCAL_TIMEZONE_NAME)
+        except ImportError:
+            # Final fallback - Egypt winter time (UTC+2)
+            print("⚠️ Warning: Using fixed UTC+2. Install zoneinfo or pytz for automatic DST handling.")
+            return timezone(timedelta(hours=2))
+
+
+LOCAL_TIMEZONE = get_timezone_from_env()
+
+
+def _localize(naive):
+    if hasattr(LOCAL_TIMEZONE, 'localize'):  # pytz
+        return LOCAL_TIMEZONE.localize(naive)
+    return naive.replace(tzinfo=LOCAL_TIMEZONE)
+
+
+def local_string_to_epoch(value):
+    """Convert a local 'YYYY-MM-DD[ HH:MM:SS]' string to a UTC epoch (or None)"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return int(_localize(datetime.strptime(value.strip(), fmt)).timestamp())
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def local_day_bounds(date_from=None, date_to=None):
+    """Half-open UTC epoch range [start, end) covering whole local days
+
+    Either bound may be None. date_to is inclusive of the whole day, so the
+    exclusive end is local midnight of the following day.
+    """
+    start = local_string_to_epoch(date_from) if date_from else None
+    end = None
+    if date_to:
+        try:
+            next_day = datetime.strptime(date_to.strip(), '%Y-%m-%d') + timedelta(days=1)
+            end = int(_localize(next_day).timestamp())
+        except ValueError:
+            end = None
+    return start, end
+
+
+def epoch_to_local_string(epoch):
+    """Render a UTC epoch as a local 'YYYY-MM-DD HH:MM:SS' string"""
+    if epoch is None:
+        return ''
+    return datetime.fromtimestamp(epoch, LOCAL_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')